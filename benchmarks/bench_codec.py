@@ -0,0 +1,49 @@
+"""
+Compares decoding JSON with the standard library and with the codec
+backend, using the block and transaction fixtures in tests/data and a
+verbose block built from them with a configurable number of transactions.
+
+    python -m benchmarks.bench_codec [--transactions N] [--rounds N]
+
+"""
+import argparse
+import json
+import time
+
+from benchmarks.bench_deserialize import TEST_DATA_PATH, load_block
+
+from bitcoingraph import codec
+
+
+def measure(function, documents, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for document in documents:
+            function(document)
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    fixtures = [path.read_bytes() for path in sorted(TEST_DATA_PATH.glob('*.json'))]
+    verbose_block = load_block(args.transactions)[0]
+
+    def stdlib(data):
+        # as response.json() does, decoding the body to str first
+        json.loads(data.decode('utf-8'))
+
+    print('codec backend: {}'.format(codec.BACKEND))
+    for name, documents in [('fixtures', fixtures), ('block', [verbose_block])]:
+        size = sum(len(document) for document in documents)
+        for decoder, function in [('json', stdlib), (codec.BACKEND, codec.loads)]:
+            seconds = measure(function, documents, args.rounds)
+            print('{:>8} {:>7}: {:>9} bytes, {:8.2f} ms, {:6.1f} MB/s'.format(
+                name, decoder, size, seconds * 1000, size / seconds / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Compares scans of output values, block heights and timestamps over a CSV
+export with the same scans over a columnar dataset of a synthetic chain,
+and the time and bytes taken to write both.
+
+    python -m benchmarks.bench_columnar [--blocks N] [--transactions N]
+        [--chunk-rows N]
+
+"""
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+from tests.chain_generator import SyntheticChain
+from tests.rpc_mock import BitcoinProxyMock
+
+from bitcoingraph.batch import to_satoshis
+from bitcoingraph.blockchain import Blockchain
+from bitcoingraph.columnar import ColumnarDumpWriter, ColumnarReader
+from bitcoingraph.writer import BufferedCSVDumpWriter
+
+
+def measure(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def size(path):
+    return sum(os.path.getsize(os.path.join(directory, filename))
+               for directory, _, filenames in os.walk(path) for filename in filenames)
+
+
+def scan_csv(path):
+    with open(os.path.join(path, 'outputs.csv'), newline='') as f:
+        value = sum(to_satoshis(float(row[2])) for row in csv.reader(f))
+    with open(os.path.join(path, 'blocks.csv'), newline='') as f:
+        rows = [(int(row[1]), int(row[2])) for row in csv.reader(f)]
+    return value, max(row[0] for row in rows), min(row[1] for row in rows)
+
+
+def scan_columnar(path):
+    reader = ColumnarReader(path)
+    value = sum(int(chunk.sum()) for chunk in reader.chunks('outputs', 'value'))
+    height = max(int(chunk.max()) for chunk in reader.chunks('blocks', 'height'))
+    timestamp = min(int(chunk.min()) for chunk in reader.chunks('blocks', 'timestamp'))
+    return value, height, timestamp
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--blocks', type=int, default=1000)
+    parser.add_argument('--transactions', type=int, default=50,
+                        help='average number of transactions per block')
+    parser.add_argument('--chunk-rows', type=int, default=1 << 20)
+    args = parser.parse_args()
+
+    chain = SyntheticChain(args.blocks, args.transactions)
+    blockchain = Blockchain(BitcoinProxyMock(chain=chain, verbosity=2))
+    blocks = list(blockchain.get_blocks_in_range(0, len(chain) - 1))
+    for block in blocks:
+        for tx in block.transactions:
+            tx.inputs, tx.outputs
+
+    def write(writer):
+        with writer:
+            for block in blocks:
+                writer.write(block)
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, 'csv')
+        columnar_path = os.path.join(directory, 'columnar')
+        results = []
+        seconds, _ = measure(lambda: write(BufferedCSVDumpWriter(csv_path)))
+        scan_seconds, csv_result = measure(lambda: scan_csv(csv_path))
+        results.append(('csv', seconds, size(csv_path), scan_seconds))
+        seconds, _ = measure(lambda: write(ColumnarDumpWriter(columnar_path, args.chunk_rows)))
+        scan_seconds, columnar_result = measure(lambda: scan_columnar(columnar_path))
+        results.append(('columnar', seconds, size(columnar_path), scan_seconds))
+        assert csv_result == columnar_result
+
+    print('{:>10} {:>9} {:>9} {:>9}'.format('format', 'write s', 'MB', 'scan s'))
+    for name, seconds, bytes_written, scan_seconds in results:
+        print('{:>10} {:9.3f} {:9.1f} {:9.4f}'.format(name, seconds, bytes_written / 1e6,
+                                                    scan_seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Compares decoding blocks from REST JSON with parsing their binary
+serialization, using block 100000 from the test data repeated to a
+configurable number of transactions.
+
+    python -m benchmarks.bench_deserialize [--transactions N] [--rounds N]
+
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from tests.block_builder import serialize_block
+
+from bitcoingraph.model import Block
+from bitcoingraph.serialization import parse_block
+
+TEST_DATA_PATH = Path(__file__).parent.parent / 'tests' / 'data'
+
+
+def load_block(transactions):
+    with (TEST_DATA_PATH / 'block_100000.json').open() as f:
+        raw_block = json.load(f)
+    txs = {}
+    for tx_id in raw_block['tx']:
+        with (TEST_DATA_PATH / 'tx_{}.json'.format(tx_id)).open() as f:
+            txs[tx_id] = json.load(f)
+    raw_block['tx'] = (raw_block['tx'] * (transactions // len(raw_block['tx']) + 1))[:transactions]
+    json_block = dict(raw_block)
+    json_block['tx'] = [txs[tx_id] for tx_id in raw_block['tx']]
+    return json.dumps(json_block).encode(), serialize_block(raw_block, txs), raw_block
+
+
+def measure(function, data, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function(data)
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    json_data, binary_data, raw_block = load_block(args.transactions)
+
+    def from_json(data):
+        Block(None, json_data=json.loads(data))
+
+    def from_binary(data):
+        block = parse_block(data)
+        block['height'] = raw_block['height']
+        Block(None, json_data=block)
+
+    print('transactions per block: {}'.format(args.transactions))
+    for name, function, data in [('json', from_json, json_data),
+                                 ('binary', from_binary, binary_data)]:
+        seconds = measure(function, data, args.rounds)
+        print('{:>6}: {:>9} bytes, {:8.2f} ms/block, {:8.0f} tx/s, {:6.1f} MB/s'.format(
+            name, len(data), seconds * 1000, args.transactions / seconds,
+            len(data) / seconds / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Measures the memory taken by the model objects of a large block, decoded
+from verbose getblock JSON with synthetic transactions.
+
+    python -m benchmarks.bench_model_memory [--transactions N] [--outputs N]
+
+The peak resident set size is that of the whole process, so the
+benchmark should be run in a fresh interpreter for each configuration.
+
+"""
+import argparse
+import gc
+import hashlib
+import json
+import resource
+import time
+import tracemalloc
+
+from bitcoingraph.model import Block
+
+SCRIPT_SIG = ('47304402' + '11' * 64 + '01' + '41' + '04' + '22' * 64)
+TYPES = ['pubkeyhash', 'scripthash', 'witness_v0_keyhash']
+
+
+def txid(n):
+    return hashlib.sha256(n.to_bytes(8, 'little')).hexdigest()
+
+
+def build_block_json(transactions, outputs):
+    txs = []
+    for n in range(transactions):
+        vin = [{'coinbase': '04ffff001d0104', 'sequence': 4294967295}] if n == 0 else \
+            [{'txid': txid(n + 1000000), 'vout': 0,
+              'scriptSig': {'asm': SCRIPT_SIG, 'hex': SCRIPT_SIG},
+              'txinwitness': ['30' * 36, '02' * 33], 'sequence': 4294967295}]
+        vout = [{'value': 0.001 * (i + 1), 'n': i,
+                 'scriptPubKey': {'asm': 'OP_DUP OP_HASH160 ' + '33' * 20,
+                                  'hex': '76a914' + '33' * 20 + '88ac',
+                                  'type': TYPES[i % len(TYPES)],
+                                  'addresses': ['1' + txid(n * outputs + i)[:33]]}}
+                for i in range(outputs)]
+        txs.append({'txid': txid(n), 'hash': txid(n), 'size': 250, 'vin': vin, 'vout': vout})
+    return json.dumps({'hash': '00' * 32, 'height': 100000, 'time': 1293623863,
+                       'difficulty': 14484.1623612254, 'tx': txs}).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, default=5000)
+    parser.add_argument('--outputs', type=int, default=3)
+    args = parser.parse_args()
+
+    data = build_block_json(args.transactions, args.outputs)
+    gc.collect()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    start = time.perf_counter()
+    block = Block(None, json_data=json.loads(data))
+    seconds = time.perf_counter() - start
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print('transactions: {}, outputs: {}'.format(
+        len(block.transactions), sum(len(tx.outputs) for tx in block.transactions)))
+    print('build time:   {:8.1f} ms'.format(seconds * 1000))
+    print('retained:     {:8.1f} MB'.format(retained / 1e6))
+    print('traced peak:  {:8.1f} MB'.format(peak / 1e6))
+    print('peak RSS:     {:8.1f} MB (+{:.1f} MB while building)'.format(
+        rss_after / 1e3, (rss_after - rss_before) / 1e3))
+
+
+if __name__ == '__main__':
+    main()
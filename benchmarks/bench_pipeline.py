@@ -0,0 +1,122 @@
+"""
+Measures the throughput of the export pipeline on a synthetic block
+chain: building the model objects, CSVDumpWriter.write, BitcoinGraph.export
+against a local bitcoind stand-in, and the two steps of entity
+computation. Results are printed and saved as JSON, so that they can be
+compared across commits.
+
+    python -m benchmarks.bench_pipeline [--blocks N] [--transactions N]
+        [--max-inputs N] [--max-outputs N] [--address-reuse P] [--seed N]
+        [--output FILE]
+
+"""
+import argparse
+import json
+import platform
+import subprocess
+import tempfile
+import time
+
+from tests.bitcoind_server import BitcoindServer
+from tests.chain_generator import SyntheticChain
+from tests.rpc_mock import BitcoinProxyMock
+
+from bitcoingraph import entities
+from bitcoingraph.bitcoingraph import BitcoinGraph
+from bitcoingraph.blockchain import Blockchain
+from bitcoingraph.helper import sort
+from bitcoingraph.writer import CSVDumpWriter
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--blocks', type=int, default=2000)
+    parser.add_argument('--transactions', type=int, default=20,
+                        help='average number of transactions per block')
+    parser.add_argument('--max-inputs', type=int, default=3)
+    parser.add_argument('--max-outputs', type=int, default=3)
+    parser.add_argument('--address-reuse', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default='bench_pipeline.json',
+                        help='file the results are saved to')
+    args = parser.parse_args()
+
+    seconds, chain = measure(lambda: SyntheticChain(
+        args.blocks, args.transactions, args.max_inputs, args.max_outputs,
+        args.address_reuse, seed=args.seed))
+    blocks, transactions = len(chain), chain.transaction_count
+    print('generated {} blocks with {} transactions in {:.1f} s'.format(
+        blocks, transactions, seconds))
+
+    def build_model():
+        model_blocks = []
+        for block in blockchain.get_blocks_in_range(0, blocks - 1):
+            for tx in block.transactions:
+                for output in tx.outputs:
+                    output.addresses
+                tx.inputs
+            model_blocks.append(block)
+        return model_blocks
+
+    timings = {}
+    blockchain = Blockchain(BitcoinProxyMock(chain=chain, verbosity=2))
+    timings['model'], model_blocks = measure(build_model)
+
+    with tempfile.TemporaryDirectory() as directory:
+        def write():
+            with CSVDumpWriter(directory + '/writer') as writer:
+                for block in model_blocks:
+                    writer.write(block)
+        timings['writer'], _ = measure(write)
+
+        export_path = directory + '/export'
+        with BitcoindServer(BitcoinProxyMock(chain=chain)) as server:
+            bcgraph = BitcoinGraph(blockchain={'host': '127.0.0.1', 'port': server.port,
+                                               'method': 'REST'})
+            timings['export'], _ = measure(
+                lambda: bcgraph.export(0, blocks - 1, export_path))
+
+        # the sorts preceding each step, as in bitcoingraph.compute_entities
+        sort(export_path, 'rel_output_address.csv')
+        sort(export_path, 'rel_input.csv', key=2)
+        timings['input_addresses'], _ = measure(
+            lambda: entities.calculate_input_addresses(export_path))
+        sort(export_path, 'input_addresses.csv')
+        timings['entities'], _ = measure(lambda: entities.compute_entities(export_path))
+
+    results = {}
+    print('{:>16} {:>9} {:>10} {:>10}'.format('stage', 'seconds', 'blocks/s', 'tx/s'))
+    for stage, seconds in timings.items():
+        results[stage] = {'seconds': seconds,
+                          'blocks_per_second': blocks / seconds,
+                          'transactions_per_second': transactions / seconds}
+        print('{:>16} {:9.2f} {:10.1f} {:10.1f}'.format(
+            stage, seconds, blocks / seconds, transactions / seconds))
+
+    with open(args.output, 'w') as f:
+        json.dump({'commit': commit(),
+                   'python': platform.python_version(),
+                   'parameters': vars(args),
+                   'blocks': blocks,
+                   'transactions': transactions,
+                   'results': results}, f, indent=2)
+    print('results saved to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Compares extsort.sort_file with GNU sort (LC_ALL=C) on the files of a
+synthetic CSV dump, checking that both write the same bytes. The memory
+budget of sort_file is also the buffer size passed to sort, so that
+small budgets compare external sorts with runs on disk.
+
+    python -m benchmarks.bench_sort [--blocks N] [--transactions N]
+        [--memory BYTES] [--workers N]
+
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from tests.chain_generator import SyntheticChain
+from tests.rpc_mock import BitcoinProxyMock
+
+from bitcoingraph.blockchain import Blockchain
+from bitcoingraph.extsort import sort_file
+from bitcoingraph.writer import BufferedCSVDumpWriter
+
+# files sorted by an export and by compute_entities, with their options
+FILES = [('addresses.csv', {'unique': True}, ['-u']),
+         ('outputs.csv', {'unique': True}, ['-u']),
+         ('rel_output_address.csv', {}, []),
+         ('rel_input.csv', {'key': 2}, ['-k', '2', '-t', ','])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--blocks', type=int, default=1000)
+    parser.add_argument('--transactions', type=int, default=50,
+                        help='average number of transactions per block')
+    parser.add_argument('--memory', type=int, default=1 << 30,
+                        help='bytes of memory used for sorting')
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    chain = SyntheticChain(args.blocks, args.transactions)
+    blockchain = Blockchain(BitcoinProxyMock(chain=chain, verbosity=2))
+    command = 'gsort' if sys.platform == 'darwin' else 'sort'
+    with tempfile.TemporaryDirectory() as directory:
+        dump_path = os.path.join(directory, 'dump')
+        with BufferedCSVDumpWriter(dump_path) as writer:
+            for block in blockchain.get_blocks_in_range(0, len(chain) - 1):
+                writer.write(block)
+
+        print('{:>24} {:>9} {:>9} {:>9}'.format('file', 'MB', 'sort s', 'extsort s'))
+        for filename, options, arguments in FILES:
+            path = os.path.join(dump_path, filename)
+            gnu_path = os.path.join(directory, 'gnu')
+            own_path = os.path.join(directory, 'own')
+            start = time.perf_counter()
+            subprocess.run([command, '-S', '{}b'.format(args.memory),
+                            '--parallel={}'.format(args.workers), '-T', directory] +
+                           arguments + [path, '-o', gnu_path],
+                           env=dict(os.environ, LC_ALL='C'), check=True)
+            gnu_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            sort_file(path, own_path, memory=args.memory, temp_dir=directory,
+                      workers=args.workers, **options)
+            own_seconds = time.perf_counter() - start
+            with open(gnu_path, 'rb') as gnu_file, open(own_path, 'rb') as own_file:
+                if gnu_file.read() != own_file.read():
+                    raise AssertionError('different order of {}'.format(filename))
+            print('{:>24} {:9.1f} {:9.3f} {:9.3f}'.format(
+                filename, os.path.getsize(path) / 1e6, gnu_seconds, own_seconds))
+            os.remove(gnu_path)
+            os.remove(own_path)
+        shutil.rmtree(dump_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Measures the transport layer against the local bitcoind stand-in serving
+a synthetic block chain: blocks/s fetched over JSON-RPC, REST and binary
+REST with increasing numbers of workers, and tx/s of chunked
+getrawtransaction batches. Latency, bandwidth, work queue depth and
+connection drops of the stand-in are configurable, so that pooling,
+concurrency and retries can be compared under the conditions of a remote
+or busy node.
+
+    python -m benchmarks.bench_transport [--blocks N] [--latency S]
+        [--bandwidth B] [--work-queue N] [--drop-rate P] [--workers N ...]
+        [--output FILE]
+
+"""
+import argparse
+import json
+import time
+
+from tests.bitcoind_server import BitcoindServer
+from tests.chain_generator import SyntheticChain
+from tests.rpc_mock import BitcoinProxyMock
+
+from bitcoingraph.bitcoind import BitcoinProxy
+from bitcoingraph.blockchain import Blockchain
+from bitcoingraph.stats import Stats
+
+TRANSPORTS = [('rpc', {'method': 'RPC'}),
+              ('rest', {'method': 'REST'}),
+              ('rest-binary', {'method': 'REST', 'binary': True})]
+
+
+def totals(stats):
+    snapshot = stats.snapshot()
+    methods = [method for interface in snapshot.values() for method in interface.values()]
+    return {key: sum(method[key] for method in methods)
+            for key in ['calls', 'retries', 'errors', 'response_bytes']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--blocks', type=int, default=500)
+    parser.add_argument('--transactions', type=int, default=20,
+                        help='average number of transactions per block')
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='seconds each request is delayed')
+    parser.add_argument('--bandwidth', type=int,
+                        help='bytes per second sent by the server')
+    parser.add_argument('--work-queue', type=int,
+                        help='requests processed at the same time before rejecting')
+    parser.add_argument('--drop-rate', type=float, default=0.0,
+                        help='probability of dropping a connection')
+    parser.add_argument('--retry-delay', type=float, default=0.01)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--chunk-size', type=int, default=100,
+                        help='transactions per getrawtransaction batch')
+    parser.add_argument('--output', type=str,
+                        help='file the results are saved to as JSON')
+    args = parser.parse_args()
+
+    chain = SyntheticChain(args.blocks, args.transactions)
+    tx_ids = list(chain.txs)
+    results = []
+    print('{:>12} {:>7} {:>9} {:>10} {:>8} {:>10}'.format(
+        'transport', 'workers', 'items/s', 'requests', 'retries', 'MB'))
+    with BitcoindServer(BitcoinProxyMock(chain=chain), latency=args.latency,
+                        bandwidth=args.bandwidth, work_queue=args.work_queue,
+                        drop_rate=args.drop_rate) as server:
+        def proxy(stats, workers, **options):
+            return BitcoinProxy('127.0.0.1', server.port, pool_size=workers, stats=stats,
+                                retry_delay=args.retry_delay, **options)
+
+        def run(name, workers, function, items):
+            stats = Stats()
+            start = time.perf_counter()
+            function(stats)
+            seconds = time.perf_counter() - start
+            result = dict(totals(stats), transport=name, workers=workers, seconds=seconds,
+                          items_per_second=items / seconds)
+            results.append(result)
+            print('{:>12} {:7} {:9.1f} {:10} {:8} {:10.1f}'.format(
+                name, workers, result['items_per_second'], result['calls'],
+                result['retries'], result['response_bytes'] / 1e6))
+
+        for workers in args.workers:
+            for name, options in TRANSPORTS:
+                def fetch_blocks(stats):
+                    blockchain = Blockchain(proxy(stats, workers, **options))
+                    for _ in blockchain.prefetch_blocks_in_range(
+                            0, args.blocks - 1, 4 * workers, workers):
+                        pass
+                run(name, workers, fetch_blocks, args.blocks)
+
+            def fetch_transactions(stats):
+                proxy(stats, workers, verbosity=1).getrawtransactions(
+                    tx_ids, chunk_size=args.chunk_size, workers=workers)
+            run('rpc-tx', workers, fetch_transactions, len(tx_ids))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'parameters': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
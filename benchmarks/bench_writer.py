@@ -0,0 +1,75 @@
+"""
+Compares the rows/s written by CSVDumpWriter and BufferedCSVDumpWriter,
+with and without background thread and gzip compression, for blocks of a
+synthetic chain, and the number of bytes written.
+
+    python -m benchmarks.bench_writer [--blocks N] [--transactions N]
+        [--rounds N]
+
+"""
+import argparse
+import gzip
+import os
+import tempfile
+import time
+
+from tests.chain_generator import SyntheticChain
+from tests.rpc_mock import BitcoinProxyMock
+
+from bitcoingraph.blockchain import Blockchain
+from bitcoingraph.writer import BufferedCSVDumpWriter, CSVDumpWriter
+
+WRITERS = [('CSVDumpWriter', CSVDumpWriter, {}),
+           ('BufferedCSVDumpWriter', BufferedCSVDumpWriter, {}),
+           ('BufferedCSVDumpWriter+thread', BufferedCSVDumpWriter, {'background': True}),
+           ('BufferedCSVDumpWriter+gzip1', BufferedCSVDumpWriter,
+            {'background': True, 'compression_level': 1}),
+           ('BufferedCSVDumpWriter+gzip6', BufferedCSVDumpWriter,
+            {'background': True, 'compression_level': 6})]
+
+
+def count_rows(path):
+    rows = 0
+    size = 0
+    for filename in os.listdir(path):
+        size += os.path.getsize(os.path.join(path, filename))
+        if not filename.endswith('_header.csv'):
+            with (gzip.open if filename.endswith('.gz') else open)(
+                    os.path.join(path, filename), 'rb') as f:
+                rows += sum(1 for _ in f)
+    return rows, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--blocks', type=int, default=1000)
+    parser.add_argument('--transactions', type=int, default=50,
+                        help='average number of transactions per block')
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    chain = SyntheticChain(args.blocks, args.transactions)
+    blockchain = Blockchain(BitcoinProxyMock(chain=chain, verbosity=2))
+    blocks = list(blockchain.get_blocks_in_range(0, len(chain) - 1))
+    for block in blocks:
+        for tx in block.transactions:
+            tx.inputs, tx.outputs
+
+    for name, writer_class, options in WRITERS:
+        best = None
+        for _ in range(args.rounds):
+            with tempfile.TemporaryDirectory() as directory:
+                start = time.perf_counter()
+                with writer_class(directory, **options) as writer:
+                    for block in blocks:
+                        writer.write(block)
+                seconds = time.perf_counter() - start
+                rows, size = count_rows(directory)
+            best = seconds if best is None else min(best, seconds)
+        print('{:>30}: {} rows, {:7.3f} s, {:10.0f} rows/s, {:8.1f} MB'.format(
+            name, rows, best, rows / best, size / 1e6))
+
+
+if __name__ == '__main__':
+    main()
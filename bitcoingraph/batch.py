@@ -0,0 +1,229 @@
+"""
+batch
+
+Columnar representation of a range of blocks backed by NumPy arrays,
+for analyses over many blocks without building model objects per output.
+
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__author__ = 'Bernhard Haslhofer (bernhard.haslhofer@ait.ac.at)'
+__copyright__ = 'Copyright 2015, Bernhard Haslhofer'
+__license__ = "MIT"
+
+
+SATOSHIS_PER_BTC = 100000000
+
+
+def to_satoshis(value):
+    return int(round(value * SATOSHIS_PER_BTC))
+
+
+class BlockBatch:
+    """
+    Blocks, transactions, inputs and outputs of a range of blocks stored
+    in columnar arrays.
+
+    Blocks are rows of heights, timestamps and block_hashes. The
+    transactions of block i are the rows tx_offsets[i] to
+    tx_offsets[i + 1] of txids, which holds 32 byte rows. Likewise, the
+    outputs of transaction j are the rows output_offsets[j] to
+    output_offsets[j + 1] of output_values (in satoshis), output_types
+    (codes into type_names) and output_address_ids (indices into
+    addresses, -1 if an output has no address), and its inputs the rows
+    input_offsets[j] to input_offsets[j + 1] of input_txids and
+    input_vouts (-1 for coinbase inputs). Outputs with several addresses
+    are represented by their first address, as in
+    Transaction.aggregated_outputs.
+
+    If inputs are resolved, input_values and input_address_ids hold the
+    value and address of the spent outputs, otherwise they are None.
+    """
+
+    def __init__(self, heights, timestamps, block_hashes, tx_offsets, txids,
+                 output_offsets, output_values, output_types, output_address_ids,
+                 input_offsets, input_txids, input_vouts, type_names, addresses,
+                 input_values=None, input_address_ids=None):
+        if np is None:
+            raise ImportError('BlockBatch requires numpy')
+        self.heights = heights
+        self.timestamps = timestamps
+        self.block_hashes = block_hashes
+        self.tx_offsets = tx_offsets
+        self.txids = txids
+        self.output_offsets = output_offsets
+        self.output_values = output_values
+        self.output_types = output_types
+        self.output_address_ids = output_address_ids
+        self.input_offsets = input_offsets
+        self.input_txids = input_txids
+        self.input_vouts = input_vouts
+        self.type_names = type_names
+        self.addresses = addresses
+        self.input_values = input_values
+        self.input_address_ids = input_address_ids
+
+    @classmethod
+    def from_blocks(cls, blocks, resolve_inputs=True):
+        """
+        Creates a batch from blocks.
+
+        Outputs spent by inputs are looked up in the batch first and are
+        otherwise resolved through the inputs, i.e. through the block
+        chain of the blocks.
+
+        :param blocks: iterable of blocks
+        :param bool resolve_inputs: resolve values and addresses of the
+            outputs spent by inputs
+        :return: block batch
+        :rtype: BlockBatch
+        """
+        if np is None:
+            raise ImportError('BlockBatch requires numpy')
+        heights, timestamps, block_hashes, tx_offsets = [], [], [], [0]
+        txids, output_offsets, input_offsets = [], [0], [0]
+        output_values, output_types, output_address_ids = [], [], []
+        input_txids, input_vouts, input_values, input_address_ids = [], [], [], []
+        type_codes, address_ids = {}, {}
+        # txid -> first output row, for inputs spending outputs of the batch
+        output_rows = {}
+        unresolved = []
+
+        for block in blocks:
+            heights.append(block.height)
+            timestamps.append(block.timestamp)
+            block_hashes.append(block.hash)
+            for tx in block.transactions:
+                output_rows[tx.txid] = len(output_values)
+                txids.append(bytes.fromhex(tx.txid))
+                for output in tx.outputs:
+                    output_values.append(to_satoshis(output.value))
+                    output_types.append(type_codes.setdefault(output.type, len(type_codes)))
+                    output_address_ids.append(
+                        address_ids.setdefault(output.addresses[0], len(address_ids))
+                        if output.addresses else -1)
+                for input in tx.inputs:
+                    if input.is_coinbase:
+                        input_txids.append(bytes(32))
+                        input_vouts.append(-1)
+                        input_values.append(0)
+                        input_address_ids.append(-1)
+                        continue
+                    input_txids.append(bytes.fromhex(input.txid))
+                    input_vouts.append(input.vout)
+                    row = output_rows.get(input.txid)
+                    if row is not None:
+                        input_values.append(output_values[row + input.vout])
+                        input_address_ids.append(output_address_ids[row + input.vout])
+                    else:
+                        unresolved.append((len(input_values), input))
+                        input_values.append(0)
+                        input_address_ids.append(-1)
+                output_offsets.append(len(output_values))
+                input_offsets.append(len(input_txids))
+            tx_offsets.append(len(txids))
+
+        if resolve_inputs:
+            for row, input in unresolved:
+                output = input.output
+                input_values[row] = to_satoshis(output.value)
+                input_address_ids[row] = address_ids.setdefault(
+                    output.addresses[0], len(address_ids)) if output.addresses else -1
+
+        return cls(np.array(heights, dtype=np.int64),
+                   np.array(timestamps, dtype=np.int64),
+                   block_hashes,
+                   np.array(tx_offsets, dtype=np.int64),
+                   cls._hashes(txids),
+                   np.array(output_offsets, dtype=np.int64),
+                   np.array(output_values, dtype=np.int64),
+                   np.array(output_types, dtype=np.int16),
+                   np.array(output_address_ids, dtype=np.int64),
+                   np.array(input_offsets, dtype=np.int64),
+                   cls._hashes(input_txids),
+                   np.array(input_vouts, dtype=np.int64),
+                   list(type_codes),
+                   list(address_ids),
+                   np.array(input_values, dtype=np.int64) if resolve_inputs else None,
+                   np.array(input_address_ids, dtype=np.int64) if resolve_inputs else None)
+
+    @staticmethod
+    def _hashes(hashes):
+        return np.frombuffer(b''.join(hashes), dtype=np.uint8).reshape(-1, 32)
+
+    def __len__(self):
+        return len(self.heights)
+
+    @property
+    def transaction_count(self):
+        return len(self.txids)
+
+    def transaction_heights(self):
+        """
+        Returns the block height of each transaction.
+
+        :rtype: numpy.ndarray
+        """
+        return np.repeat(self.heights, np.diff(self.tx_offsets))
+
+    def txid(self, tx_index):
+        """
+        Returns the id of a transaction as hex string.
+
+        :param int tx_index: row of the transaction
+        :rtype: str
+        """
+        return self.txids[tx_index].tobytes().hex()
+
+    @staticmethod
+    def _segment_sums(values, offsets):
+        cumulative = np.concatenate(([0], np.cumsum(values, dtype=np.int64)))
+        return cumulative[offsets[1:]] - cumulative[offsets[:-1]]
+
+    def output_sums(self):
+        """
+        Returns the sum of the output values of each transaction, as
+        Transaction.output_sum does for one transaction.
+
+        :return: sums in satoshis
+        :rtype: numpy.ndarray
+        """
+        return self._segment_sums(self.output_values, self.output_offsets)
+
+    def input_sums(self):
+        """
+        Returns the sum of the values spent by the inputs of each
+        transaction, as Transaction.input_sum does for one transaction.
+        Sums of coinbase transactions are 0.
+
+        :return: sums in satoshis
+        :rtype: numpy.ndarray
+        :raises ValueError: if inputs have not been resolved
+        """
+        if self.input_values is None:
+            raise ValueError('Inputs of the batch have not been resolved')
+        return self._segment_sums(self.input_values, self.input_offsets)
+
+    def aggregated_outputs(self):
+        """
+        Returns the output values of each transaction summed up per
+        address, as Transaction.aggregated_outputs does for one
+        transaction. Outputs without addresses are skipped.
+
+        :return: arrays of transaction rows, address ids and values in
+            satoshis, ordered by transaction and address id
+        :rtype: tuple
+        """
+        tx_rows = np.repeat(np.arange(self.transaction_count, dtype=np.int64),
+                            np.diff(self.output_offsets))
+        mask = self.output_address_ids >= 0
+        width = max(len(self.addresses), 1)
+        keys = tx_rows[mask] * width + self.output_address_ids[mask]
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        values = np.zeros(len(unique_keys), dtype=np.int64)
+        np.add.at(values, inverse, self.output_values[mask])
+        return unique_keys // width, unique_keys % width, values
@@ -2,13 +2,20 @@
 Bitcoin Core JSON-RPC interface.
 
 """
+import asyncio
+import functools
 import logging
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
-import json
 
 import time
 
+from bitcoingraph import codec
+from bitcoingraph.stats import GLOBAL_STATS
+from bitcoingraph.serialization import ADDRESS_FORMATS, DeserializationException, parse_block
+
 
 __author__ = 'Bernhard Haslhofer (bernhard.haslhofer@ait.ac.at)'
 __copyright__ = 'Copyright 2015, Bernhard Haslhofer'
@@ -22,22 +29,49 @@ class BitcoindException(Exception):
     pass
 
 
+# Default number of keep-alive connections per interface
+DEFAULT_POOL_SIZE = 10
+
+# Number of attempts of a request that fails to connect or is rejected
+# because the node's work queue is full
+DEFAULT_RETRIES = 5
+
+# Seconds waited before a failed request is repeated
+DEFAULT_RETRY_DELAY = 10
+
+
+def _create_session(pool_size):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
 class JSONRPCInterface:
     """
     A generic JSON-RPC interface with keep-alive session reuse.
     """
 
-    def __init__(self, url):
+    def __init__(self, url, pool_size=DEFAULT_POOL_SIZE, stats=None, retries=DEFAULT_RETRIES,
+                 retry_delay=DEFAULT_RETRY_DELAY):
         """
         Creates a generic JSON-RPC interface object.
 
         :param str url: URL of JSON-RPC endpoint
+        :param int pool_size: number of keep-alive connections kept open
+        :param Stats stats: request statistics (None = GLOBAL_STATS)
+        :param int retries: number of attempts of a request
+        :param float retry_delay: seconds waited before a request is repeated
         :return: JSON-RPC proxy object
         :rtype: JSONRPCInterface
         """
-        self._session = requests.Session()
+        self._session = _create_session(pool_size)
         self._url = url
         self._headers = {'content-type': 'application/json'}
+        self.stats = GLOBAL_STATS if stats is None else stats
+        self.retries = retries
+        self.retry_delay = retry_delay
 
     def call(self, rpcMethod, *params):
         """
@@ -65,33 +99,52 @@ class JSONRPCInterface:
         return responseJSON
 
     def _execute(self, request):
-        payload = json.dumps(request)
+        payload = codec.dumps(request)
+        if isinstance(request, list):
+            method = 'batch:' + (request[0]['method'] if request else '')
+        else:
+            method = request['method']
 
-        tries = 5
+        tries = self.retries
         hadConnectionFailures = False
         while True:
+            start = time.perf_counter()
             try:
                 response = self._session.post(self._url, headers=self._headers,
                                               data=payload)
             except requests.exceptions.ConnectionError as e:
+                self.stats.record('rpc', method, time.perf_counter() - start,
+                                  len(payload), error=True)
                 print(self._url)
                 print(e)
-                tries -= 1
-                if tries == 0:
-                    raise BitcoindException('Failed to connect for RPC call.')
-                hadConnectionFailures = True
-                print("Couldn't connect for remote procedure call.",
-                      "will sleep for ten seconds and then try again...")
-                time.sleep(10)
+                reason = "Couldn't connect for remote procedure call."
             else:
-                if hadConnectionFailures:
-                    print("Connected for RPC call after retry.")
-                break
+                if response.status_code != 503:
+                    if hadConnectionFailures:
+                        print("Connected for RPC call after retry.")
+                    break
+                # the node's work queue is full (rpcworkqueue)
+                self.stats.record('rpc', method, time.perf_counter() - start,
+                                  len(payload), len(response.content), error=True)
+                reason = "RPC work queue of node is full."
+            tries -= 1
+            if tries == 0:
+                raise BitcoindException('RPC call failed after retries: ' + reason)
+            self.stats.record_retry('rpc', method)
+            hadConnectionFailures = True
+            print(reason, "will sleep for {} seconds and then try again...".format(
+                self.retry_delay))
+            time.sleep(self.retry_delay)
+        failed = response.status_code not in (200, 500)
+        responseJSON = None if failed else codec.loads(response.content)
+        if not failed and not isinstance(responseJSON, list):
+            failed = responseJSON.get('error') is not None
+        self.stats.record('rpc', method, time.perf_counter() - start, len(payload),
+                          len(response.content), error=failed)
         if response.status_code not in (200, 500):
             raise BitcoindException("RPC connection failure: " +
                                     str(response.status_code) + ' ' +
                                     response.reason + ' ' + response.text)
-        responseJSON = response.json()
         if 'error' in responseJSON and responseJSON['error'] is not None:
             raise BitcoindException('Error in RPC call: ' +
                                     str(responseJSON['error']))
@@ -100,15 +153,83 @@ class JSONRPCInterface:
 
 class RESTInterface:
 
-    def __init__(self, url):
-        self._session = requests.Session()
+    def __init__(self, url, pool_size=DEFAULT_POOL_SIZE, stats=None, retries=DEFAULT_RETRIES,
+                 retry_delay=DEFAULT_RETRY_DELAY):
+        self._session = _create_session(pool_size)
         self._url = url
+        self.stats = GLOBAL_STATS if stats is None else stats
+        self.retries = retries
+        self.retry_delay = retry_delay
 
     def get_block(self, hash):
-        r = self._session.get(self._url + 'block/{}.json'.format(hash))
+        return self._get('block/{}.json'.format(hash))
+
+    def get_block_bin(self, hash):
+        return self._get_raw('block/{}.bin'.format(hash))
+
+    def get_headers(self, count, hash):
+        return self._get('headers/{}/{}.json'.format(count, hash))
+
+    def _get(self, path):
+        return codec.loads(self._get_response(path).content)
+
+    def _get_raw(self, path):
+        return self._get_response(path).content
+
+    @staticmethod
+    def _method(path):
+        # e.g. block/<hash>.json -> block.json, headers/<count>/<hash>.json -> headers.json
+        resource, _, rest = path.partition('/')
+        return resource + rest[rest.rfind('.'):] if '.' in rest else resource
+
+    def _get_response(self, path):
+        method = self._method(path)
+        tries = self.retries
+        while True:
+            start = time.perf_counter()
+            try:
+                r = self._session.get(self._url + path)
+            except requests.exceptions.ConnectionError:
+                self.stats.record('rest', method, time.perf_counter() - start, error=True)
+                reason = "Couldn't connect for REST request."
+            else:
+                self.stats.record('rest', method, time.perf_counter() - start,
+                                  response_bytes=len(r.content), error=r.status_code != 200)
+                if r.status_code != 503:
+                    break
+                # the node's work queue is full (rpcworkqueue)
+                reason = "REST work queue of node is full."
+            tries -= 1
+            if tries == 0:
+                raise BitcoindException(
+                    'REST request failed after retries: {} {}'.format(reason, path))
+            self.stats.record_retry('rest', method)
+            time.sleep(self.retry_delay)
         if r.status_code != 200:
-            raise Exception('REST request was not successful')
-        return r.json()
+            raise BitcoindException('REST request was not successful: {} {}'.format(
+                r.status_code, path))
+        return r
+
+
+# Minimum Bitcoin Core version (as reported by getnetworkinfo) that
+# returns decoded transactions inline for getblock with verbosity 2
+VERBOSE_BLOCK_MIN_VERSION = 150000
+
+# Minimum Bitcoin Core version that also returns the outputs spent by
+# inputs (prevout) for getblock with verbosity 3
+PREVOUT_BLOCK_MIN_VERSION = 230000
+
+# Number of getblockhash or getblockheader calls sent in one JSON-RPC batch
+BLOCK_HASH_BATCH_SIZE = 1000
+
+# Maximum number of headers returned by one REST headers request
+REST_MAX_HEADERS = 2000
+
+# Number of getrawtransaction calls sent in one JSON-RPC batch
+TRANSACTION_BATCH_SIZE = 100
+
+# Number of JSON-RPC batches sent concurrently
+DEFAULT_BATCH_WORKERS = 4
 
 
 class BitcoinProxy:
@@ -119,22 +240,74 @@ class BitcoinProxy:
     `here <https://en.bitcoin.it/wiki/Original_Bitcoin_client/API_Calls_list>`_
     """
 
-    def __init__(self, host, port, rpc_user=None, rpc_pass=None, method='RPC'):
+    def __init__(self, host, port, rpc_user=None, rpc_pass=None, method='RPC',
+                 verbosity=None, pool_size=DEFAULT_POOL_SIZE, binary=False, stats=None,
+                 retries=DEFAULT_RETRIES, retry_delay=DEFAULT_RETRY_DELAY):
         """
         Creates a Bitcoin JSON RPC Service object.
 
         :param str url: URL of Bitcoin Core JSON-RPC endpoint
+        :param int verbosity: getblock verbosity used for RPC block requests
+            (None = highest verbosity supported by the node)
+        :param int pool_size: number of keep-alive connections kept open
+        :param bool binary: fetch blocks in binary serialization when using REST
+        :param Stats stats: request statistics (None = GLOBAL_STATS)
+        :param int retries: number of attempts of a request that fails to
+            connect or is rejected by a full work queue
+        :param float retry_delay: seconds waited before such a request is
+            repeated
         :return: bitcoin proxy object
         :rtype: BitcoinProxy
         """
         self.method = method
+        self.binary = binary
+        self._verbosity = verbosity
+        self._address_format = None
         rest_url = 'http://{}:{}/rest/'.format(host, port)
         rpc_url = 'http://{}:{}@{}:{}/'.format(rpc_user, rpc_pass, host, port)
         print(f'REST URL is: {rest_url}')
         print(f'RPC URL is: {rpc_url}')
-        self._jsonrpc_proxy = JSONRPCInterface(rpc_url)
+        self._jsonrpc_proxy = JSONRPCInterface(rpc_url, pool_size, stats, retries, retry_delay)
         if method == 'REST':
-            self._rest_proxy = RESTInterface(rest_url)
+            self._rest_proxy = RESTInterface(rest_url, pool_size, stats, retries, retry_delay)
+
+    @property
+    def verbosity(self):
+        """
+        Returns the getblock verbosity used for RPC block requests.
+
+        Unless set explicitly, the highest verbosity the node supports is
+        used: 3 (transactions inline with the outputs spent by their
+        inputs), 2 (transactions inline) or 1 (transaction ids).
+
+        :return: getblock verbosity
+        :rtype: int
+        """
+        if self._verbosity is None:
+            version = self.getnetworkinfo()['version']
+            if version >= PREVOUT_BLOCK_MIN_VERSION:
+                self._verbosity = 3
+            elif version >= VERBOSE_BLOCK_MIN_VERSION:
+                self._verbosity = 2
+            else:
+                self._verbosity = 1
+        return self._verbosity
+
+    @property
+    def address_format(self):
+        """
+        Returns the address encoding of the node's network, used for
+        blocks parsed from their binary serialization.
+
+        :return: address format
+        :rtype: AddressFormat
+        """
+        if self._address_format is None:
+            chain = self.getinfo()['chain']
+            if chain not in ADDRESS_FORMATS:
+                raise BitcoindException('Unknown chain ' + chain)
+            self._address_format = ADDRESS_FORMATS[chain]
+        return self._address_format
 
     def getblock(self, block_hash):
         """
@@ -145,11 +318,43 @@ class BitcoinProxy:
         :rtype: str
         """
         if self.method == 'REST':
-            r = self._rest_proxy.get_block(block_hash)
+            if self.binary:
+                r = self._getblock_binary(block_hash)
+            else:
+                r = self._rest_proxy.get_block(block_hash)
         else:
-            r = self._jsonrpc_proxy.call('getblock', block_hash)
+            r = self._jsonrpc_proxy.call('getblock', block_hash, self.verbosity)
         return r
 
+    def _getblock_binary(self, block_hash):
+        # height and next block are not part of the serialization
+        header = self._rest_proxy.get_headers(1, block_hash)[0]
+        try:
+            r = parse_block(self._rest_proxy.get_block_bin(block_hash),
+                            address_format=self.address_format)
+        except DeserializationException as exc:
+            raise BitcoindException('Cannot parse block {}: {}'.format(block_hash, exc))
+        r['height'] = header['height']
+        r['difficulty'] = header['difficulty']
+        if 'nextblockhash' in header:
+            r['nextblockhash'] = header['nextblockhash']
+        return r
+
+    def getblockheader(self, block_hash):
+        """
+        Returns the header of the block with the given hash.
+
+        :param str block_hash: the block hash
+        :return: header as JSON
+        :rtype: dict
+        """
+        if self.method == 'REST':
+            headers = self._rest_proxy.get_headers(1, block_hash)
+            if not headers:
+                raise BitcoindException('Block not found: ' + block_hash)
+            return headers[0]
+        return self._jsonrpc_proxy.call('getblockheader', block_hash)
+
     def getblockcount(self):
         """
         Returns the number of blocks in the longest block chain.
@@ -171,6 +376,73 @@ class BitcoinProxy:
         r = self._jsonrpc_proxy.call('getblockhash', height)
         return r
 
+    def getblockhashes(self, start_height, end_height):
+        """
+        Returns the hashes of all blocks in best-block-chain between the
+        given heights.
+
+        Heights are resolved in chunked JSON-RPC batches or, when using
+        REST, by walking the headers endpoint.
+
+        :param int start_height: first block height
+        :param int end_height: last block height
+        :return: list of block hashes in height order
+        :rtype: list
+        """
+        if end_height < start_height:
+            return []
+        if self.method == 'REST':
+            return [header['hash'] for header in self._rest_headers(start_height, end_height)]
+        return self._batch_calls('getblockhash',
+                                 [[height] for height in range(start_height, end_height + 1)])
+
+    def getblockheaders(self, start_height, end_height):
+        """
+        Returns the headers of all blocks in best-block-chain between the
+        given heights.
+
+        Headers are retrieved in chunked JSON-RPC batches of getblockheader
+        calls or, when using REST, from the headers endpoint.
+
+        :param int start_height: first block height
+        :param int end_height: last block height
+        :return: list of headers as JSON in height order
+        :rtype: list
+        """
+        if end_height < start_height:
+            return []
+        if self.method == 'REST':
+            return self._rest_headers(start_height, end_height)
+        block_hashes = self.getblockhashes(start_height, end_height)
+        return self._batch_calls('getblockheader', [[block_hash] for block_hash in block_hashes])
+
+    def _batch_calls(self, method, params_list):
+        results = []
+        for chunk_start in range(0, len(params_list), BLOCK_HASH_BATCH_SIZE):
+            chunk = params_list[chunk_start:chunk_start + BLOCK_HASH_BATCH_SIZE]
+            calls = [{'method': method, 'params': params, 'id': i}
+                     for i, params in enumerate(chunk)]
+            chunk_results = [None] * len(chunk)
+            for entry in self._jsonrpc_proxy.batch(calls):
+                if entry.get('error') is not None:
+                    raise BitcoindException('Error in RPC call: ' + str(entry['error']))
+                chunk_results[entry['id']] = entry['result']
+            results.extend(chunk_results)
+        return results
+
+    def _rest_headers(self, start_height, end_height):
+        count = end_height - start_height + 1
+        requested = min(REST_MAX_HEADERS, count)
+        headers = self._rest_proxy.get_headers(requested, self.getblockhash(start_height))
+        received = len(headers)
+        while received == requested and len(headers) < count:
+            # each further request starts at the last known block, which is skipped
+            requested = min(REST_MAX_HEADERS, count - len(headers) + 1)
+            next_headers = self._rest_proxy.get_headers(requested, headers[-1]['hash'])
+            headers.extend(next_headers[1:])
+            received = len(next_headers)
+        return headers
+
     def getinfo(self):
         """
         Returns an object containing various state info.
@@ -181,6 +453,17 @@ class BitcoinProxy:
         r = self._jsonrpc_proxy.call('getblockchaininfo')
         return r
 
+    def getnetworkinfo(self):
+        """
+        Returns an object containing P2P networking state info, including
+        the client version.
+
+        :return: JSON string with network info
+        :rtype: str
+        """
+        r = self._jsonrpc_proxy.call('getnetworkinfo')
+        return r
+
     def getrawtransaction(self, tx_id, verbose=1):
         """
         Returns raw transaction representation for given transaction id.
@@ -193,25 +476,212 @@ class BitcoinProxy:
         r = self._jsonrpc_proxy.call('getrawtransaction', tx_id, verbose)
         return r
 
-    def getrawtransactions(self, tx_ids, verbose=1):
+    def getrawtransactions(self, tx_ids, verbose=1, chunk_size=TRANSACTION_BATCH_SIZE,
+                           workers=DEFAULT_BATCH_WORKERS):
         """
         Returns raw transaction representation for a given list of transaction
         ids.
 
+        The transactions are requested in JSON-RPC batches of chunk_size
+        calls, of which up to workers are sent concurrently over the
+        pooled connections. Transactions that cannot be retrieved are
+        reported individually, without failing the other ones.
+
         :param tx_ids: list of transaction ids
         :param int verbose: complete transaction record (0 = false, 1 = true)
-        :return: array of raw transaction data as JSON
+        :param int chunk_size: number of transactions per batch request
+        :param int workers: maximum number of concurrent batch requests
+        :return: raw transaction data as JSON, or BitcoindException if a
+            transaction cannot be retrieved
         :rtype: dictionary (key=id, value=result)
         """
-        calls = []
-        for tx_id in tx_ids:
-            call = {'method': 'getrawtransaction',
-                    'params': [tx_id, verbose],
-                    'id': tx_id}
-            calls.append(call)
-        r = self._jsonrpc_proxy.batch(calls)
-
-        results = []
-        for entry in r:
-            results.append(entry['result'])
+        tx_ids = list(dict.fromkeys(tx_ids))
+        chunks = [tx_ids[start:start + chunk_size]
+                  for start in range(0, len(tx_ids), chunk_size)]
+        results = {}
+        if len(chunks) == 1 or workers <= 1:
+            for chunk in chunks:
+                results.update(self._getrawtransactions_batch(chunk, verbose))
+        elif chunks:
+            with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+                for chunk_results in executor.map(
+                        functools.partial(self._getrawtransactions_batch, verbose=verbose),
+                        chunks):
+                    results.update(chunk_results)
         return results
+
+    def _getrawtransactions_batch(self, tx_ids, verbose):
+        # ids are positions, as responses may come in any order
+        calls = [{'method': 'getrawtransaction', 'params': [tx_id, verbose], 'id': i}
+                 for i, tx_id in enumerate(tx_ids)]
+        try:
+            entries = self._jsonrpc_proxy.batch(calls)
+        except BitcoindException as exc:
+            return {tx_id: exc for tx_id in tx_ids}
+        results = [None] * len(tx_ids)
+        for entry in entries:
+            if entry.get('id') not in range(len(tx_ids)):
+                continue
+            if entry.get('error') is not None:
+                results[entry['id']] = BitcoindException(
+                    'Error in RPC call: ' + str(entry['error']))
+            else:
+                results[entry['id']] = entry['result']
+        return {tx_id: BitcoindException('No response for transaction ' + tx_id)
+                if result is None else result
+                for tx_id, result in zip(tx_ids, results)}
+
+
+# Default number of requests an AsyncBitcoinProxy keeps in flight
+DEFAULT_MAX_IN_FLIGHT = 16
+
+
+class AsyncBitcoinProxy:
+    """
+    asyncio proxy to Bitcoin JSON RPC Service.
+
+    Offers the calls of BitcoinProxy as coroutines. This is an executor
+    wrapper rather than an asyncio transport: each call runs the blocking
+    BitcoinProxy in a thread pool of max_in_flight threads sharing as many
+    keep-alive connections, and a semaphore bounds the calls waiting for
+    a thread. The number of concurrent requests is therefore capped by
+    the thread pool, which suits a node with a large rpcworkqueue but not
+    thousands of outstanding requests.
+    """
+
+    def __init__(self, host, port, rpc_user=None, rpc_pass=None, method='RPC',
+                 verbosity=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT, binary=False):
+        """
+        Creates an asyncio Bitcoin JSON RPC Service object.
+
+        :param int max_in_flight: maximum number of concurrent requests
+        :return: asyncio bitcoin proxy object
+        :rtype: AsyncBitcoinProxy
+        """
+        self.proxy = BitcoinProxy(host, port, rpc_user, rpc_pass, method, verbosity,
+                                  pool_size=max_in_flight, binary=binary)
+        self.max_in_flight = max_in_flight
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    async def _call(self, function, *args):
+        # a semaphore is bound to the event loop it is first used in, so
+        # each loop, e.g. of successive asyncio.run calls, gets its own
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_in_flight)
+        async with semaphore:
+            return await loop.run_in_executor(self._executor,
+                                              functools.partial(function, *args))
+
+    async def getblock(self, block_hash):
+        """
+        Returns information about the block with the given hash.
+
+        :param str block_hash: the block hash
+        :return: block as JSON
+        :rtype: str
+        """
+        return await self._call(self.proxy.getblock, block_hash)
+
+    async def getblockheader(self, block_hash):
+        """
+        Returns the header of the block with the given hash.
+
+        :param str block_hash: the block hash
+        :return: header as JSON
+        :rtype: dict
+        """
+        return await self._call(self.proxy.getblockheader, block_hash)
+
+    async def getblockcount(self):
+        """
+        Returns the number of blocks in the longest block chain.
+
+        :return: number of blocks in block chain
+        :rtype: int
+        """
+        return await self._call(self.proxy.getblockcount)
+
+    async def getblockhash(self, height):
+        """
+        Returns hash of block in best-block-chain at given height.
+
+        :param str height: the block height
+        :return: block hash
+        :rtype: str
+        """
+        return await self._call(self.proxy.getblockhash, height)
+
+    async def getblockhashes(self, start_height, end_height):
+        """
+        Returns the hashes of all blocks in best-block-chain between the
+        given heights.
+
+        :param int start_height: first block height
+        :param int end_height: last block height
+        :return: list of block hashes in height order
+        :rtype: list
+        """
+        return await self._call(self.proxy.getblockhashes, start_height, end_height)
+
+    async def getblockheaders(self, start_height, end_height):
+        """
+        Returns the headers of all blocks in best-block-chain between the
+        given heights.
+
+        :param int start_height: first block height
+        :param int end_height: last block height
+        :return: list of headers as JSON in height order
+        :rtype: list
+        """
+        return await self._call(self.proxy.getblockheaders, start_height, end_height)
+
+    async def getinfo(self):
+        """
+        Returns an object containing various state info.
+
+        :return: JSON string with state info
+        :rtype: str
+        """
+        return await self._call(self.proxy.getinfo)
+
+    async def getnetworkinfo(self):
+        """
+        Returns an object containing P2P networking state info.
+
+        :return: JSON string with network info
+        :rtype: str
+        """
+        return await self._call(self.proxy.getnetworkinfo)
+
+    async def getrawtransaction(self, tx_id, verbose=1):
+        """
+        Returns raw transaction representation for given transaction id.
+
+        :param str tx_id: transaction id
+        :param int verbose: complete transaction record (0 = false, 1 = true)
+        :return: raw transaction data as JSON
+        :rtype: str
+        """
+        return await self._call(self.proxy.getrawtransaction, tx_id, verbose)
+
+    async def getrawtransactions(self, tx_ids, verbose=1):
+        """
+        Returns raw transaction representation for a given list of transaction
+        ids.
+
+        :param tx_ids: list of transaction ids
+        :param int verbose: complete transaction record (0 = false, 1 = true)
+        :return: raw transaction data as JSON, or BitcoindException if a
+            transaction cannot be retrieved
+        :rtype: dictionary (key=id, value=result)
+        """
+        return await self._call(self.proxy.getrawtransactions, tx_ids, verbose)
+
+    def close(self):
+        """
+        Waits for outstanding requests and releases the worker threads.
+        """
+        self._executor.shutdown()
@@ -7,16 +7,39 @@ the Bitcoin block chain.
 """
 
 import logging
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
 
 from bitcoingraph.bitcoind import BitcoinProxy, BitcoindException
-from bitcoingraph.blockchain import Blockchain
+from bitcoingraph.blockchain import Blockchain, DEFAULT_PREFETCH_WINDOW, DEFAULT_PREFETCH_WORKERS
 from bitcoingraph import entities
+from bitcoingraph.blockfiles import BlockFileSource
+from bitcoingraph.columnar import ColumnarDumpWriter, DEFAULT_CHUNK_ROWS
+from bitcoingraph.dedup import SeenSet
+from bitcoingraph.extsort import DEFAULT_MEMORY
 from bitcoingraph.graphdb import GraphController
-from bitcoingraph.helper import sort
-from bitcoingraph.writer import CSVDumpWriter
+from bitcoingraph.headers import HeaderStore
+from bitcoingraph.helper import concatenate, merge, sort
+from bitcoingraph.outpoints import OutpointIndex
+from bitcoingraph.stats import GLOBAL_STATS
+from bitcoingraph.writer import BufferedCSVDumpWriter
 
 logger = logging.getLogger('bitcoingraph')
 
+# Number of height shards per worker process of a parallel export, so that
+# workers finishing early take over remaining shards
+SHARDS_PER_WORKER = 4
+
+# Files written by CSVDumpWriter, in the order they are merged
+EXPORT_FILES = ['blocks', 'transactions', 'outputs', 'addresses', 'rel_block_tx',
+                'rel_block_block', 'rel_tx_output', 'rel_input', 'rel_output_address']
+
+# Blockchain of a worker process of a parallel export, built once by
+# _init_export_worker and used by every shard the process exports
+_worker_blockchain = None
+
 
 class BitcoingraphException(Exception):
     """
@@ -37,6 +60,7 @@ class BitcoinGraph:
 
     def __init__(self, **config):
         """Create an instance based on the configuration."""
+        self.__blockchain_config = config['blockchain']
         self.blockchain = self.__get_blockchain(config['blockchain'])
         if 'neo4j' in config:
             nc = config['neo4j']
@@ -45,18 +69,50 @@ class BitcoinGraph:
     @staticmethod
     def __get_blockchain(config):
         """Connect to Bitcoin Core (via JSON-RPC) and return a
-        Blockchain object.
+        Blockchain object. If the configuration names a blocks directory,
+        blocks are read from its blk*.dat files instead, or from the
+        block file source given with it, which has indexed them already
+        (e.g. in the process starting a parallel export). If it names an
+        outpoint index, spent outputs are resolved from that file. If it
+        names a header store, the store is synchronised and used for
+        block header lookups.
         """
+        config = dict(config)
+        cache = {key: config.pop(key) for key in ('cache_size', 'cache_bytes')
+                 if key in config}
+        if 'outpoint_index' in config:
+            cache['outpoint_index'] = OutpointIndex(config.pop('outpoint_index'))
+        if 'header_store' in config:
+            cache['header_store'] = HeaderStore(config.pop('header_store'))
+        if 'blocks_dir' in config:
+            try:
+                source = config.get('block_source')
+                if source is None:
+                    print("Reading block files in {}".format(config['blocks_dir']))
+                    source = BlockFileSource(**config)
+                    print("Found {} blocks.".format(source.getblockcount() + 1))
+                return BitcoinGraph.__sync_headers(Blockchain(source, **cache))
+            except BitcoindException as exc:
+                raise BitcoingraphException(
+                    "Couldn't read block files in {}.".format(config['blocks_dir']), exc)
         try:
             print("Connecting to Bitcoin Core at {}".format(config['host']))
             bc_proxy = BitcoinProxy(**config)
             bc_proxy.getinfo()
             print("Connection successful.")
-            blockchain = Blockchain(bc_proxy)
-            return blockchain
+            blockchain = Blockchain(bc_proxy, **cache)
+            return BitcoinGraph.__sync_headers(blockchain)
         except BitcoindException as exc:
             raise BitcoingraphException("Couldn't connect to {}.".format(config['host']), exc)
 
+    @staticmethod
+    def __sync_headers(blockchain):
+        if blockchain.header_store is not None:
+            print("Synchronising block headers.")
+            added = blockchain.sync_headers()
+            print("Added {} block headers.".format(added))
+        return blockchain
+
     def get_transaction(self, tx_id):
         """Return a transaction."""
         return self.blockchain.get_transaction(tx_id)
@@ -126,29 +182,141 @@ class BitcoinGraph:
         return self.graph_db.get_unspent_bitcoins(address)
 
     def export(self, start, end, output_path=None, plain_header=False, separate_header=True,
-               progress=None, deduplicate_transactions=True):
-        """Export the blockchain into CSV files."""
+               progress=None, deduplicate_transactions=True,
+               prefetch_window=DEFAULT_PREFETCH_WINDOW, prefetch_workers=DEFAULT_PREFETCH_WORKERS,
+               workers=1, writer_thread=False, compression_level=None,
+               seen_set_memory=None, sort_files=True, sort_memory=DEFAULT_MEMORY,
+               sort_temp_dir=None):
+        """Export the blockchain into CSV files.
+
+        With several workers, the range is split into height shards that
+        are exported by separate processes and merged afterwards. With a
+        writer thread, rows are written to the files in the background.
+        With a compression level, data files are written as .csv.gz files,
+        which neo4j-admin imports as they are.
+
+        With a seen-set memory, repeated addresses and transactions are
+        skipped while writing, using seen-sets sharing that many bytes
+        (per worker), and the deduplicated files need not be sorted
+        afterwards. Unsorted files are sorted by compute_entities with
+        sort_input.
+
+        Files are sorted using at most sort_memory bytes (per worker) and
+        temporary files in sort_temp_dir, the default temporary directory
+        if None.
+        """
+        if output_path is None:
+            output_path = 'blocks_{}_{}'.format(start, end)
+        if not sort_files and seen_set_memory is None:
+            raise BitcoingraphException(
+                'Files are only deduplicated without sorting with a seen-set memory.', None)
+
+        if workers > 1 and not sort_files:
+            raise BitcoingraphException('The files of a parallel export are merged sorted.', None)
+        # an empty range has no shards and is written by this process
+        if workers > 1 and end >= start:
+            self.__export_shards(start, end, output_path, plain_header, separate_header,
+                                 progress, deduplicate_transactions, prefetch_window,
+                                 prefetch_workers, workers, writer_thread, compression_level,
+                                 seen_set_memory, sort_memory, sort_temp_dir)
+            return
+        seen_addresses, seen_transactions = _seen_sets(
+            seen_set_memory, deduplicate_transactions, output_path)
+        try:
+            with BufferedCSVDumpWriter(output_path, plain_header, separate_header,
+                                       background=writer_thread,
+                                       compression_level=compression_level,
+                                       seen_addresses=seen_addresses,
+                                       seen_transactions=seen_transactions) as writer:
+                self.__write_blocks(writer, start, end, progress, prefetch_window,
+                                    prefetch_workers)
+        finally:
+            _close_seen_sets(seen_addresses, seen_transactions)
+        if separate_header and sort_files:
+            for base_name in _deduplicated_files(deduplicate_transactions):
+                sort(output_path, _data_filename(base_name, compression_level), unique=True,
+                     compresslevel=compression_level, memory=sort_memory,
+                     temp_dir=sort_temp_dir)
+
+    def export_columnar(self, start, end, output_path=None, progress=None,
+                        prefetch_window=DEFAULT_PREFETCH_WINDOW,
+                        prefetch_workers=DEFAULT_PREFETCH_WORKERS,
+                        chunk_rows=DEFAULT_CHUNK_ROWS):
+        """Export the blockchain into a columnar dataset, which is read
+        with columnar.ColumnarReader. Requires numpy.
+        """
         if output_path is None:
             output_path = 'blocks_{}_{}'.format(start, end)
+        with ColumnarDumpWriter(output_path, chunk_rows) as writer:
+            self.__write_blocks(writer, start, end, progress, prefetch_window, prefetch_workers)
 
+    def __write_blocks(self, writer, start, end, progress, prefetch_window, prefetch_workers):
         number_of_blocks = end - start + 1
-        with CSVDumpWriter(output_path, plain_header, separate_header) as writer:
-            for block in self.blockchain.get_blocks_in_range(start, end):
-                writer.write(block)
-                if progress:
-                    processed_blocks = block.height - start + 1
-                    last_percentage = ((processed_blocks - 1) * 100) // number_of_blocks
-                    percentage = (processed_blocks * 100) // number_of_blocks
-                    if percentage > last_percentage:
-                        progress(processed_blocks / number_of_blocks)
-        if separate_header:
-            sort(output_path, 'addresses.csv', '-u')
-            if deduplicate_transactions:
-                for base_name in ['transactions', 'rel_tx_output',
-                                  'outputs', 'rel_output_address']:
-                    sort(output_path, base_name + '.csv', '-u')
-
-    def synchronize(self, max_blocks=None):
+        for block in self.blockchain.prefetch_blocks_in_range(
+                start, end, prefetch_window, prefetch_workers):
+            writer.write(block)
+            self.__index_outpoints(block)
+            if progress:
+                processed_blocks = block.height - start + 1
+                last_percentage = ((processed_blocks - 1) * 100) // number_of_blocks
+                percentage = (processed_blocks * 100) // number_of_blocks
+                if percentage > last_percentage:
+                    progress(processed_blocks / number_of_blocks)
+        self.__commit_outpoints()
+
+    def __export_shards(self, start, end, output_path, plain_header, separate_header, progress,
+                        deduplicate_transactions, prefetch_window, prefetch_workers, workers,
+                        writer_thread, compression_level, seen_set_memory, sort_memory,
+                        sort_temp_dir):
+        if self.blockchain.outpoint_index is not None:
+            raise BitcoingraphException(
+                'The outpoint index cannot be updated by a parallel export.', None)
+        # the header store has been synchronised by this process
+        config = {key: value for key, value in self.__blockchain_config.items()
+                  if key != 'header_store'}
+        if 'blocks_dir' in config:
+            config['block_source'] = self.blockchain.bitcoin_proxy
+        number_of_shards = min(workers * SHARDS_PER_WORKER, end - start + 1)
+        shard_size = -(-(end - start + 1) // number_of_shards)
+        shards = [(height, min(height + shard_size - 1, end),
+                   os.path.join(output_path, 'shard_{}'.format(height)))
+                  for height in range(start, end + 1, shard_size)]
+
+        deduplicated = _deduplicated_files(deduplicate_transactions) if separate_header else []
+
+        # writes the headers and creates or appends to the data files
+        with BufferedCSVDumpWriter(output_path, plain_header, separate_header,
+                                   compression_level=compression_level):
+            pass
+        try:
+            with ProcessPoolExecutor(workers, mp_context=get_context('spawn'),
+                                     initializer=_init_export_worker,
+                                     initargs=(config,)) as executor:
+                futures = [executor.submit(_export_shard, shard_start, shard_end,
+                                           shard_path, deduplicated, prefetch_window,
+                                           prefetch_workers, writer_thread, compression_level,
+                                           seen_set_memory, deduplicate_transactions,
+                                           sort_memory, sort_temp_dir)
+                           for shard_start, shard_end, shard_path in shards]
+                for completed, future in enumerate(as_completed(futures), 1):
+                    GLOBAL_STATS.merge(future.result())
+                    if progress:
+                        progress(completed / len(shards))
+            for base_name in EXPORT_FILES:
+                filename = _data_filename(base_name, compression_level)
+                shard_files = [os.path.join(shard_path, filename) for _, _, shard_path in shards]
+                if base_name in deduplicated:
+                    merge(output_path, filename, shard_files, unique=True,
+                          compresslevel=compression_level, memory=sort_memory,
+                          temp_dir=sort_temp_dir)
+                else:
+                    concatenate(output_path, filename, shard_files)
+        finally:
+            for _, _, shard_path in shards:
+                shutil.rmtree(shard_path, ignore_errors=True)
+
+    def synchronize(self, max_blocks=None, prefetch_window=DEFAULT_PREFETCH_WINDOW,
+                    prefetch_workers=DEFAULT_PREFETCH_WORKERS):
         """Synchronise the graph database with the blockchain
         information from the bitcoin client.
         """
@@ -162,17 +330,96 @@ class BitcoinGraph:
             else:
                 end = min(start + max_blocks - 1, blockchain_end)
             print('add blocks', start, 'to', end)
-            for block in self.blockchain.get_blocks_in_range(start, end):
+            for block in self.blockchain.prefetch_blocks_in_range(
+                    start, end, prefetch_window, prefetch_workers):
                 self.graph_db.add_block(block)
+                self.__index_outpoints(block)
+            self.__commit_outpoints()
+
+    def __index_outpoints(self, block):
+        if self.blockchain.outpoint_index is not None:
+            self.blockchain.outpoint_index.add_block(block)
+
+    def __commit_outpoints(self):
+        if self.blockchain.outpoint_index is not None:
+            self.blockchain.outpoint_index.commit()
+
+
+def _deduplicated_files(deduplicate_transactions):
+    if deduplicate_transactions:
+        return ['addresses', 'transactions', 'rel_tx_output', 'outputs', 'rel_output_address']
+    return ['addresses']
+
+
+def _data_filename(base_name, compression_level):
+    if compression_level is None:
+        return base_name + '.csv'
+    return base_name + '.csv.gz'
+
+
+def _seen_sets(memory, deduplicate_transactions, directory):
+    if memory is None:
+        return None, None
+    if not deduplicate_transactions:
+        return SeenSet(memory, directory), None
+    return SeenSet(memory // 2, directory), SeenSet(memory // 2, directory)
+
+
+def _close_seen_sets(*seen_sets):
+    for seen_set in seen_sets:
+        if seen_set is not None:
+            seen_set.close()
+
+
+def _init_export_worker(config):
+    """Connect a worker process of a parallel export to the blockchain,
+    which is done once per process rather than once per shard. Block
+    files are not scanned again, since the configuration holds the block
+    file source of the parent process.
+    """
+    global _worker_blockchain
+    _worker_blockchain = BitcoinGraph(blockchain=config).blockchain
+
+
+def _export_shard(start, end, output_path, deduplicated, prefetch_window,
+                  prefetch_workers, writer_thread, compression_level=None,
+                  seen_set_memory=None, deduplicate_transactions=True,
+                  sort_memory=DEFAULT_MEMORY, sort_temp_dir=None):
+    """Export a height shard in a worker process of a parallel export,
+    using the blockchain of the process. The header files of the shard
+    are not used. Returns the request statistics of the process since
+    the previous shard, which the parent process adds to its own.
+    """
+    seen_addresses, seen_transactions = _seen_sets(
+        seen_set_memory, deduplicate_transactions, output_path)
+    try:
+        with BufferedCSVDumpWriter(output_path, background=writer_thread,
+                                   compression_level=compression_level,
+                                   seen_addresses=seen_addresses,
+                                   seen_transactions=seen_transactions) as writer:
+            for block in _worker_blockchain.prefetch_blocks_in_range(
+                    start, end, prefetch_window, prefetch_workers):
+                writer.write(block)
+    finally:
+        _close_seen_sets(seen_addresses, seen_transactions)
+    for base_name in deduplicated:
+        sort(output_path, _data_filename(base_name, compression_level), unique=True,
+             compresslevel=compression_level, memory=sort_memory, temp_dir=sort_temp_dir)
+    return GLOBAL_STATS.drain()
 
 
-def compute_entities(input_path, sort_input=False):
+def compute_entities(input_path, sort_input=False, sort_memory=DEFAULT_MEMORY,
+                     sort_temp_dir=None):
     """Read exported CSV files containing blockchain information and
-    export entities into CSV files.
+    export entities into CSV files. Compressed .csv.gz files are read and
+    the entity files are compressed as well. Files are sorted using at
+    most sort_memory bytes and temporary files in sort_temp_dir.
     """
+    options = {'memory': sort_memory, 'temp_dir': sort_temp_dir}
     if sort_input:
-        sort(input_path, 'rel_output_address.csv')
-    sort(input_path, 'rel_input.csv', '-k 2 -t ,')
+        sort(input_path, entities.csv_filename(input_path, 'addresses'), unique=True, **options)
+        sort(input_path, entities.csv_filename(input_path, 'rel_output_address'), **options)
+    sort(input_path, entities.csv_filename(input_path, 'rel_input'), key=2, **options)
     entities.calculate_input_addresses(input_path)
-    sort(input_path, 'input_addresses.csv')
+    sort(input_path, entities.csv_filename(input_path, 'input_addresses'), **options)
     entities.compute_entities(input_path)
@@ -5,14 +5,29 @@ An API for traversing the Bitcoin blockchain
 
 """
 
-from bitcoingraph.model import Block, Transaction
+import asyncio
+import collections
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from bitcoingraph.batch import BlockBatch
+from bitcoingraph.model import Block, Output, Transaction
 from bitcoingraph.bitcoind import BitcoindException
+from bitcoingraph.cache import LRUCache
 
 __author__ = 'Bernhard Haslhofer (bernhard.haslhofer@ait.ac.at)'
 __copyright__ = 'Copyright 2015, Bernhard Haslhofer'
 __license__ = "MIT"
 
 
+# Defaults for read-ahead block fetching
+DEFAULT_PREFETCH_WINDOW = 16
+DEFAULT_PREFETCH_WORKERS = 4
+
+# Number of block headers requested at once when iterating over headers
+HEADER_BATCH_SIZE = 2000
+
+
 class BlockchainException(Exception):
     """
     Exception raised when accessing or navigating the block chain.
@@ -32,15 +47,39 @@ class Blockchain:
     Bitcoin block chain.
     """
 
-    def __init__(self, bitcoin_proxy):
+    def __init__(self, bitcoin_proxy, cache_size=None, cache_bytes=None, outpoint_index=None,
+                 header_store=None):
         """
         Creates a block chain object.
 
+        Transactions retrieved by id are kept in an LRU cache if it is
+        bounded by number of transactions or by their serialized size.
+        Outputs spent by inputs are looked up in the outpoint index, if
+        given, before their transactions are retrieved. Block heights,
+        hashes and timestamps are looked up in the header store, if given.
+
         :param BitcoinProxy bitcoin_proxy: reference to Bitcoin proxy
+        :param int cache_size: maximum number of cached transactions
+        :param int cache_bytes: maximum serialized size of cached transactions
+        :param OutpointIndex outpoint_index: index of transaction outputs
+        :param HeaderStore header_store: store of block headers
         :return: block chain object
         :rtype: Blockchain
         """
         self._bitcoin_proxy = bitcoin_proxy
+        self.outpoint_index = outpoint_index
+        self.header_store = header_store
+        if cache_size is None and cache_bytes is None:
+            self.transaction_cache = None
+        else:
+            self.transaction_cache = LRUCache(cache_size, cache_bytes)
+
+    @property
+    def bitcoin_proxy(self):
+        """
+        Bitcoin proxy or block file source the blocks are retrieved from.
+        """
+        return self._bitcoin_proxy
 
     def get_block_by_hash(self, block_hash):
         """
@@ -69,12 +108,79 @@ class Blockchain:
         """
         # Returns block by height
         try:
-            block_hash = self._bitcoin_proxy.getblockhash(block_height)
+            block_hash = None
+            if self.header_store is not None:
+                block_hash = self.header_store.get_hash(block_height)
+            if block_hash is None:
+                block_hash = self._bitcoin_proxy.getblockhash(block_height)
             return self.get_block_by_hash(block_hash)
         except BitcoindException as exc:
             raise BlockchainException(
                 'Cannot retrieve block with height {}'.format(block_height), exc)
 
+    def get_block_header(self, height_or_hash):
+        """
+        Returns a block without its transactions, which are only loaded
+        when accessed.
+
+        :param height_or_hash: height (int) or hash (str) of the block
+        :return: the requested block
+        :rtype: Block
+        :raises BlockchainException: if the block header cannot be retrieved
+        """
+        if isinstance(height_or_hash, int):
+            header = self.lookup_header(height=height_or_hash)
+        else:
+            header = self.lookup_header(block_hash=height_or_hash)
+        # the last stored header does not know its successor
+        if header is None or 'nextblockhash' not in header:
+            try:
+                if isinstance(height_or_hash, int):
+                    block_hash = self._bitcoin_proxy.getblockhash(height_or_hash)
+                else:
+                    block_hash = height_or_hash
+                header = self._bitcoin_proxy.getblockheader(block_hash)
+            except BitcoindException as exc:
+                raise BlockchainException(
+                    'Cannot retrieve block header {}'.format(height_or_hash), exc)
+        return Block(self, json_data=header)
+
+    def get_block_headers_in_range(self, start_height=0, end_height=0,
+                                   batch_size=HEADER_BATCH_SIZE):
+        """
+        Generates blocks without their transactions in a given range. The
+        transactions of each block are only loaded when accessed.
+
+        Headers are read from the header store as far as it reaches and
+        requested in batches otherwise.
+
+        :param int start_height: first block height in range
+        :param int end_height: last block height in range
+        :param int batch_size: number of headers requested at once
+        :yield: the requested blocks
+        :rtype: Block
+        :raises BlockchainException: if block headers cannot be retrieved
+        """
+        height = start_height
+        if self.header_store is not None:
+            # the last stored header does not know its successor
+            while height <= end_height and height < self.header_store.tip_height:
+                yield Block(self, json_data=self.header_store.get(height))
+                height += 1
+        if height > end_height:
+            return
+        end_height = min(end_height, self.get_max_block_height())
+        while height <= end_height:
+            batch_end = min(height + batch_size - 1, end_height)
+            try:
+                headers = self._bitcoin_proxy.getblockheaders(height, batch_end)
+            except BitcoindException as exc:
+                raise BlockchainException(
+                    'Cannot retrieve block headers from {} to {}'.format(height, batch_end), exc)
+            for header in headers:
+                yield Block(self, json_data=header)
+            height = batch_end + 1
+
     def get_blocks_in_range(self, start_height=0, end_height=0):
         """
         Generates blocks in a given range.
@@ -92,6 +198,117 @@ class Blockchain:
             else:
                 break
 
+    def prefetch_blocks_in_range(self, start_height=0, end_height=0,
+                                 window_size=DEFAULT_PREFETCH_WINDOW,
+                                 workers=DEFAULT_PREFETCH_WORKERS, prefetch_inputs=False):
+        """
+        Generates blocks in a given range, fetching up to window_size
+        blocks ahead in worker threads while the current block is consumed.
+        Blocks are still generated strictly in height order.
+
+        :param int start_height: first block height in range
+        :param int end_height: last block height in range
+        :param int window_size: maximum number of blocks fetched ahead
+        :param int workers: number of fetching threads
+        :param bool prefetch_inputs: also resolve the outputs spent by the
+            inputs of each block in the worker threads
+        :yield: the requested blocks
+        :rtype: Block
+        """
+        fetch = self._get_block_with_inputs if prefetch_inputs else self.get_block_by_hash
+        block_hashes = iter(self.get_block_hashes(start_height, end_height))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = collections.deque(
+                executor.submit(fetch, block_hash)
+                for block_hash in itertools.islice(block_hashes, max(window_size, 1)))
+            try:
+                while pending:
+                    block = pending.popleft().result()
+                    for block_hash in itertools.islice(block_hashes, 1):
+                        pending.append(executor.submit(fetch, block_hash))
+                    yield block
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _get_block_with_inputs(self, block_hash):
+        block = self.get_block_by_hash(block_hash)
+        block.prefetch_inputs()
+        return block
+
+    def get_block_batch(self, start_height=0, end_height=0, resolve_inputs=True,
+                        window_size=DEFAULT_PREFETCH_WINDOW, workers=DEFAULT_PREFETCH_WORKERS):
+        """
+        Returns the blocks in a given range as columnar batch. Requires
+        numpy.
+
+        :param int start_height: first block height in range
+        :param int end_height: last block height in range
+        :param bool resolve_inputs: resolve the outputs spent by inputs
+        :param int window_size: maximum number of blocks fetched ahead
+        :param int workers: number of fetching threads
+        :return: the requested blocks
+        :rtype: BlockBatch
+        """
+        return BlockBatch.from_blocks(
+            self.prefetch_blocks_in_range(start_height, end_height, window_size, workers,
+                                          prefetch_inputs=resolve_inputs),
+            resolve_inputs)
+
+    def get_block_hashes(self, start_height=0, end_height=0):
+        """
+        Returns the hashes of the blocks in a given range. The range is
+        limited to the maximum known block height.
+
+        :param int start_height: first block height in range
+        :param int end_height: last block height in range
+        :return: block hashes in height order
+        :rtype: list
+        :raises BlockchainException: if block hashes cannot be retrieved
+        """
+        if self.header_store is not None:
+            block_hashes = self.header_store.get_hashes(start_height, end_height)
+            if block_hashes is not None:
+                return block_hashes
+        end_height = min(end_height, self.get_max_block_height())
+        try:
+            return self._bitcoin_proxy.getblockhashes(start_height, end_height)
+        except BitcoindException as exc:
+            raise BlockchainException(
+                'Cannot retrieve block hashes from {} to {}'.format(start_height, end_height),
+                exc)
+
+    def lookup_header(self, block_hash=None, height=None):
+        """
+        Returns a block header from the header store.
+
+        :param str block_hash: hash of the block
+        :param int height: height of the block, used if no hash is given
+        :return: header as JSON, or None if there is no header store or the
+            block is not stored
+        :rtype: dict
+        """
+        if self.header_store is None:
+            return None
+        if block_hash is not None:
+            height = self.header_store.get_height(block_hash)
+        if height is None:
+            return None
+        return self.header_store.get(height)
+
+    def sync_headers(self):
+        """
+        Brings the header store up to the best chain.
+
+        :return: number of headers added
+        :rtype: int
+        :raises BlockchainException: if headers cannot be retrieved
+        """
+        try:
+            return self.header_store.sync(self._bitcoin_proxy)
+        except BitcoindException as exc:
+            raise BlockchainException('Cannot synchronise block headers', exc)
+
     def get_transaction(self, tx_id):
         """
         Returns a transaction by given transaction id.
@@ -100,28 +317,117 @@ class Blockchain:
         :return: the requested transaction
         :rtype: Transaction
         """
+        if self.transaction_cache is not None:
+            tx = self.transaction_cache.get(tx_id)
+            if tx is not None:
+                return tx
         try:
             raw_tx_data = self._bitcoin_proxy.getrawtransaction(tx_id)
-            return Transaction(self, json_data=raw_tx_data)
+            tx = Transaction(self, json_data=raw_tx_data)
         except BitcoindException as exc:
             raise BlockchainException('Cannot retrieve transaction with id {}'.format(tx_id), exc)
+        if self.transaction_cache is not None:
+            self.transaction_cache.put(tx_id, tx, raw_tx_data.get('size', 0))
+        return tx
+
+    def get_output(self, tx_id, index):
+        """
+        Returns a transaction output by given transaction id and index.
+
+        :param str tx_id: id of the transaction creating the output
+        :param int index: index of the output
+        :return: the requested output
+        :rtype: Output
+        """
+        output = self._indexed_output(tx_id, index)
+        if output is None:
+            output = self.get_transaction(tx_id).outputs[index]
+        return output
+
+    def _indexed_output(self, tx_id, index):
+        if self.outpoint_index is None:
+            return None
+        entry = self.outpoint_index.get(tx_id, index)
+        if entry is None:
+            return None
+        value, output_type, addresses = entry
+        return Output(Transaction(self, txid=tx_id), index,
+                      {'value': value,
+                       'scriptPubKey': {'type': output_type, 'addresses': addresses}})
 
-    def get_transactions(self, tx_ids):
+    def prefetch_inputs(self, transactions):
+        """
+        Resolves the outputs spent by the inputs of the given transactions
+        in bulk, so that accessing them does not cost a request per input.
+
+        Outputs are taken from the given transactions themselves, the
+        outpoint index and the transaction cache. The transactions creating
+        the remaining outputs are requested in batches.
+
+        :param transactions: list of transactions, e.g. of one or more blocks
+        :raises BlockchainException: if a transaction cannot be retrieved
+        """
+        txs_by_id = {tx.txid: tx for tx in transactions}
+        unresolved = collections.defaultdict(list)
+        for tx in transactions:
+            for input in tx.inputs:
+                if input.is_resolved():
+                    continue
+                if input.txid in txs_by_id:
+                    input.output = txs_by_id[input.txid].outputs[input.vout]
+                    continue
+                output = self._indexed_output(input.txid, input.vout)
+                if output is None:
+                    unresolved[input.txid].append(input)
+                else:
+                    input.output = output
+        if unresolved:
+            txs = self.get_transactions(list(unresolved))
+            for inputs, tx in zip(unresolved.values(), txs):
+                for input in inputs:
+                    input.output = tx.outputs[input.vout]
+
+    def get_transactions(self, tx_ids, errors=None):
         """
         Returns transactions for given transaction ids.
 
+        Transactions that are not cached are requested in batches.
+
         :param tx_ids: list of transaction ids
+        :param dict errors: if given, transactions that cannot be retrieved
+            are left out and mapped to their BlockchainException in this
+            dict instead of raising it
         :return: list of transaction objects
         :rtype: Transaction list
+        :raises BlockchainException: if a transaction cannot be retrieved
+            and no errors dict is given
         """
-        try:
-            txs = []
-            raw_txs_data = self._bitcoin_proxy.getrawtransactions(tx_ids)
-            for raw_tx_data in raw_txs_data:
-                txs.append(Transaction(raw_tx_data, self))
-            return txs
-        except BitcoindException as exc:
-            raise BlockchainException('Cannot retrieve transactions {}'.format(tx_ids), exc)
+        txs = {}
+        missing = []
+        for tx_id in tx_ids:
+            tx = None if self.transaction_cache is None else self.transaction_cache.get(tx_id)
+            if tx is None:
+                missing.append(tx_id)
+            else:
+                txs[tx_id] = tx
+        if missing:
+            try:
+                raw_txs_data = self._bitcoin_proxy.getrawtransactions(missing)
+            except BitcoindException as exc:
+                raise BlockchainException('Cannot retrieve transactions {}'.format(missing), exc)
+            for tx_id, raw_tx_data in raw_txs_data.items():
+                if isinstance(raw_tx_data, BitcoindException):
+                    exc = BlockchainException(
+                        'Cannot retrieve transaction with id {}'.format(tx_id), raw_tx_data)
+                    if errors is None:
+                        raise exc
+                    errors[tx_id] = exc
+                    continue
+                tx = Transaction(self, json_data=raw_tx_data)
+                if self.transaction_cache is not None:
+                    self.transaction_cache.put(tx_id, tx, raw_tx_data.get('size', 0))
+                txs[tx_id] = tx
+        return [txs[tx_id] for tx_id in tx_ids if tx_id in txs]
 
     def get_max_block_height(self):
         """
@@ -136,3 +442,174 @@ class Blockchain:
         except BitcoindException as exc:
             raise BlockchainException("Error when retrieving maximum\
                 block height", exc)
+
+
+class AsyncBlockchain:
+
+    """
+    Bitcoin block chain accessed through an asyncio proxy.
+
+    Blocks and transactions are returned as regular model objects. Parts
+    of them that are loaded lazily are fetched with blocking calls through
+    the proxy wrapped by the AsyncBitcoinProxy.
+    """
+
+    def __init__(self, async_bitcoin_proxy):
+        """
+        Creates an asyncio block chain object.
+
+        :param AsyncBitcoinProxy async_bitcoin_proxy: reference to asyncio Bitcoin proxy
+        :return: block chain object
+        :rtype: AsyncBlockchain
+        """
+        self._bitcoin_proxy = async_bitcoin_proxy
+        self.blockchain = Blockchain(async_bitcoin_proxy.proxy)
+
+    async def get_block_by_hash(self, block_hash):
+        """
+        Returns a block by given block hash.
+
+        :param str block_hash: hash of block to be returned
+        :return: the requested block
+        :rtype: Block
+        :raises BlockchainException: if block cannot be retrieved
+        """
+        try:
+            raw_block_data = await self._bitcoin_proxy.getblock(block_hash)
+            return Block(self.blockchain, json_data=raw_block_data)
+        except BitcoindException as exc:
+            raise BlockchainException('Cannot retrieve block {}'.format(block_hash), exc)
+
+    async def get_block_by_height(self, block_height):
+        """
+        Returns a block by given block height.
+
+        :param int block_height: height of block to be returned
+        :return: the requested block
+        :rtype: Block
+        :raises BlockchainException: if block cannot be retrieved
+        """
+        try:
+            block_hash = await self._bitcoin_proxy.getblockhash(block_height)
+        except BitcoindException as exc:
+            raise BlockchainException(
+                'Cannot retrieve block with height {}'.format(block_height), exc)
+        return await self.get_block_by_hash(block_hash)
+
+    async def get_block_header(self, height_or_hash):
+        """
+        Returns a block without its transactions, which are only loaded
+        when accessed.
+
+        :param height_or_hash: height (int) or hash (str) of the block
+        :return: the requested block
+        :rtype: Block
+        :raises BlockchainException: if the block header cannot be retrieved
+        """
+        try:
+            if isinstance(height_or_hash, int):
+                block_hash = await self._bitcoin_proxy.getblockhash(height_or_hash)
+            else:
+                block_hash = height_or_hash
+            header = await self._bitcoin_proxy.getblockheader(block_hash)
+        except BitcoindException as exc:
+            raise BlockchainException(
+                'Cannot retrieve block header {}'.format(height_or_hash), exc)
+        return Block(self.blockchain, json_data=header)
+
+    async def get_block_headers_in_range(self, start_height=0, end_height=0,
+                                         batch_size=HEADER_BATCH_SIZE):
+        """
+        Generates blocks without their transactions in a given range,
+        requesting their headers in batches. The transactions of each
+        block are only loaded when accessed.
+
+        :param int start_height: first block height in range
+        :param int end_height: last block height in range
+        :param int batch_size: number of headers requested at once
+        :yield: the requested blocks
+        :rtype: Block
+        :raises BlockchainException: if block headers cannot be retrieved
+        """
+        end_height = min(end_height, await self.get_max_block_height())
+        for height in range(start_height, end_height + 1, batch_size):
+            batch_end = min(height + batch_size - 1, end_height)
+            try:
+                headers = await self._bitcoin_proxy.getblockheaders(height, batch_end)
+            except BitcoindException as exc:
+                raise BlockchainException(
+                    'Cannot retrieve block headers from {} to {}'.format(height, batch_end), exc)
+            for header in headers:
+                yield Block(self.blockchain, json_data=header)
+
+    async def get_block_hashes(self, start_height=0, end_height=0):
+        """
+        Returns the hashes of the blocks in a given range. The range is
+        limited to the maximum known block height.
+
+        :param int start_height: first block height in range
+        :param int end_height: last block height in range
+        :return: block hashes in height order
+        :rtype: list
+        :raises BlockchainException: if block hashes cannot be retrieved
+        """
+        end_height = min(end_height, await self.get_max_block_height())
+        try:
+            return await self._bitcoin_proxy.getblockhashes(start_height, end_height)
+        except BitcoindException as exc:
+            raise BlockchainException(
+                'Cannot retrieve block hashes from {} to {}'.format(start_height, end_height),
+                exc)
+
+    async def get_blocks_in_range(self, start_height=0, end_height=0,
+                                  window_size=DEFAULT_PREFETCH_WINDOW):
+        """
+        Generates blocks in a given range, keeping up to window_size block
+        requests in flight. Blocks are generated in height order.
+
+        :param int start_height: first block height in range
+        :param int end_height: last block height in range
+        :param int window_size: maximum number of blocks fetched ahead
+        :yield: the requested blocks
+        :rtype: Block
+        """
+        block_hashes = iter(await self.get_block_hashes(start_height, end_height))
+        pending = collections.deque(
+            asyncio.ensure_future(self.get_block_by_hash(block_hash))
+            for block_hash in itertools.islice(block_hashes, max(window_size, 1)))
+        try:
+            while pending:
+                block = await pending.popleft()
+                for block_hash in itertools.islice(block_hashes, 1):
+                    pending.append(asyncio.ensure_future(self.get_block_by_hash(block_hash)))
+                yield block
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def get_transaction(self, tx_id):
+        """
+        Returns a transaction by given transaction id.
+
+        :param str tx_id: transaction id
+        :return: the requested transaction
+        :rtype: Transaction
+        """
+        try:
+            raw_tx_data = await self._bitcoin_proxy.getrawtransaction(tx_id)
+            return Transaction(self.blockchain, json_data=raw_tx_data)
+        except BitcoindException as exc:
+            raise BlockchainException('Cannot retrieve transaction with id {}'.format(tx_id), exc)
+
+    async def get_max_block_height(self):
+        """
+        Returns maximum known block height.
+
+        :return: maximum block height
+        :rtype: int
+        """
+        try:
+            return await self._bitcoin_proxy.getblockcount()
+        except BitcoindException as exc:
+            raise BlockchainException("Error when retrieving maximum\
+                block height", exc)
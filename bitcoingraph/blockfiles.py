@@ -0,0 +1,331 @@
+"""
+blockfiles
+
+Offline access to the blocks stored in Bitcoin Core's blocks/blk*.dat
+files, bypassing the JSON-RPC and REST interfaces.
+
+"""
+
+import collections
+import glob
+import mmap
+import os
+import struct
+import threading
+
+from bitcoingraph.bitcoind import BitcoindException
+from bitcoingraph.serialization import (
+    BLOCK_HEADER_SIZE, MAINNET, NULL_HASH, REGTEST, TESTNET, DeserializationException,
+    double_sha256, parse_block, parse_block_header)
+
+__author__ = 'Bernhard Haslhofer (bernhard.haslhofer@ait.ac.at)'
+__copyright__ = 'Copyright 2015, Bernhard Haslhofer'
+__license__ = "MIT"
+
+
+MAINNET_MAGIC = bytes.fromhex('f9beb4d9')
+TESTNET_MAGIC = bytes.fromhex('0b110907')
+TESTNET4_MAGIC = bytes.fromhex('1c163f28')
+# magic of the default signet, custom signets have their own
+SIGNET_MAGIC = bytes.fromhex('0a03cf40')
+REGTEST_MAGIC = bytes.fromhex('fabfb5da')
+
+# Address formats by network magic
+ADDRESS_FORMATS = {MAINNET_MAGIC: MAINNET, TESTNET_MAGIC: TESTNET, TESTNET4_MAGIC: TESTNET,
+                   SIGNET_MAGIC: TESTNET, REGTEST_MAGIC: REGTEST}
+
+# Network magics by the chain names of getblockchaininfo
+NETWORK_MAGICS = {'main': MAINNET_MAGIC, 'test': TESTNET_MAGIC, 'testnet4': TESTNET4_MAGIC,
+                  'signet': SIGNET_MAGIC, 'regtest': REGTEST_MAGIC}
+
+# Maximum number of block files kept memory-mapped at the same time
+MAX_OPEN_FILES = 64
+
+_unpack_frame = struct.Struct('<4sI').unpack_from
+
+
+class BlockFileSource:
+    """
+    Source of blocks read from memory-mapped blk*.dat files.
+
+    The files are scanned once for their block frames, and the best chain
+    is reconstructed by linking the previous-block hashes of the headers
+    and selecting the tip with the most cumulative work. The source offers
+    the block calls of BitcoinProxy, so that it can be used in place of
+    it by Blockchain. Transactions can only be accessed through blocks.
+    """
+
+    def __init__(self, blocks_dir, magic=MAINNET_MAGIC, base_height=0, address_format=None):
+        """
+        Creates a block file source and indexes the block files.
+
+        :param str blocks_dir: directory containing the blk*.dat files
+        :param bytes magic: network magic preceding each block
+        :param int base_height: height of the first block, if the files do
+            not start at the genesis block (e.g. on a pruned node)
+        :param AddressFormat address_format: address encoding of the
+            network, selected by the magic if None
+        :return: block file source
+        :rtype: BlockFileSource
+        """
+        if address_format is None:
+            address_format = ADDRESS_FORMATS.get(magic)
+            if address_format is None:
+                raise BitcoindException(
+                    'Unknown network magic {}, an address format is required'.format(
+                        magic.hex()))
+        self._paths = sorted(glob.glob(os.path.join(blocks_dir, 'blk[0-9]*.dat')))
+        if not self._paths:
+            raise BitcoindException('No block files found in {}'.format(blocks_dir))
+        self._magic = magic
+        self._address_format = address_format
+        self._xor_key = self._read_xor_key(blocks_dir)
+        self._base_height = base_height
+        self._open_files = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # block hash -> (file index, offset, length, previous block hash, bits)
+        self._index = {}
+        for file_index in range(len(self._paths)):
+            self._scan(file_index)
+        self._heights, self._chain = self._best_chain()
+
+    def __getstate__(self):
+        # the index is pickled, e.g. for the worker processes of a parallel
+        # export, so that they need not scan the files again
+        state = dict(self.__dict__)
+        del state['_open_files'], state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open_files = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _read_xor_key(blocks_dir):
+        # Bitcoin Core 28 and later obfuscates block files with this key
+        path = os.path.join(blocks_dir, 'xor.dat')
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                key = f.read()
+            if any(key):
+                return key
+        return None
+
+    def _map(self, file_index):
+        mapped = self._open_files.get(file_index)
+        if mapped is None:
+            with open(self._paths[file_index], 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return b''
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._open_files[file_index] = mapped
+            while len(self._open_files) > MAX_OPEN_FILES:
+                self._open_files.popitem(last=False)[1].close()
+        else:
+            self._open_files.move_to_end(file_index)
+        return mapped
+
+    def _read(self, file_index, offset, length):
+        with self._lock:
+            data = self._map(file_index)[offset:offset + length]
+        if self._xor_key is None:
+            return data
+        key = self._xor_key
+        start = offset % len(key)
+        stream = (key[start:] + key * (len(data) // len(key) + 1))[:len(data)]
+        return (int.from_bytes(data, 'little') ^
+                int.from_bytes(stream, 'little')).to_bytes(len(data), 'little')
+
+    def _scan(self, file_index):
+        with self._lock:
+            size = len(self._map(file_index))
+        offset = 0
+        while offset + 8 + BLOCK_HEADER_SIZE <= size:
+            magic, length = _unpack_frame(self._read(file_index, offset, 8))
+            if magic != self._magic:
+                # preallocated space at the end of a file is zero-filled
+                if magic == bytes(4) or self._xor_key is not None:
+                    break
+                with self._lock:
+                    offset = self._map(file_index).find(self._magic, offset + 1)
+                if offset < 0:
+                    break
+                continue
+            if offset + 8 + length > size:
+                break
+            # a frame too short for a header would be read into the next one
+            if length < BLOCK_HEADER_SIZE:
+                offset += 8 + length
+                continue
+            header = self._read(file_index, offset + 8, BLOCK_HEADER_SIZE)
+            block_hash = double_sha256(header)[::-1]
+            previous = header[4:36][::-1]
+            bits = struct.unpack_from('<I', header, 72)[0]
+            self._index.setdefault(block_hash, (file_index, offset + 8, length, previous, bits))
+            offset += 8 + length
+
+    @staticmethod
+    def _work(bits):
+        exponent = bits >> 24
+        mantissa = bits & 0x007fffff
+        if exponent <= 3:
+            target = mantissa >> 8 * (3 - exponent)
+        else:
+            target = mantissa << 8 * (exponent - 3)
+        return 2 ** 256 // (target + 1)
+
+    def _best_chain(self):
+        children = collections.defaultdict(list)
+        roots = []
+        for block_hash, (_, _, _, previous, _) in self._index.items():
+            if previous == NULL_HASH or previous not in self._index:
+                roots.append(block_hash)
+            else:
+                children[previous].append(block_hash)
+        heights = {}
+        work = {}
+        best = None
+        stack = [(root, self._base_height, 0) for root in roots]
+        while stack:
+            block_hash, height, parent_work = stack.pop()
+            heights[block_hash] = height
+            work[block_hash] = parent_work + self._work(self._index[block_hash][4])
+            if best is None or work[block_hash] > work[best] or \
+                    (work[block_hash] == work[best] and
+                     self._index[block_hash][:2] < self._index[best][:2]):
+                best = block_hash
+            stack.extend((child, height + 1, work[block_hash]) for child in children[block_hash])
+        chain = []
+        block_hash = best
+        while block_hash is not None:
+            chain.append(block_hash)
+            previous = self._index[block_hash][3]
+            block_hash = previous if previous in heights else None
+        chain.reverse()
+        return heights, chain
+
+    def _raw_block(self, block_hash):
+        key = bytes.fromhex(block_hash)
+        if key not in self._index:
+            raise BitcoindException('Unknown block {}'.format(block_hash))
+        file_index, offset, length, _, _ = self._index[key]
+        return key, self._read(file_index, offset, length)
+
+    def getblock(self, block_hash):
+        """
+        Returns the block with the given hash as in getblock JSON with
+        verbosity 2.
+
+        :param str block_hash: the block hash
+        :return: block as JSON
+        :rtype: dict
+        """
+        key, data = self._raw_block(block_hash)
+        try:
+            block = parse_block(data, address_format=self._address_format)
+        except DeserializationException as exc:
+            raise BitcoindException('Cannot parse block {}: {}'.format(block_hash, exc))
+        self._add_position(key, block)
+        return block
+
+    def getblockheader(self, block_hash):
+        """
+        Returns the header of the block with the given hash.
+
+        :param str block_hash: the block hash
+        :return: header as JSON
+        :rtype: dict
+        """
+        key = bytes.fromhex(block_hash)
+        if key not in self._index:
+            raise BitcoindException('Unknown block {}'.format(block_hash))
+        file_index, offset = self._index[key][:2]
+        header = parse_block_header(self._read(file_index, offset, BLOCK_HEADER_SIZE))
+        self._add_position(key, header)
+        return header
+
+    def _add_position(self, key, block):
+        height = self._heights[key]
+        block['height'] = height
+        chain_index = height - self._base_height
+        if chain_index + 1 < len(self._chain) and self._chain[chain_index] == key:
+            block['nextblockhash'] = self._chain[chain_index + 1].hex()
+
+    def getblockcount(self):
+        """
+        Returns the height of the best chain tip.
+
+        :return: number of blocks in block chain
+        :rtype: int
+        """
+        return self._base_height + len(self._chain) - 1
+
+    def getblockhash(self, height):
+        """
+        Returns hash of block in best chain at given height.
+
+        :param int height: the block height
+        :return: block hash
+        :rtype: str
+        """
+        if not self._base_height <= height <= self.getblockcount():
+            raise BitcoindException('Block height {} out of range'.format(height))
+        return self._chain[height - self._base_height].hex()
+
+    def getblockhashes(self, start_height, end_height):
+        """
+        Returns the hashes of all blocks in best chain between the given
+        heights.
+
+        :param int start_height: first block height
+        :param int end_height: last block height
+        :return: list of block hashes in height order
+        :rtype: list
+        """
+        if end_height < start_height:
+            return []
+        self.getblockhash(start_height)
+        self.getblockhash(end_height)
+        return [block_hash.hex() for block_hash in
+                self._chain[start_height - self._base_height:end_height - self._base_height + 1]]
+
+    def getblockheaders(self, start_height, end_height):
+        """
+        Returns the headers of all blocks in best chain between the given
+        heights.
+
+        :param int start_height: first block height
+        :param int end_height: last block height
+        :return: list of headers as JSON in height order
+        :rtype: list
+        """
+        return [self.getblockheader(block_hash)
+                for block_hash in self.getblockhashes(start_height, end_height)]
+
+    def getinfo(self):
+        """
+        Returns an object containing state info.
+
+        :return: state info
+        :rtype: dict
+        """
+        return {'blocks': self.getblockcount(),
+                'bestblockhash': self._chain[-1].hex(),
+                'files': len(self._paths)}
+
+    def getrawtransaction(self, tx_id, verbose=1):
+        raise BitcoindException(
+            'Transaction {} cannot be looked up in block files'.format(tx_id))
+
+    def getrawtransactions(self, tx_ids, verbose=1):
+        raise BitcoindException('Transactions cannot be looked up in block files')
+
+    def close(self):
+        """
+        Unmaps all block files.
+        """
+        with self._lock:
+            for mapped in self._open_files.values():
+                mapped.close()
+            self._open_files.clear()
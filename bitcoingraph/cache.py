@@ -0,0 +1,99 @@
+"""
+cache
+
+Bounded caches for objects retrieved from Bitcoin Core.
+
+"""
+
+import collections
+import threading
+
+__author__ = 'Bernhard Haslhofer (bernhard.haslhofer@ait.ac.at)'
+__copyright__ = 'Copyright 2015, Bernhard Haslhofer'
+__license__ = "MIT"
+
+
+class LRUCache:
+    """
+    Thread-safe least recently used cache, bounded by the number of
+    entries, by the total size of the entries, or by both.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None):
+        """
+        Creates a cache.
+
+        :param int max_entries: maximum number of entries (None = unbounded)
+        :param int max_bytes: maximum total size of entries (None = unbounded)
+        :return: cache object
+        :rtype: LRUCache
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """
+        Returns the value cached for a key and marks it as recently used.
+
+        :param key: the key
+        :param default: value returned if the key is not cached
+        :return: the cached value
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=0):
+        """
+        Caches a value and evicts least recently used entries while the
+        cache exceeds its bounds.
+
+        :param key: the key
+        :param value: the value
+        :param int size: size of the value counted against max_bytes
+        """
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self._entries and (
+                    (self.max_entries is not None and len(self._entries) > self.max_entries) or
+                    (self.max_bytes is not None and self.bytes > self.max_bytes)):
+                self.bytes -= self._entries.popitem(last=False)[1][1]
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Removes all entries. Counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        :return: entries, bytes, hits, misses and evictions
+        :rtype: dict
+        """
+        return {'entries': len(self._entries), 'bytes': self.bytes, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
@@ -0,0 +1,61 @@
+"""
+codec
+
+JSON encoding and decoding of request and response bodies. orjson is
+used if it is installed, the json module of the standard library
+otherwise.
+
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+__author__ = 'Bernhard Haslhofer (bernhard.haslhofer@ait.ac.at)'
+__copyright__ = 'Copyright 2015, Bernhard Haslhofer'
+__license__ = "MIT"
+
+
+BACKEND = 'json' if orjson is None else 'orjson'
+
+
+def loads(data):
+    """
+    Decodes a JSON document.
+
+    Numbers are decoded as by the json module: integers as int and
+    decimals as the nearest float, so that values in BTC convert back to
+    the same satoshi amounts with both backends.
+
+    :param data: JSON document as bytes or str
+    :return: decoded document
+    :raises ValueError: if the document is not valid JSON
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson rejects integers beyond 64 bit, the json module does not
+            pass
+    return json.loads(data)
+
+
+def dumps(obj):
+    """
+    Encodes an object as JSON document.
+
+    :param obj: object consisting of dicts, lists, strings, numbers,
+        booleans and None
+    :return: JSON document encoded in UTF-8
+    :rtype: bytes
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # e.g. integers beyond 64 bit
+            pass
+    return json.dumps(obj).encode()
@@ -0,0 +1,250 @@
+"""
+columnar
+
+Typed columnar export of the entities and relationships written by
+CSVDumpWriter, for analyses that scan columns of the whole block chain
+without parsing CSV files. Requires numpy.
+
+A dataset is a directory with a subdirectory per table, holding one .npy
+file per column and chunk, and a meta.json file listing the tables, their
+columns and the number of rows of each chunk. Chunks are the row groups of
+a table: all columns of a chunk have the same number of rows, and chunks
+are written whenever a table has collected the configured number of rows.
+Chunks are not compressed, so that they are memory-mapped when read.
+
+"""
+
+import json
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from bitcoingraph.batch import to_satoshis
+
+__author__ = 'Bernhard Haslhofer (bernhard.haslhofer@ait.ac.at)'
+__copyright__ = 'Copyright 2015, Bernhard Haslhofer'
+__license__ = "MIT"
+
+
+# Number of rows of a table written as one chunk
+DEFAULT_CHUNK_ROWS = 1 << 20
+
+META_FILE = 'meta.json'
+
+# Columns of each table, as CSVDumpWriter writes them. Hashes are stored
+# as rows of 32 bytes (kind 'hash'), output references as txid and index,
+# values in satoshis and strings as fixed-width byte strings of the width
+# of the longest string of a chunk (kind 'str').
+SCHEMA = {
+    'blocks': [('hash', 'hash'), ('height', '<i8'), ('timestamp', '<i8'),
+               ('difficulty', '<f8')],
+    'transactions': [('txid', 'hash'), ('coinbase', '|b1')],
+    'outputs': [('txid', 'hash'), ('n', '<i4'), ('value', '<i8'), ('type', 'str')],
+    'addresses': [('address', 'str')],
+    'rel_block_tx': [('hash', 'hash'), ('txid', 'hash')],
+    'rel_block_block': [('hash', 'hash'), ('prevblockhash', 'hash')],
+    'rel_tx_output': [('txid', 'hash'), ('n', '<i4')],
+    'rel_input': [('txid', 'hash'), ('output_txid', 'hash'), ('output_n', '<i4')],
+    'rel_output_address': [('txid', 'hash'), ('n', '<i4'), ('address', 'str')],
+}
+
+
+def _to_array(kind, values):
+    if kind == 'hash':
+        return np.frombuffer(b''.join(values), dtype=np.uint8).reshape(-1, 32)
+    if kind == 'str':
+        return np.array([value.encode() for value in values], dtype=np.bytes_)
+    return np.array(values, dtype=kind)
+
+
+def _empty_array(kind):
+    if kind == 'hash':
+        return np.empty((0, 32), dtype=np.uint8)
+    if kind == 'str':
+        return np.empty(0, dtype='S1')
+    return np.empty(0, dtype=kind)
+
+
+def _chunk_path(path, table, column, chunk):
+    return os.path.join(path, table, '{}.{:06d}.npy'.format(column, chunk))
+
+
+def _read_meta(path):
+    with open(os.path.join(path, META_FILE)) as f:
+        return json.load(f)
+
+
+def to_hex(hashes):
+    """
+    Converts rows of a hash column to hex strings.
+
+    :param numpy.ndarray hashes: rows of 32 bytes
+    :rtype: list
+    """
+    return [row.tobytes().hex() for row in hashes]
+
+
+class ColumnarDumpWriter:
+    """
+    Writes blocks to a columnar dataset, with the rows CSVDumpWriter
+    writes to its CSV files. Writing to an existing dataset appends chunks
+    to its tables.
+
+    Rows are not deduplicated, i.e. addresses are written once per output
+    as in addresses.csv before it is sorted.
+    """
+
+    def __init__(self, output_path, chunk_rows=DEFAULT_CHUNK_ROWS):
+        if np is None:
+            raise ImportError('ColumnarDumpWriter requires numpy')
+        self._output_path = output_path
+        self._chunk_rows = chunk_rows
+        for table in SCHEMA:
+            os.makedirs(os.path.join(output_path, table), exist_ok=True)
+        if os.path.exists(os.path.join(output_path, META_FILE)):
+            self._chunks = {table: list(meta['chunks'])
+                            for table, meta in _read_meta(output_path)['tables'].items()}
+        else:
+            self._chunks = {table: [] for table in SCHEMA}
+        self._new_buffers()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        for table in SCHEMA:
+            self._flush(table)
+        self._write_meta()
+
+    def _new_buffers(self):
+        self._buffers = {table: [[] for _ in columns] for table, columns in SCHEMA.items()}
+
+    def _flush(self, table):
+        buffers = self._buffers[table]
+        if not buffers[0]:
+            return
+        chunk = len(self._chunks[table])
+        for (column, kind), values in zip(SCHEMA[table], buffers):
+            np.save(_chunk_path(self._output_path, table, column, chunk),
+                    _to_array(kind, values))
+        self._chunks[table].append(len(buffers[0]))
+        self._buffers[table] = [[] for _ in buffers]
+
+    def _write_meta(self):
+        meta = {'tables': {table: {'columns': [column for column, _ in columns],
+                                   'kinds': [kind for _, kind in columns],
+                                   'chunks': self._chunks[table]}
+                           for table, columns in SCHEMA.items()}}
+        path = os.path.join(self._output_path, META_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f, indent=1)
+        os.replace(path + '.tmp', path)
+
+    def write(self, block):
+        buffers = self._buffers
+        block_hash = bytes.fromhex(block.hash)
+        hashes, heights, timestamps, difficulties = buffers['blocks']
+        hashes.append(block_hash)
+        heights.append(block.height)
+        timestamps.append(block.timestamp)
+        difficulties.append(block.difficulty)
+        if block.has_previous_block():
+            hashes, previous_hashes = buffers['rel_block_block']
+            hashes.append(block_hash)
+            previous_hashes.append(bytes.fromhex(block.previous_block.hash))
+
+        tx_txids, tx_coinbase = buffers['transactions']
+        block_tx_hashes, block_tx_txids = buffers['rel_block_tx']
+        input_txids, input_output_txids, input_output_ns = buffers['rel_input']
+        output_txids, output_ns, output_values, output_types = buffers['outputs']
+        tx_output_txids, tx_output_ns = buffers['rel_tx_output']
+        (addresses,) = buffers['addresses']
+        output_address_txids, output_address_ns, output_addresses = buffers['rel_output_address']
+        for tx in block.transactions:
+            txid = bytes.fromhex(tx.txid)
+            coinbase = tx.is_coinbase()
+            tx_txids.append(txid)
+            tx_coinbase.append(coinbase)
+            block_tx_hashes.append(block_hash)
+            block_tx_txids.append(txid)
+            if not coinbase:
+                for input in tx.inputs:
+                    input_txids.append(txid)
+                    input_output_txids.append(bytes.fromhex(input.txid))
+                    input_output_ns.append(input.vout)
+            for output in tx.outputs:
+                output_txids.append(txid)
+                output_ns.append(output.index)
+                output_values.append(to_satoshis(output.value))
+                output_types.append(output.type)
+                tx_output_txids.append(txid)
+                tx_output_ns.append(output.index)
+                for address in output.addresses:
+                    addresses.append(address)
+                    output_address_txids.append(txid)
+                    output_address_ns.append(output.index)
+                    output_addresses.append(address)
+
+        for table, columns in buffers.items():
+            if len(columns[0]) >= self._chunk_rows:
+                self._flush(table)
+
+
+class ColumnarReader:
+    """
+    Reads the columns of a columnar dataset, memory-mapping their chunks.
+    """
+
+    def __init__(self, path):
+        if np is None:
+            raise ImportError('ColumnarReader requires numpy')
+        self._path = path
+        self._tables = _read_meta(path)['tables']
+
+    @property
+    def tables(self):
+        return list(self._tables)
+
+    def columns(self, table):
+        """
+        Returns the names of the columns of a table.
+
+        :param str table: name of the table, e.g. outputs
+        :rtype: list
+        """
+        return list(self._tables[table]['columns'])
+
+    def row_count(self, table):
+        return sum(self._tables[table]['chunks'])
+
+    def chunks(self, table, column):
+        """
+        Yields the chunks of a column as read-only memory-mapped arrays.
+
+        :param str table: name of the table
+        :param str column: name of the column
+        :rtype: generator
+        :raises KeyError: if the table or column does not exist
+        """
+        if column not in self._tables[table]['columns']:
+            raise KeyError(column)
+        for chunk in range(len(self._tables[table]['chunks'])):
+            yield np.load(_chunk_path(self._path, table, column, chunk), mmap_mode='r')
+
+    def column(self, table, column):
+        """
+        Returns a column as one array. The chunks are copied into memory,
+        so that large columns are better scanned chunk by chunk.
+
+        :param str table: name of the table
+        :param str column: name of the column
+        :rtype: numpy.ndarray
+        """
+        chunks = list(self.chunks(table, column))
+        if not chunks:
+            meta = self._tables[table]
+            return _empty_array(meta['kinds'][meta['columns'].index(column)])
+        return np.concatenate(chunks)
@@ -0,0 +1,209 @@
+"""
+dedup
+
+Memory-bounded set of the values written by an export, so that repeated
+addresses and transactions are skipped as they are written instead of
+being removed by sorting the files afterwards.
+
+Values are kept as 20-byte BLAKE2b digests. When the digests exceed the
+memory budget, they are spilled to a sorted run file on disk and added to
+a Bloom filter. A value missing from memory is looked up in the run files
+only if the Bloom filter may contain it. Run files of similar size are
+merged, so that their number grows logarithmically.
+
+"""
+
+import heapq
+import mmap
+import os
+import shutil
+import tempfile
+from hashlib import blake2b
+
+__author__ = 'Bernhard Haslhofer (bernhard.haslhofer@ait.ac.at)'
+__copyright__ = 'Copyright 2015, Bernhard Haslhofer'
+__license__ = "MIT"
+
+
+# Memory used by a set in bytes
+DEFAULT_MEMORY = 1 << 30
+
+DIGEST_SIZE = 20
+
+# Bytes a digest takes in a Python set, including the set slot
+ENTRY_SIZE = 90
+
+# Share of the memory used by the Bloom filter, and its number of hash
+# functions, which suits about 10 bits per spilled digest
+BLOOM_SHARE = 0.25
+BLOOM_HASHES = 7
+
+
+def digest(value):
+    """
+    Returns the 20-byte digest of a string by which a SeenSet identifies it.
+
+    :param str value: the string
+    :rtype: bytes
+    """
+    return blake2b(value.encode(), digest_size=DIGEST_SIZE).digest()
+
+
+class BloomFilter:
+    """
+    Bloom filter of digests, whose bit positions are derived from the
+    digests themselves.
+    """
+
+    def __init__(self, size):
+        self._bits = bytearray(max(size, 1))
+        self._size = len(self._bits) * 8
+
+    def _positions(self, value):
+        number = int.from_bytes(value, 'little')
+        first = number & 0xffffffffffffffff
+        second = (number >> 64) | 1
+        return [(first + i * second) % self._size for i in range(BLOOM_HASHES)]
+
+    def add(self, value):
+        bits = self._bits
+        for position in self._positions(value):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(value))
+
+
+class _Run:
+    # sorted digests in a file, searched through a memory map
+
+    def __init__(self, path, count):
+        self.path = path
+        self.count = count
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if count else b''
+
+    def __contains__(self, value):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = middle * DIGEST_SIZE
+            entry = self._map[offset:offset + DIGEST_SIZE]
+            if entry < value:
+                low = middle + 1
+            elif entry > value:
+                high = middle
+            else:
+                return True
+        return False
+
+    def __iter__(self):
+        for offset in range(0, self.count * DIGEST_SIZE, DIGEST_SIZE):
+            yield self._map[offset:offset + DIGEST_SIZE]
+
+    def close(self):
+        if self.count:
+            self._map.close()
+        self._file.close()
+        os.remove(self.path)
+
+
+class SeenSet:
+    """
+    Set of strings bounded by a memory budget, spilling to disk when the
+    budget is exceeded.
+
+    Strings are identified by their 20-byte digests, so that two strings
+    are taken for the same one with a probability that is negligible for
+    the number of addresses and transactions of the block chain.
+    """
+
+    def __init__(self, memory=DEFAULT_MEMORY, directory=None):
+        """
+        :param int memory: bytes used by the digests in memory and the
+            Bloom filter
+        :param str directory: directory of the temporary directory holding
+            the run files, the default temporary directory if None
+        """
+        self._capacity = max(int(memory * (1 - BLOOM_SHARE)) // ENTRY_SIZE, 1)
+        self._bloom = BloomFilter(int(memory * BLOOM_SHARE))
+        self._directory = directory
+        self._path = None
+        self._digests = set()
+        self._runs = []
+        self._files = 0
+        self.spills = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._digests) + sum(run.count for run in self._runs)
+
+    def add(self, value):
+        """
+        Adds a string to the set.
+
+        :param str value: the string
+        :return: whether the string has not been in the set before
+        :rtype: bool
+        """
+        key = blake2b(value.encode(), digest_size=DIGEST_SIZE).digest()
+        digests = self._digests
+        if key in digests:
+            return False
+        if self._runs and key in self._bloom and any(key in run for run in self._runs):
+            return False
+        digests.add(key)
+        if len(digests) >= self._capacity:
+            self._spill()
+        return True
+
+    def __contains__(self, value):
+        key = digest(value)
+        return key in self._digests or (
+            bool(self._runs) and key in self._bloom and any(key in run for run in self._runs))
+
+    def _new_path(self):
+        if self._path is None:
+            self._path = tempfile.mkdtemp(prefix='.seen_', dir=self._directory)
+        self._files += 1
+        return os.path.join(self._path, 'run_{}'.format(self._files))
+
+    def _write_run(self, digests, count):
+        path = self._new_path()
+        with open(path, 'wb') as f:
+            f.writelines(digests)
+        return _Run(path, count)
+
+    def _spill(self):
+        digests = sorted(self._digests)
+        for key in digests:
+            self._bloom.add(key)
+        self._runs.append(self._write_run(digests, len(digests)))
+        self._digests = set()
+        self.spills += 1
+        # merges runs of similar size, so that run sizes decrease geometrically
+        while len(self._runs) > 1 and self._runs[-2].count <= 2 * self._runs[-1].count:
+            first, second = self._runs[-2:]
+            run = self._write_run(heapq.merge(first, second), first.count + second.count)
+            first.close()
+            second.close()
+            self._runs[-2:] = [run]
+
+    def close(self):
+        """
+        Removes the run files.
+        """
+        for run in self._runs:
+            run.close()
+        self._runs = []
+        self._digests = set()
+        if self._path is not None:
+            shutil.rmtree(self._path, ignore_errors=True)
+            self._path = None
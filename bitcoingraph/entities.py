@@ -1,7 +1,10 @@
 import bisect
 import csv
+import gzip
 import os
 
+from bitcoingraph.extsort import DEFAULT_COMPRESSION_LEVEL
+
 
 class Address:
 
@@ -61,9 +64,9 @@ class AddressList:
         index = bisect.bisect_left(self.addresses, Address(address_string))
         return self.addresses[index]
 
-    def export(self, path):
-        with open(os.path.join(path, 'entities.csv'), 'w') as entity_csv_file, \
-                open(os.path.join(path, 'rel_address_entity.csv'), 'w') as entity_rel_csv_file:
+    def export(self, path, extension='.csv'):
+        with open_csv(path, 'entities' + extension, 'w') as entity_csv_file, \
+                open_csv(path, 'rel_address_entity' + extension, 'w') as entity_rel_csv_file:
             entity_writer = csv.writer(entity_csv_file)
             entity_rel_writer = csv.writer(entity_rel_csv_file)
             entity_writer.writerow(['id:ID(Entity)'])
@@ -82,13 +85,14 @@ class AddressList:
 def compute_entities(input_path):
     address_list = AddressList()
     print('reading addresses')
-    with open(os.path.join(input_path, 'addresses.csv'), 'r') as address_file:
+    addresses_filename = csv_filename(input_path, 'addresses')
+    with open_csv(input_path, addresses_filename, 'r') as address_file:
         for line in address_file:
             line = line.strip()
             address_list.add(line)
     print('reading inputs')
     input_counter = 0
-    with open(os.path.join(input_path, 'input_addresses.csv'), 'r') as input_file:
+    with open_csv(input_path, csv_filename(input_path, 'input_addresses'), 'r') as input_file:
         input_addresses = set()
         transaction = None
         for line in input_file:
@@ -105,18 +109,46 @@ def compute_entities(input_path):
                 print('processed inputs:', input_counter)
         address_list.group(input_addresses)
     print('write to file')
-    address_list.export(input_path)
+    address_list.export(input_path, _extension(addresses_filename))
+
+
+def csv_filename(input_path, base_name):
+    """
+    Returns the name of an exported file, which is compressed if a .csv.gz
+    file exists.
+
+    :param str input_path: directory of the exported files
+    :param str base_name: name of the file without extension
+    """
+    filename = base_name + '.csv'
+    if os.path.exists(os.path.join(input_path, filename + '.gz')):
+        return filename + '.gz'
+    return filename
+
+
+def _extension(filename):
+    return '.csv.gz' if filename.endswith('.gz') else '.csv'
 
 
-def open_csv(input_path, base_name, mode):
-    return open(os.path.join(input_path, base_name + '.csv'), mode, newline='')
+def open_csv(input_path, filename, mode):
+    """
+    Opens a CSV file in text mode, decompressing or compressing a .gz file
+    while it is read or written.
+    """
+    path = os.path.join(input_path, filename)
+    if filename.endswith('.gz'):
+        return gzip.open(path, mode + 't', compresslevel=DEFAULT_COMPRESSION_LEVEL, newline='')
+    return open(path, mode, newline='')
 
 
 def calculate_input_addresses(input_path):
     print('calculating input addresses')
-    with open_csv(input_path, 'rel_input', 'r') as input_file, \
-            open_csv(input_path, 'rel_output_address', 'r') as output_address_file, \
-            open_csv(input_path, 'input_addresses', 'w') as input_addresses_file:
+    input_filename = csv_filename(input_path, 'rel_input')
+    with open_csv(input_path, input_filename, 'r') as input_file, \
+            open_csv(input_path, csv_filename(input_path, 'rel_output_address'),
+                     'r') as output_address_file, \
+            open_csv(input_path, 'input_addresses' + _extension(input_filename),
+                     'w') as input_addresses_file:
         input_reader = csv.reader(input_file)
         output_address_reader = csv.reader(output_address_file)
         input_address_writer = csv.writer(input_addresses_file)
@@ -0,0 +1,281 @@
+"""
+extsort
+
+External merge sort of text files, ordering lines by their bytes as GNU
+sort does with LC_ALL=C. Chunks of a file that fit the memory budget are
+sorted into run files by a pool of processes, and the runs are merged
+with a k-way heap merge. Files ending in .gz are decompressed while they
+are read and compressed while they are written.
+
+Lines are compared without their line feed. With a key field, lines are
+compared by the key, from the start of that field to the end of the line
+as with sort -k N -t SEPARATOR, and lines with equal keys by their bytes.
+With unique, only the first of the lines with equal keys is written, as
+with sort -u.
+
+"""
+
+import gzip
+import heapq
+import itertools
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+__author__ = 'Bernhard Haslhofer (bernhard.haslhofer@ait.ac.at)'
+__copyright__ = 'Copyright 2015, Bernhard Haslhofer'
+__license__ = "MIT"
+
+
+# Bytes of memory used by the lines being sorted
+DEFAULT_MEMORY = 1 << 30
+
+# Number of processes sorting chunks
+DEFAULT_WORKERS = 4
+
+# Level of the gzip compression of sorted .gz files
+DEFAULT_COMPRESSION_LEVEL = 6
+
+# Bytes of memory taken by the lines and keys of a chunk per byte of the
+# chunk
+MEMORY_PER_BYTE = 4
+
+# Number of runs merged at once, more runs are merged in several passes
+MAX_FAN_IN = 64
+
+BUFFER_SIZE = 1 << 20
+
+# Number of lines joined before they are written
+WRITE_BATCH = 1 << 16
+
+
+def _open(path, mode, compresslevel=None):
+    if path.endswith('.gz'):
+        if compresslevel is None:
+            compresslevel = DEFAULT_COMPRESSION_LEVEL
+        return gzip.open(path, mode, compresslevel=compresslevel)
+    return open(path, mode, buffering=BUFFER_SIZE)
+
+
+def _key_function(unique, key, separator):
+    # None sorts whole lines, which is faster than any key function
+    if key is None:
+        return None
+    separator = separator.encode()
+    splits = key - 1
+
+    def field(line):
+        fields = line.split(separator, splits)
+        return fields[splits] if len(fields) == key else b''
+
+    if unique:
+        return field
+    return lambda line: (field(line), line)
+
+
+def _split_lines(data):
+    lines = data.split(b'\n')
+    if lines[-1] == b'':
+        lines.pop()
+    return lines
+
+
+def _sorted_lines(lines, unique, key, separator):
+    key_function = _key_function(unique, key, separator)
+    if key_function is None:
+        return sorted(set(lines)) if unique else sorted(lines)
+    lines = sorted(lines, key=key_function)
+    if unique:
+        return list(_unique(lines, key_function))
+    return lines
+
+
+def _unique(lines, key_function):
+    last = None
+    for line in lines:
+        line_key = line if key_function is None else key_function(line)
+        if line_key != last:
+            last = line_key
+            yield line
+
+
+def _write_lines(path, lines, compresslevel=None):
+    lines = iter(lines)
+    with _open(path, 'wb', compresslevel) as f:
+        while True:
+            batch = list(itertools.islice(lines, WRITE_BATCH))
+            if not batch:
+                return
+            batch.append(b'')
+            f.write(b'\n'.join(batch))
+
+
+def _sort_run(path, start, end, run_path, unique, key, separator):
+    # sorts the lines from offset start to end of a file into a run file
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    _write_lines(run_path, _sorted_lines(_split_lines(data), unique, key, separator))
+    return run_path
+
+
+def _sort_data_run(data, run_path, unique, key, separator):
+    _write_lines(run_path, _sorted_lines(_split_lines(data), unique, key, separator))
+    return run_path
+
+
+def _chunks(path, chunk_size):
+    # offsets of chunks of a plain file ending after a line feed
+    size = os.path.getsize(path)
+    chunks = []
+    start = 0
+    with open(path, 'rb') as f:
+        while start < size:
+            f.seek(min(start + chunk_size, size))
+            f.readline()
+            end = min(f.tell(), size)
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def _read_chunks(f, chunk_size):
+    # chunks of a compressed file ending after a line feed
+    while True:
+        data = f.read(chunk_size)
+        if not data:
+            return
+        yield data + f.readline()
+
+
+def _read_run(path):
+    with open(path, 'rb', buffering=BUFFER_SIZE) as f:
+        for line in f:
+            yield line[:-1] if line.endswith(b'\n') else line
+
+
+def _read_sorted(path):
+    with _open(path, 'rb') as f:
+        for line in f:
+            yield line[:-1] if line.endswith(b'\n') else line
+
+
+def _merge(readers, output_path, unique, key, separator, compresslevel=None):
+    key_function = _key_function(unique, key, separator)
+    lines = heapq.merge(*readers, key=key_function)
+    if unique:
+        lines = _unique(lines, key_function)
+    _write_lines(output_path, lines, compresslevel)
+
+
+def _merge_runs(run_paths, output_path, unique, key, separator, compresslevel, temp_path):
+    # merges runs in passes of at most MAX_FAN_IN runs, keeping their order,
+    # so that lines with equal keys stay in the order of the input
+    passes = 0
+    while len(run_paths) > MAX_FAN_IN:
+        merged_paths = []
+        for index in range(0, len(run_paths), MAX_FAN_IN):
+            merged_path = os.path.join(temp_path, 'merged_{}_{}'.format(passes, index))
+            group = run_paths[index:index + MAX_FAN_IN]
+            _merge([_read_run(run_path) for run_path in group], merged_path,
+                   unique, key, separator)
+            for run_path in group:
+                os.remove(run_path)
+            merged_paths.append(merged_path)
+        run_paths = merged_paths
+        passes += 1
+    _merge([_read_run(run_path) for run_path in run_paths], output_path,
+           unique, key, separator, compresslevel)
+
+
+def sort_file(input_path, output_path=None, unique=False, key=None, separator=',',
+              memory=DEFAULT_MEMORY, temp_dir=None, workers=DEFAULT_WORKERS,
+              compresslevel=None):
+    """
+    Sorts the lines of a file.
+
+    :param str input_path: file to sort
+    :param str output_path: sorted file, input_path if None
+    :param bool unique: write only the first of lines with equal keys
+    :param int key: field at which the keys of lines start, 1 for the
+        first field, whole lines if None
+    :param str separator: separator of the fields
+    :param int memory: bytes of memory used for sorting
+    :param str temp_dir: directory of the temporary directory holding the
+        runs, the default temporary directory if None
+    :param int workers: number of processes sorting runs
+    :param int compresslevel: level of the compression of a .gz output
+    """
+    if output_path is None:
+        output_path = input_path
+    chunk_size = max(memory // (MEMORY_PER_BYTE * max(workers, 1)), 1)
+    compressed = input_path.endswith('.gz')
+    # a file that fits the memory budget is sorted by this process
+    with _open(input_path, 'rb') as f:
+        data = f.read(chunk_size * max(workers, 1))
+        fits = not (f.peek(1) if compressed else f.read(1))
+    if fits:
+        lines = _sorted_lines(_split_lines(data), unique, key, separator)
+        del data
+        _replace(output_path, lambda path: _write_lines(path, lines, compresslevel))
+        return
+    del data
+
+    temp_path = tempfile.mkdtemp(prefix='sort_', dir=temp_dir)
+    try:
+        with ProcessPoolExecutor(workers, mp_context=get_context('spawn')) as executor:
+            if compressed:
+                futures = []
+                with _open(input_path, 'rb') as f:
+                    for index, data in enumerate(_read_chunks(f, chunk_size)):
+                        # at most one chunk per worker waits in memory
+                        if len(futures) >= workers:
+                            futures[len(futures) - workers].result()
+                        futures.append(executor.submit(
+                            _sort_data_run, data, os.path.join(temp_path, 'run_{}'.format(index)),
+                            unique, key, separator))
+            else:
+                futures = [executor.submit(_sort_run, input_path, start, end,
+                                           os.path.join(temp_path, 'run_{}'.format(index)),
+                                           unique, key, separator)
+                           for index, (start, end) in enumerate(_chunks(input_path, chunk_size))]
+            run_paths = [future.result() for future in futures]
+        _replace(output_path, lambda path: _merge_runs(
+            run_paths, path, unique, key, separator, compresslevel, temp_path))
+    finally:
+        shutil.rmtree(temp_path, ignore_errors=True)
+
+
+def merge_files(input_paths, output_path, unique=False, key=None, separator=',',
+                compresslevel=None):
+    """
+    Merges sorted files into a sorted file, which may be one of the input
+    files. Lines with equal keys are written in the order of the files.
+
+    :param list input_paths: sorted files
+    :param str output_path: merged file
+    :param bool unique: write only the first of lines with equal keys
+    :param int key: field at which the keys of lines start, whole lines
+        if None
+    :param str separator: separator of the fields
+    :param int compresslevel: level of the compression of a .gz output
+    """
+    _replace(output_path, lambda path: _merge(
+        [_read_sorted(input_path) for input_path in input_paths], path,
+        unique, key, separator, compresslevel))
+
+
+def _replace(path, write):
+    # writes a temporary file that replaces path, which may be an input
+    temp_path = path + '.tmp'
+    if path.endswith('.gz'):
+        temp_path = path[:-3] + '.tmp.gz'
+    try:
+        write(temp_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.replace(temp_path, path)
@@ -0,0 +1,280 @@
+"""
+headers
+
+Local store of the best chain's block headers, used to answer height,
+hash and timestamp lookups without requests to Bitcoin Core.
+
+"""
+
+import bisect
+import mmap
+import os
+import struct
+import threading
+
+from bitcoingraph.bitcoind import BitcoindException
+
+__author__ = 'Bernhard Haslhofer (bernhard.haslhofer@ait.ac.at)'
+__copyright__ = 'Copyright 2015, Bernhard Haslhofer'
+__license__ = "MIT"
+
+
+# hash, previous block hash, time, maximum time up to the block, difficulty
+_RECORD = struct.Struct('<32s32sIId')
+RECORD_SIZE = _RECORD.size
+
+# Number of headers requested per step when synchronising
+SYNC_BATCH_SIZE = 2000
+
+
+class HeaderStoreException(Exception):
+    """
+    Exception raised when headers do not extend the stored chain.
+    """
+    pass
+
+
+class _MaxTimes:
+    # sequence view of the running maximum timestamps, for bisect
+
+    def __init__(self, store):
+        self._store = store
+
+    def __len__(self):
+        return len(self._store)
+
+    def __getitem__(self, height):
+        return self._store._record(height)[3]
+
+
+class HeaderStore:
+    """
+    File of fixed-width header records of the best chain, indexed by
+    height and memory-mapped for reading.
+
+    Each record holds hash, previous block hash, timestamp, difficulty and
+    the maximum timestamp of all blocks up to it. As block timestamps are
+    not monotonic, the latter is used to search blocks by time. Blocks are
+    looked up by hash through an index built in memory on first use.
+    """
+
+    def __init__(self, path):
+        """
+        Opens or creates a header store.
+
+        :param str path: path of the header file
+        :return: header store
+        :rtype: HeaderStore
+        """
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._file = os.fdopen(fd, 'r+b')
+        self._lock = threading.RLock()
+        self._mmap = None
+        self._heights = None
+        size = os.fstat(self._file.fileno()).st_size
+        # drop a record left incomplete by an interrupted write
+        self._count = size // RECORD_SIZE
+        if size % RECORD_SIZE:
+            self._file.truncate(self._count * RECORD_SIZE)
+        self._remap()
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def tip_height(self):
+        """
+        Height of the last stored header, -1 if the store is empty.
+        """
+        return self._count - 1
+
+    def _remap(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._count:
+            self._mmap = mmap.mmap(self._file.fileno(), self._count * RECORD_SIZE,
+                                   access=mmap.ACCESS_READ)
+
+    def _record(self, height):
+        return _RECORD.unpack_from(self._mmap, height * RECORD_SIZE)
+
+    def get(self, height):
+        """
+        Returns a stored header.
+
+        :param int height: block height
+        :return: header with hash, height, time, difficulty,
+            previousblockhash and, unless it is the last stored header,
+            nextblockhash, or None if the height is not stored
+        :rtype: dict
+        """
+        with self._lock:
+            if not 0 <= height < self._count:
+                return None
+            block_hash, previous, time, _, difficulty = self._record(height)
+            header = {'hash': block_hash.hex(), 'height': height, 'time': time,
+                      'difficulty': difficulty}
+            if height > 0:
+                header['previousblockhash'] = previous.hex()
+            if height + 1 < self._count:
+                header['nextblockhash'] = self._record(height + 1)[0].hex()
+            return header
+
+    def get_hash(self, height):
+        """
+        Returns the hash of the block at a given height.
+
+        :param int height: block height
+        :return: block hash, or None if the height is not stored
+        :rtype: str
+        """
+        with self._lock:
+            if not 0 <= height < self._count:
+                return None
+            return self._record(height)[0].hex()
+
+    def get_hashes(self, start_height, end_height):
+        """
+        Returns the hashes of the blocks in a given range.
+
+        :param int start_height: first block height
+        :param int end_height: last block height
+        :return: block hashes in height order, or None if the range is not
+            stored completely
+        :rtype: list
+        """
+        with self._lock:
+            if start_height < 0 or end_height >= self._count:
+                return None
+            return [self._record(height)[0].hex()
+                    for height in range(start_height, end_height + 1)]
+
+    def get_height(self, block_hash):
+        """
+        Returns the height of a block.
+
+        :param str block_hash: block hash
+        :return: block height, or None if the block is not stored
+        :rtype: int
+        """
+        key = bytes.fromhex(block_hash)
+        with self._lock:
+            if self._heights is None:
+                self._heights = {}
+                for height in range(self._count):
+                    self._heights[self._record(height)[0][-8:]] = height
+            height = self._heights.get(key[-8:])
+            if height is None or height >= self._count or self._record(height)[0] != key:
+                return None
+            return height
+
+    def get_height_at_time(self, timestamp):
+        """
+        Returns the height of the first block with a timestamp at or after
+        the given one.
+
+        :param int timestamp: Unix timestamp
+        :return: block height, or the number of stored headers if all
+            blocks are older
+        :rtype: int
+        """
+        with self._lock:
+            return bisect.bisect_left(_MaxTimes(self), timestamp)
+
+    def append(self, headers):
+        """
+        Appends headers to the stored chain.
+
+        :param headers: headers as JSON in height order, the first at the
+            height following the last stored header
+        :raises HeaderStoreException: if the headers do not extend the chain
+        """
+        with self._lock:
+            height = self._count
+            if height:
+                previous, _, _, max_time, _ = self._record(height - 1)
+            else:
+                previous, max_time = bytes(32), 0
+            records = []
+            for header in headers:
+                if header['height'] != height or \
+                        bytes.fromhex(header.get('previousblockhash', '00' * 32)) != previous:
+                    raise HeaderStoreException(
+                        'Header {} does not extend the stored chain'.format(header['hash']))
+                block_hash = bytes.fromhex(header['hash'])
+                max_time = max(max_time, header['time'])
+                records.append(_RECORD.pack(block_hash, previous, header['time'], max_time,
+                                            header['difficulty']))
+                previous = block_hash
+                height += 1
+            self._file.seek(self._count * RECORD_SIZE)
+            self._file.write(b''.join(records))
+            self._file.flush()
+            if self._heights is not None:
+                for offset, record in enumerate(records):
+                    self._heights[record[24:32]] = self._count + offset
+            self._count = height
+            self._remap()
+
+    def truncate(self, height):
+        """
+        Removes the headers from a given height on.
+
+        :param int height: first block height to remove
+        """
+        with self._lock:
+            if height >= self._count:
+                return
+            self._count = max(height, 0)
+            self._heights = None
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            self._file.truncate(self._count * RECORD_SIZE)
+            self._file.flush()
+            self._remap()
+
+    def sync(self, bitcoin_proxy, batch_size=SYNC_BATCH_SIZE):
+        """
+        Brings the store up to the best chain of a node. Stored headers of
+        blocks that are no longer in the best chain are removed first.
+
+        :param BitcoinProxy bitcoin_proxy: proxy to the node
+        :param int batch_size: number of headers requested at once
+        :return: number of headers added
+        :rtype: int
+        :raises BitcoindException: if headers cannot be retrieved
+        """
+        with self._lock:
+            added = 0
+            while True:
+                height = self._count - 1
+                while height >= 0 and bitcoin_proxy.getblockhash(height) != self.get_hash(height):
+                    height -= 1
+                self.truncate(height + 1)
+                tip = bitcoin_proxy.getblockcount()
+                try:
+                    while self._count <= tip:
+                        end = min(self._count + batch_size - 1, tip)
+                        headers = bitcoin_proxy.getblockheaders(self._count, end)
+                        if not headers:
+                            break
+                        self.append(headers)
+                        added += len(headers)
+                except HeaderStoreException:
+                    # the best chain changed while synchronising
+                    continue
+                except (KeyError, TypeError, ValueError) as exc:
+                    raise BitcoindException('Invalid block header: {}'.format(exc))
+                return added
+
+    def close(self):
+        """
+        Unmaps and closes the header file.
+        """
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            self._file.close()
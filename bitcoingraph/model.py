@@ -1,9 +1,15 @@
 
+import sys
+
 from bitcoingraph.helper import to_time
 
 
 class Block:
 
+    __slots__ = ('_blockchain', '__hash', '__height', '__timestamp', '__difficulty',
+                 '__has_previous_block', '__previous_block', '__has_next_block',
+                 '__next_block', '__transactions')
+
     def __init__(self, blockchain, hash=None, height=None, json_data=None):
         self._blockchain = blockchain
         if json_data is None:
@@ -15,50 +21,58 @@ class Block:
             self.__transactions = None
             self.__difficulty = None
         else:
-            self.__hash = json_data['hash']
-            self.__height = json_data['height']
-            self.__timestamp = json_data['time']
-            self.__difficulty = json_data['difficulty']
-            if 'previousblockhash' in json_data:
-                self.__has_previous_block = True
-                self.__previous_block = Block(blockchain, json_data['previousblockhash'],
-                                              self.height - 1)
+            self._set_header(json_data)
+            # headers without transactions leave them to be loaded lazily
+            if 'tx' in json_data:
+                self.__transactions = [
+                    Transaction(blockchain, self, tx) if isinstance(tx, str)
+                    else Transaction(blockchain, self, json_data=tx)
+                    for tx in json_data['tx']]
             else:
-                self.__has_previous_block = False
-                self.__previous_block = None
-            if 'nextblockhash' in json_data:
-                self.__has_next_block = True
-                self.__next_block = Block(blockchain, json_data['nextblockhash'], self.height + 1)
-            else:
-                self.__has_next_block = False
-                self.__next_block = None
-            self.__transactions = [
-                Transaction(blockchain, self, tx) if isinstance(tx, str)
-                else Transaction(blockchain, self, json_data=tx)
-                for tx in json_data['tx']]
+                self.__transactions = None
+
+    def _set_header(self, json_data):
+        self.__hash = json_data['hash']
+        self.__height = json_data['height']
+        self.__timestamp = json_data['time']
+        self.__difficulty = json_data['difficulty']
+        if 'previousblockhash' in json_data:
+            self.__has_previous_block = True
+            self.__previous_block = Block(self._blockchain, json_data['previousblockhash'],
+                                          self.__height - 1)
+        else:
+            self.__has_previous_block = False
+            self.__previous_block = None
+        if 'nextblockhash' in json_data:
+            self.__has_next_block = True
+            self.__next_block = Block(self._blockchain, json_data['nextblockhash'],
+                                      self.__height + 1)
+        else:
+            self.__has_next_block = False
+            self.__next_block = None
 
     @property
     def hash(self):
         if self.__hash is None:
-            self._load()
+            self._load_header()
         return self.__hash
 
     @property
     def height(self):
         if self.__height is None:
-            self._load()
+            self._load_header()
         return self.__height
 
     @property
     def timestamp(self):
         if self.__timestamp is None:
-            self._load()
+            self._load_header()
         return self.__timestamp
 
     @property
     def difficulty(self):
         if self.__difficulty is None:
-            self._load()
+            self._load_header()
         return self.__difficulty
 
     def formatted_time(self):
@@ -71,7 +85,7 @@ class Block:
 
     def has_previous_block(self):
         if self.__has_previous_block is None:
-            self._load()
+            self._load_header()
         return self.__has_previous_block
 
     @property
@@ -81,7 +95,13 @@ class Block:
 
     def has_next_block(self):
         if self.__has_next_block is None:
-            self._load()
+            self._load_header()
+        if self.__has_next_block is None:
+            # the successor of the last stored header is looked up with
+            # the node's header of this block, not the whole block
+            header = self._blockchain.get_block_header(self.__hash)
+            self.__has_next_block = header.has_next_block()
+            self.__next_block = header.next_block
         return self.__has_next_block
 
     @property
@@ -90,6 +110,19 @@ class Block:
             self._load()
         return self.__transactions
 
+    def prefetch_inputs(self):
+        self._blockchain.prefetch_inputs(self.transactions)
+
+    def _load_header(self):
+        header = self._blockchain.lookup_header(self.__hash, self.__height)
+        if header is None:
+            self._load()
+        else:
+            self._set_header(header)
+            if 'nextblockhash' not in header:
+                # the following block may not be stored locally yet
+                self.__has_next_block = None
+
     def _load(self):
         if self.__hash is None:
             block = self._blockchain.get_block_by_height(self.__height)
@@ -108,6 +141,8 @@ class Block:
 
 class Transaction:
 
+    __slots__ = ('_blockchain', 'block', 'txid', '__inputs', '__outputs')
+
     def __init__(self, blockchain, block=None, txid=None, json_data=None):
         self._blockchain = blockchain
         self.block = block
@@ -121,7 +156,8 @@ class Transaction:
                 self.block = Block(blockchain, json_data['blockhash'])
             self.__inputs = [
                 Input(blockchain, is_coinbase=True) if 'coinbase' in vin
-                else Input(blockchain, vin)
+                else Input(blockchain, txid=vin['txid'], vout=vin['vout'],
+                           prevout=vin.get('prevout'))
                 for vin in json_data['vin']]
             self.__outputs = [Output(self, i, vout) for i, vout in enumerate(json_data['vout'])]
 
@@ -194,11 +230,28 @@ class Transaction:
 
 class Input:
 
-    def __init__(self, blockchain, output_reference=None, is_coinbase=False):
+    __slots__ = ('_blockchain', 'txid', 'vout', 'is_coinbase', '__output')
+
+    def __init__(self, blockchain, output_reference=None, is_coinbase=False, txid=None, vout=None,
+                 prevout=None):
         self._blockchain = blockchain
-        self.output_reference = output_reference
+        if output_reference is not None:
+            txid = output_reference['txid']
+            vout = output_reference['vout']
+        self.txid = txid
+        self.vout = vout
         self.is_coinbase = is_coinbase
-        self.__output = None
+        # spent output as returned inline by getblock with verbosity 3
+        if prevout is None:
+            self.__output = None
+        else:
+            self.__output = Output(Transaction(blockchain, txid=txid), vout, prevout)
+
+    @property
+    def output_reference(self):
+        if self.txid is None:
+            return None
+        return {'txid': self.txid, 'vout': self.vout}
 
     @property
     def output(self):
@@ -208,20 +261,31 @@ class Input:
             self._load()
         return self.__output
 
+    @output.setter
+    def output(self, output):
+        self.__output = output
+
+    def is_resolved(self):
+        return self.is_coinbase or self.__output is not None
+
     def _load(self):
-        transaction = self._blockchain.get_transaction(self.output_reference['txid'])
-        self.__output = transaction.outputs[self.output_reference['vout']]
+        self.__output = self._blockchain.get_output(self.txid, self.vout)
 
 
 class Output:
 
+    __slots__ = ('transaction', 'index', 'value', 'type', 'addresses')
+
     def __init__(self, transaction, index, json_data):
         self.transaction = transaction
         self.index = index
         self.value = json_data['value']
-        self.type = json_data['scriptPubKey']['type']
+        self.type = sys.intern(json_data['scriptPubKey']['type'])
         if 'addresses' in json_data['scriptPubKey']:
             self.addresses = json_data['scriptPubKey']['addresses']
+        # Bitcoin Core 22 and later return a single address
+        elif 'address' in json_data['scriptPubKey']:
+            self.addresses = [json_data['scriptPubKey']['address']]
         # Check if scriptPubKey.type indicates P2PK transaction, we then extract the pubkey as address from asm object
         # which is in the format of '<pubkey> OP_CHECKSIG'
         elif json_data['scriptPubKey']['type'] == 'pubkey':
@@ -1,8 +1,12 @@
 
 import json
 import requests
+import time
 from datetime import date, datetime, timezone
 
+from bitcoingraph import codec
+from bitcoingraph.stats import GLOBAL_STATS
+
 
 def lb_join(*lines):
     return '\n'.join(lines)
@@ -19,7 +23,7 @@ class Neo4jException(Exception):
 
 class Neo4jController:
 
-    def __init__(self, host, port, user, password):
+    def __init__(self, host, port, user, password, stats=None):
         self.host = host
         self.port = port
         self.user = user
@@ -32,6 +36,7 @@ class Neo4jController:
             'max-execution-time': 30000
         }
         self._session = requests.Session()
+        self.stats = GLOBAL_STATS if stats is None else stats
 
     address_match = lb_join(
         'MATCH (a:Address {address: {address}})<-[:USES]-(o),',
@@ -270,10 +275,18 @@ class Neo4jController:
         statement_json = {'statement': statement}
         if parameters is not None:
             statement_json['parameters'] = parameters
-        payload = {'statements': [statement_json]}
-        r = self._session.post(self.url, auth=(self.user, self.password),
-                               headers=self.headers, json=payload)
-        result = r.json()
+        payload = codec.dumps({'statements': [statement_json]})
+        start = time.perf_counter()
+        try:
+            r = self._session.post(self.url, auth=(self.user, self.password),
+                                   headers=self.headers, data=payload)
+        except requests.exceptions.ConnectionError:
+            self.stats.record('neo4j', 'query', time.perf_counter() - start, len(payload),
+                              error=True)
+            raise
+        result = codec.loads(r.content)
+        self.stats.record('neo4j', 'query', time.perf_counter() - start, len(payload),
+                          len(r.content), error=bool(result['errors']))
         if result['errors']:
             raise Neo4jException(result['errors'][0]['message'])
         #print(result)
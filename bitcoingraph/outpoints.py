@@ -0,0 +1,132 @@
+"""
+outpoints
+
+Persistent index of transaction outputs, used to resolve the outputs
+spent by inputs without requesting their transactions from Bitcoin Core.
+
+"""
+
+import sqlite3
+import threading
+
+__author__ = 'Bernhard Haslhofer (bernhard.haslhofer@ait.ac.at)'
+__copyright__ = 'Copyright 2015, Bernhard Haslhofer'
+__license__ = "MIT"
+
+
+# Number of blocks added between two commits
+DEFAULT_COMMIT_INTERVAL = 100
+
+
+class OutpointIndex:
+    """
+    On-disk index of transaction outputs backed by SQLite.
+
+    Outputs are keyed by txid_n, the output identifier used in the CSV
+    export, and hold value, type and addresses. The index is built
+    incrementally from blocks. If pruning is enabled, outputs are removed
+    once they are spent, so that the index stays the size of the UTXO set.
+    """
+
+    def __init__(self, path, prune=True, commit_interval=DEFAULT_COMMIT_INTERVAL):
+        """
+        Opens or creates an index.
+
+        :param str path: path of the SQLite database file
+        :param bool prune: remove outputs once they are spent
+        :param int commit_interval: number of blocks added between commits
+        :return: outpoint index
+        :rtype: OutpointIndex
+        """
+        self.prune = prune
+        self.commit_interval = commit_interval
+        self._pending_blocks = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS outputs ('
+            'txid_n TEXT PRIMARY KEY, value REAL, type TEXT, addresses TEXT) WITHOUT ROWID')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER)')
+        self._connection.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT count(*) FROM outputs').fetchone()[0]
+
+    @property
+    def height(self):
+        """
+        Height of the last block added, or None if the index is empty.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM state WHERE key = 'height'").fetchone()
+        return None if row is None else row[0]
+
+    def add_block(self, block):
+        """
+        Adds the outputs created in a block and, if pruning is enabled,
+        removes the outputs spent in it.
+
+        :param Block block: the block
+        """
+        outputs = []
+        spent = []
+        for tx in block.transactions:
+            if self.prune and not tx.is_coinbase():
+                spent.extend(('{}_{}'.format(input.txid, input.vout),)
+                             for input in tx.inputs)
+            prefix = tx.txid + '_'
+            outputs.extend((prefix + str(output.index), output.value, output.type,
+                            ' '.join(output.addresses))
+                           for output in tx.outputs)
+        with self._lock:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?)', outputs)
+            self._connection.executemany('DELETE FROM outputs WHERE txid_n = ?', spent)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO state VALUES ('height', ?)", (block.height,))
+            self._pending_blocks += 1
+            if self._pending_blocks >= self.commit_interval:
+                self._commit()
+
+    def get(self, txid, n):
+        """
+        Returns an indexed output.
+
+        :param str txid: id of the transaction creating the output
+        :param int n: index of the output
+        :return: value, type and list of addresses, or None if the output
+            is not indexed
+        :rtype: tuple
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT value, type, addresses FROM outputs WHERE txid_n = ?',
+                ('{}_{}'.format(txid, n),)).fetchone()
+        if row is None:
+            return None
+        value, output_type, addresses = row
+        return value, output_type, addresses.split(' ') if addresses else []
+
+    def commit(self):
+        """
+        Writes outstanding changes to disk.
+        """
+        with self._lock:
+            self._commit()
+
+    def _commit(self):
+        self._connection.commit()
+        self._pending_blocks = 0
+
+    def close(self):
+        """
+        Commits outstanding changes and closes the index.
+        """
+        with self._lock:
+            self._commit()
+            self._connection.close()
@@ -0,0 +1,419 @@
+"""
+serialization
+
+Parser for the consensus serialization of blocks and transactions as
+served by the Bitcoin Core REST interface (block/<hash>.bin) and stored in
+its blk*.dat files. Parsed blocks and transactions have the same shape as
+the JSON returned by getblock and getrawtransaction, so that they can be
+turned into the regular model objects.
+
+"""
+
+import collections
+import hashlib
+import struct
+
+__author__ = 'Bernhard Haslhofer (bernhard.haslhofer@ait.ac.at)'
+__copyright__ = 'Copyright 2015, Bernhard Haslhofer'
+__license__ = "MIT"
+
+
+BLOCK_HEADER_SIZE = 80
+NULL_HASH = bytes(32)
+COIN = 100000000
+
+# Address encoding of a network: Base58Check versions of pay-to-pubkey-hash
+# and pay-to-script-hash addresses, and human-readable part of segwit
+# addresses
+AddressFormat = collections.namedtuple('AddressFormat',
+                                       ['p2pkh_version', 'p2sh_version', 'segwit_hrp'])
+
+MAINNET = AddressFormat(b'\x00', b'\x05', 'bc')
+# shared by testnet3, testnet4 and signet
+TESTNET = AddressFormat(b'\x6f', b'\xc4', 'tb')
+REGTEST = AddressFormat(b'\x6f', b'\xc4', 'bcrt')
+
+# Address formats by the chain name reported by getblockchaininfo
+ADDRESS_FORMATS = {'main': MAINNET, 'test': TESTNET, 'testnet4': TESTNET, 'signet': TESTNET,
+                   'regtest': REGTEST}
+
+OP_0 = 0x00
+OP_PUSHDATA1 = 0x4c
+OP_PUSHDATA2 = 0x4d
+OP_PUSHDATA4 = 0x4e
+OP_1 = 0x51
+OP_16 = 0x60
+OP_RETURN = 0x6a
+OP_DUP = 0x76
+OP_EQUAL = 0x87
+OP_EQUALVERIFY = 0x88
+OP_HASH160 = 0xa9
+OP_CHECKSIG = 0xac
+OP_CHECKMULTISIG = 0xae
+
+_B58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+# pairs of Base58 digits, to encode two digits per division
+_B58_PAIRS = [a + b for a in _B58_ALPHABET for b in _B58_ALPHABET]
+_BECH32_CHARSET = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+_BECH32M_CONST = 0x2bc830a3
+
+_unpack_uint16 = struct.Struct('<H').unpack_from
+_unpack_uint32 = struct.Struct('<I').unpack_from
+_unpack_uint64 = struct.Struct('<Q').unpack_from
+_unpack_int32 = struct.Struct('<i').unpack_from
+_unpack_header = struct.Struct('<i32s32sIII').unpack_from
+
+
+class DeserializationException(Exception):
+    """
+    Exception raised when parsing malformed serialized data.
+    """
+    pass
+
+
+def double_sha256(data):
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+def hash160(data):
+    return hashlib.new('ripemd160', hashlib.sha256(data).digest()).digest()
+
+
+def base58check(version, payload):
+    """
+    Encodes a versioned payload as Base58Check string.
+
+    :param bytes version: version prefix
+    :param bytes payload: payload
+    :return: encoded string
+    :rtype: str
+    """
+    data = version + payload
+    data += double_sha256(data)[:4]
+    number = int.from_bytes(data, 'big')
+    pairs = []
+    while number:
+        number, remainder = divmod(number, 3364)
+        pairs.append(_B58_PAIRS[remainder])
+    encoded = ''.join(reversed(pairs)).lstrip('1')
+    padding = len(data) - len(data.lstrip(b'\x00'))
+    return '1' * padding + encoded
+
+
+def _bech32_polymod(values):
+    generator = [0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3]
+    checksum = 1
+    for value in values:
+        top = checksum >> 25
+        checksum = (checksum & 0x1ffffff) << 5 ^ value
+        for i in range(5):
+            if (top >> i) & 1:
+                checksum ^= generator[i]
+    return checksum
+
+
+def segwit_address(hrp, witness_version, witness_program):
+    """
+    Encodes a witness program as Bech32 (version 0) or Bech32m address.
+
+    :param str hrp: human-readable part
+    :param int witness_version: witness version
+    :param bytes witness_program: witness program
+    :return: encoded address
+    :rtype: str
+    """
+    data = [witness_version]
+    accumulator = 0
+    bits = 0
+    for byte in witness_program:
+        accumulator = (accumulator << 8) | byte
+        bits += 8
+        while bits >= 5:
+            bits -= 5
+            data.append((accumulator >> bits) & 31)
+    if bits:
+        data.append((accumulator << (5 - bits)) & 31)
+    constant = 1 if witness_version == 0 else _BECH32M_CONST
+    values = [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp] + data
+    polymod = _bech32_polymod(values + [0] * 6) ^ constant
+    checksum = [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+    return hrp + '1' + ''.join(_BECH32_CHARSET[d] for d in data + checksum)
+
+
+def _valid_pubkey_size(pubkey):
+    if pubkey[0] in (2, 3):
+        return len(pubkey) == 33
+    if pubkey[0] in (4, 6, 7):
+        return len(pubkey) == 65
+    return False
+
+
+def _script_pushes(script, offset):
+    """Returns the data pushed from offset on, or None if the script
+    contains non-push operations or is truncated."""
+    pushes = []
+    length = len(script)
+    while offset < length:
+        opcode = script[offset]
+        offset += 1
+        if opcode > OP_16:
+            return None
+        if opcode < OP_PUSHDATA1:
+            size = opcode
+        elif opcode == OP_PUSHDATA1:
+            if offset + 1 > length:
+                return None
+            size = script[offset]
+            offset += 1
+        elif opcode == OP_PUSHDATA2:
+            if offset + 2 > length:
+                return None
+            size = _unpack_uint16(script, offset)[0]
+            offset += 2
+        elif opcode == OP_PUSHDATA4:
+            if offset + 4 > length:
+                return None
+            size = _unpack_uint32(script, offset)[0]
+            offset += 4
+        else:
+            size = 0
+        if offset + size > length:
+            return None
+        pushes.append(script[offset:offset + size])
+        offset += size
+    return pushes
+
+
+def _multisig_pubkeys(script):
+    if len(script) < 3 or script[-1] != OP_CHECKMULTISIG:
+        return None
+    required = script[0]
+    total = script[-2]
+    if not (OP_1 <= required <= OP_16 and OP_1 <= total <= OP_16):
+        return None
+    pubkeys = _script_pushes(script[:-2], 1)
+    if (pubkeys is None or len(pubkeys) != total - OP_1 + 1 or required > total or
+            not all(pubkey and _valid_pubkey_size(pubkey) for pubkey in pubkeys)):
+        return None
+    return pubkeys
+
+
+def decode_script_pubkey(script, address_format=MAINNET):
+    """
+    Classifies an output script like Bitcoin Core does and extracts its
+    addresses.
+
+    The result mirrors the scriptPubKey JSON object: it holds the script
+    type, the addresses if there are any and, for pay-to-pubkey outputs,
+    the asm from which the public key is taken.
+
+    :param bytes script: output script
+    :param AddressFormat address_format: address encoding of the network
+    :return: scriptPubKey object
+    :rtype: dict
+    """
+    p2pkh_version, p2sh_version, hrp = address_format
+    length = len(script)
+    first = script[0] if length else None
+    if (length == 25 and first == OP_DUP and script[1] == OP_HASH160 and script[2] == 20 and
+            script[23] == OP_EQUALVERIFY and script[24] == OP_CHECKSIG):
+        return {'type': 'pubkeyhash',
+                'addresses': [base58check(p2pkh_version, script[3:23])]}
+    if length == 23 and first == OP_HASH160 and script[1] == 20 and script[22] == OP_EQUAL:
+        return {'type': 'scripthash',
+                'addresses': [base58check(p2sh_version, script[2:22])]}
+    if 4 <= length <= 42 and (first == OP_0 or OP_1 <= first <= OP_16) and \
+            script[1] + 2 == length:
+        program = script[2:]
+        if first == OP_0:
+            if length == 22:
+                return {'type': 'witness_v0_keyhash',
+                        'addresses': [segwit_address(hrp, 0, program)]}
+            if length == 34:
+                return {'type': 'witness_v0_scripthash',
+                        'addresses': [segwit_address(hrp, 0, program)]}
+            return {'type': 'nonstandard'}
+        version = first - OP_1 + 1
+        if version == 1 and length == 34:
+            return {'type': 'witness_v1_taproot',
+                    'addresses': [segwit_address(hrp, 1, program)]}
+        return {'type': 'witness_unknown',
+                'addresses': [segwit_address(hrp, version, program)]}
+    if (length == 35 or length == 67) and first == length - 2 and \
+            script[-1] == OP_CHECKSIG and _valid_pubkey_size(script[1:-1]):
+        return {'type': 'pubkey', 'asm': script[1:-1].hex() + ' OP_CHECKSIG'}
+    if first == OP_RETURN and _script_pushes(script, 1) is not None:
+        return {'type': 'nulldata'}
+    pubkeys = _multisig_pubkeys(script)
+    if pubkeys is not None:
+        return {'type': 'multisig',
+                'addresses': [base58check(p2pkh_version, hash160(pubkey)) for pubkey in pubkeys]}
+    return {'type': 'nonstandard'}
+
+
+def read_varint(data, offset):
+    """
+    Reads a CompactSize unsigned integer.
+
+    :return: the integer and the offset after it
+    :rtype: tuple
+    """
+    first = data[offset]
+    if first < 0xfd:
+        return first, offset + 1
+    if first == 0xfd:
+        return _unpack_uint16(data, offset + 1)[0], offset + 3
+    if first == 0xfe:
+        return _unpack_uint32(data, offset + 1)[0], offset + 5
+    return _unpack_uint64(data, offset + 1)[0], offset + 9
+
+
+def bits_to_difficulty(bits):
+    """
+    Computes the difficulty from the compact target like Bitcoin Core.
+
+    :param int bits: compact target
+    :return: difficulty
+    :rtype: float
+    """
+    shift = (bits >> 24) & 0xff
+    difficulty = float(0x0000ffff) / float(bits & 0x00ffffff)
+    while shift < 29:
+        difficulty *= 256.0
+        shift += 1
+    while shift > 29:
+        difficulty /= 256.0
+        shift -= 1
+    return difficulty
+
+
+def parse_block_header(data, offset=0):
+    """
+    Parses an 80 byte block header.
+
+    :param bytes data: serialized data
+    :param int offset: start of the header
+    :return: header with hash, version, previousblockhash (unless this is
+        the genesis block), merkleroot, time, bits, nonce and difficulty
+    :rtype: dict
+    """
+    if len(data) < offset + BLOCK_HEADER_SIZE:
+        raise DeserializationException('Truncated block header')
+    version, previous, merkle_root, time, bits, nonce = _unpack_header(data, offset)
+    header = {'hash': double_sha256(data[offset:offset + BLOCK_HEADER_SIZE])[::-1].hex(),
+              'version': version,
+              'merkleroot': merkle_root[::-1].hex(),
+              'time': time,
+              'bits': '{:08x}'.format(bits),
+              'nonce': nonce,
+              'difficulty': bits_to_difficulty(bits)}
+    if previous != NULL_HASH:
+        header['previousblockhash'] = previous[::-1].hex()
+    return header
+
+
+def parse_transaction(data, offset=0, address_format=MAINNET):
+    """
+    Parses a serialized transaction. Witness data is skipped.
+
+    :param bytes data: serialized data
+    :param int offset: start of the transaction
+    :param AddressFormat address_format: address encoding of the network
+    :return: transaction as in getrawtransaction JSON and the offset after it
+    :rtype: tuple
+    """
+    try:
+        return _parse_transaction(data, offset, address_format)
+    except (IndexError, struct.error) as exc:
+        raise DeserializationException('Truncated transaction at offset {}'.format(offset)) \
+            from exc
+
+
+def _parse_transaction(data, offset, address_format):
+    start = offset
+    version = _unpack_int32(data, offset)[0]
+    offset += 4
+    segwit = data[offset] == 0 and data[offset + 1] != 0
+    if segwit:
+        offset += 2
+    body_start = offset
+
+    count, offset = read_varint(data, offset)
+    vin = []
+    for _ in range(count):
+        previous = data[offset:offset + 32]
+        index = _unpack_uint32(data, offset + 32)[0]
+        script_length, offset = read_varint(data, offset + 36)
+        script_end = offset + script_length
+        sequence = _unpack_uint32(data, script_end)[0]
+        if index == 0xffffffff and previous == NULL_HASH:
+            vin.append({'coinbase': data[offset:script_end].hex(), 'sequence': sequence})
+        else:
+            vin.append({'txid': previous[::-1].hex(), 'vout': index, 'sequence': sequence})
+        offset = script_end + 4
+
+    count, offset = read_varint(data, offset)
+    vout = []
+    for n in range(count):
+        value = _unpack_uint64(data, offset)[0]
+        script_length, offset = read_varint(data, offset + 8)
+        script_end = offset + script_length
+        if script_end > len(data):
+            raise DeserializationException('Truncated output script')
+        vout.append({'value': value / COIN, 'n': n,
+                     'scriptPubKey': decode_script_pubkey(data[offset:script_end],
+                                                          address_format)})
+        offset = script_end
+    body_end = offset
+
+    if segwit:
+        for _ in vin:
+            items, offset = read_varint(data, offset)
+            for _ in range(items):
+                item_length, offset = read_varint(data, offset)
+                offset += item_length
+    locktime = _unpack_uint32(data, offset)[0]
+    offset += 4
+
+    serialized = data[start:offset]
+    wtxid = double_sha256(serialized)
+    if segwit:
+        txid = double_sha256(data[start:start + 4] + data[body_start:body_end] +
+                             data[offset - 4:offset])
+    else:
+        txid = wtxid
+    tx = {'txid': txid[::-1].hex(),
+          'hash': wtxid[::-1].hex(),
+          'version': version,
+          'size': offset - start,
+          'locktime': locktime,
+          'vin': vin,
+          'vout': vout}
+    return tx, offset
+
+
+def parse_block(data, offset=0, address_format=MAINNET):
+    """
+    Parses a serialized block.
+
+    The result has the shape of getblock JSON with verbosity 2, except for
+    the height and nextblockhash, which are not part of the serialization.
+
+    :param bytes data: serialized data
+    :param int offset: start of the block
+    :param AddressFormat address_format: address encoding of the network
+    :return: block with transactions
+    :rtype: dict
+    """
+    block = parse_block_header(data, offset)
+    try:
+        count, position = read_varint(data, offset + BLOCK_HEADER_SIZE)
+    except IndexError as exc:
+        raise DeserializationException('Truncated block') from exc
+    transactions = []
+    for _ in range(count):
+        tx, position = parse_transaction(data, position, address_format)
+        transactions.append(tx)
+    block['tx'] = transactions
+    block['size'] = position - offset
+    return block
@@ -0,0 +1,282 @@
+"""
+stats
+
+Request statistics of the Bitcoin Core and Neo4j interfaces: call
+counts, latency histograms, transferred bytes, retries and errors.
+
+"""
+
+import json
+import os
+import threading
+
+__author__ = 'Bernhard Haslhofer (bernhard.haslhofer@ait.ac.at)'
+__copyright__ = 'Copyright 2015, Bernhard Haslhofer'
+__license__ = "MIT"
+
+
+# Upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Seconds between two writes of a StatsWriter
+DEFAULT_WRITE_INTERVAL = 60
+
+_COUNTERS = [
+    ('calls', 'requests_total', 'Requests sent'),
+    ('errors', 'request_errors_total', 'Requests that failed'),
+    ('retries', 'request_retries_total', 'Requests repeated after a connection failure'),
+    ('request_bytes', 'request_bytes_total', 'Bytes sent in request bodies'),
+    ('response_bytes', 'response_bytes_total', 'Bytes received in response bodies'),
+]
+
+
+class MethodStats:
+    """
+    Statistics of the requests of one method.
+    """
+
+    __slots__ = ('calls', 'errors', 'retries', 'request_bytes', 'response_bytes',
+                 'latency_sum', 'latency_counts')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.latency_sum = 0.0
+        # per bucket of LATENCY_BUCKETS, followed by the count above the last bound
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def copy(self):
+        method_stats = MethodStats()
+        for name in self.__slots__:
+            setattr(method_stats, name, getattr(self, name))
+        method_stats.latency_counts = list(self.latency_counts)
+        return method_stats
+
+    def add(self, other):
+        for name in self.__slots__[:-1]:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.latency_counts = [count + other_count for count, other_count
+                               in zip(self.latency_counts, other.latency_counts)]
+
+    def as_dict(self):
+        return {'calls': self.calls,
+                'errors': self.errors,
+                'retries': self.retries,
+                'request_bytes': self.request_bytes,
+                'response_bytes': self.response_bytes,
+                'latency_sum': self.latency_sum,
+                'latency_buckets': dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'],
+                                            self.latency_counts))}
+
+
+class Stats:
+    """
+    Thread-safe collection of request statistics, keyed by interface
+    (e.g. rpc, rest or neo4j) and method.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._methods = {}
+
+    def _method(self, interface, method):
+        key = (interface, method)
+        method_stats = self._methods.get(key)
+        if method_stats is None:
+            method_stats = self._methods[key] = MethodStats()
+        return method_stats
+
+    def record(self, interface, method, seconds, request_bytes=0, response_bytes=0, error=False):
+        """
+        Records a completed or failed request.
+
+        :param str interface: name of the interface
+        :param str method: name of the method
+        :param float seconds: time until the response or failure
+        :param int request_bytes: size of the request body
+        :param int response_bytes: size of the response body
+        :param bool error: whether the request failed
+        """
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[bucket]:
+            bucket += 1
+        with self._lock:
+            method_stats = self._method(interface, method)
+            method_stats.calls += 1
+            method_stats.errors += bool(error)
+            method_stats.request_bytes += request_bytes
+            method_stats.response_bytes += response_bytes
+            method_stats.latency_sum += seconds
+            method_stats.latency_counts[bucket] += 1
+
+    def record_retry(self, interface, method):
+        """
+        Records that a request is repeated.
+
+        :param str interface: name of the interface
+        :param str method: name of the method
+        """
+        with self._lock:
+            self._method(interface, method).retries += 1
+
+    def get(self, interface, method):
+        """
+        Returns a copy of the statistics of a method.
+
+        :param str interface: name of the interface
+        :param str method: name of the method
+        :return: statistics, all zero if the method was not used
+        :rtype: MethodStats
+        """
+        with self._lock:
+            method_stats = self._methods.get((interface, method))
+            return method_stats.copy() if method_stats is not None else MethodStats()
+
+    def snapshot(self):
+        """
+        Returns the statistics of all methods.
+
+        :return: statistics by interface and method
+        :rtype: dict
+        """
+        result = {}
+        with self._lock:
+            for (interface, method), method_stats in sorted(self._methods.items()):
+                result.setdefault(interface, {})[method] = method_stats.as_dict()
+        return result
+
+    def reset(self):
+        """
+        Discards all statistics.
+        """
+        with self._lock:
+            self._methods.clear()
+
+    def drain(self):
+        """
+        Returns the statistics of all methods and discards them, e.g. to
+        pass them from a worker process to its parent.
+
+        :return: statistics by interface and method
+        :rtype: dict
+        """
+        with self._lock:
+            methods = self._methods
+            self._methods = {}
+        return methods
+
+    def merge(self, methods):
+        """
+        Adds the statistics returned by drain of another collection.
+
+        :param dict methods: statistics by interface and method
+        """
+        with self._lock:
+            for (interface, method), method_stats in methods.items():
+                self._method(interface, method).add(method_stats)
+
+    def to_json(self):
+        """
+        Returns the statistics as JSON document.
+
+        :rtype: str
+        """
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        """
+        Returns the statistics in the Prometheus text exposition format.
+
+        :rtype: str
+        """
+        with self._lock:
+            methods = sorted((key, method_stats.copy())
+                             for key, method_stats in self._methods.items())
+        lines = []
+        for attribute, name, help_text in _COUNTERS:
+            lines.append('# HELP bitcoingraph_{} {}.'.format(name, help_text))
+            lines.append('# TYPE bitcoingraph_{} counter'.format(name))
+            for (interface, method), method_stats in methods:
+                lines.append('bitcoingraph_{}{{interface="{}",method="{}"}} {}'.format(
+                    name, interface, method, getattr(method_stats, attribute)))
+        name = 'bitcoingraph_request_duration_seconds'
+        lines.append('# HELP {} Request latency.'.format(name))
+        lines.append('# TYPE {} histogram'.format(name))
+        for (interface, method), method_stats in methods:
+            labels = 'interface="{}",method="{}"'.format(interface, method)
+            cumulative = 0
+            for bound, count in zip([repr(bound) for bound in LATENCY_BUCKETS] + ['+Inf'],
+                                    method_stats.latency_counts):
+                cumulative += count
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, bound, cumulative))
+            lines.append('{}_sum{{{}}} {!r}'.format(name, labels, method_stats.latency_sum))
+            lines.append('{}_count{{{}}} {}'.format(name, labels, method_stats.calls))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, format='prometheus'):
+        """
+        Writes the statistics to a file, replacing it atomically.
+
+        :param str path: path of the file
+        :param str format: 'prometheus' or 'json'
+        """
+        text = self.to_json() if format == 'json' else self.to_prometheus()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+
+# Statistics of all interfaces that are not given their own
+GLOBAL_STATS = Stats()
+
+
+class StatsWriter:
+    """
+    Background thread writing statistics to a file periodically, and a
+    last time when stopped.
+    """
+
+    def __init__(self, path, interval=DEFAULT_WRITE_INTERVAL, format='prometheus',
+                 stats=GLOBAL_STATS):
+        """
+        Creates a statistics writer.
+
+        :param str path: path of the file
+        :param float interval: seconds between two writes
+        :param str format: 'prometheus' or 'json'
+        :param Stats stats: statistics to write
+        :return: statistics writer
+        :rtype: StatsWriter
+        """
+        self.path = path
+        self.interval = interval
+        self.format = format
+        self.stats = stats
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.stats.write(self.path, self.format)
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.stats.write(self.path, self.format)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
@@ -1,5 +1,21 @@
 import csv
+import gzip
 import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Number of outputs and inputs collected by BufferedCSVDumpWriter before
+# the rows are written
+DEFAULT_BUFFER_ROWS = 100000
+
+# Size of the write buffer of each file in bytes
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+# Number of threads compressing the chunks of different files at the same
+# time when writing compressed files
+DEFAULT_COMPRESSION_THREADS = 4
 
 
 class CSVDumpWriter:
@@ -52,6 +68,7 @@ class CSVDumpWriter:
         self._outputs_file.close()
         self._addresses_file.close()
         self._rel_block_tx_file.close()
+        self._rel_block_block_file.close()
         self._rel_tx_output_file.close()
         self._rel_input_file.close()
         self._rel_output_address_file.close()
@@ -83,9 +100,7 @@ class CSVDumpWriter:
             self._rel_block_tx_writer.writerow([block.hash, tx.txid])
             if not tx.is_coinbase():
                 for input in tx.inputs:
-                    self._rel_input_writer.writerow(
-                        [tx.txid,
-                         a_b(input.output_reference['txid'], input.output_reference['vout'])])
+                    self._rel_input_writer.writerow([tx.txid, a_b(input.txid, input.vout)])
             for output in tx.outputs:
                 self._output_writer.writerow([a_b(tx.txid, output.index), output.index,
                                               output.value, output.type])
@@ -93,3 +108,191 @@ class CSVDumpWriter:
                 for address in output.addresses:
                     self._address_writer.writerow([address])
                     self._rel_output_address_writer.writerow([a_b(tx.txid, output.index), address])
+
+
+def _csv_field(value):
+    # a field of a row with several fields as written by csv.writer
+    if ',' in value or '"' in value or '\r' in value or '\n' in value:
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+class BufferedCSVDumpWriter(CSVDumpWriter):
+    """
+    CSVDumpWriter that collects the lines of each file in memory and writes
+    them in large chunks to binary files with large buffers. Lines are
+    formatted directly rather than through csv.writer, quoting addresses
+    and output types as it would, so that the files written are identical
+    to those of CSVDumpWriter. Optionally, the chunks are encoded and
+    written by a background thread, overlapping with fetching blocks.
+
+    With a compression level, data files are written as .csv.gz, each chunk
+    being compressed by a pool of threads into a gzip member of its own.
+    Separate header files are not compressed.
+
+    Given seen-sets (dedup.SeenSet), addresses and transactions already
+    written are skipped: a repeated transaction is written to
+    rel_block_tx and rel_input only, as sort -u would leave the files.
+    """
+
+    _NAMES = ['blocks', 'transactions', 'outputs', 'addresses', 'rel_block_tx',
+              'rel_block_block', 'rel_tx_output', 'rel_input', 'rel_output_address']
+
+    def __init__(self, output_path, plain_header=False, separate_header=True,
+                 buffer_rows=DEFAULT_BUFFER_ROWS, buffer_size=DEFAULT_BUFFER_SIZE,
+                 background=False, compression_level=None,
+                 compression_threads=DEFAULT_COMPRESSION_THREADS,
+                 seen_addresses=None, seen_transactions=None):
+        self._compression_level = compression_level
+        super().__init__(output_path, plain_header, separate_header)
+        self._buffer_rows = buffer_rows
+        self._buffer_size = buffer_size
+        self._background = background
+        self._compression_threads = compression_threads
+        self._seen_addresses = seen_addresses
+        self._seen_transactions = seen_transactions
+        self._type_fields = {}
+
+    def _get_data_path(self, filename):
+        if self._compression_level is None:
+            return self._get_path(filename)
+        return self._get_path(filename) + '.gz'
+
+    def _write_header(self, filename, row):
+        if self._compression_level is None or self._separate_header:
+            return super()._write_header(filename, row)
+        if self._plain_header:
+            row = [entry.partition(':')[0] for entry in row]
+        with open(self._get_data_path(filename), 'wb') as f:
+            f.write(gzip.compress(','.join(map(_csv_field, row)).encode() + b'\r\n',
+                                  self._compression_level))
+
+    def __enter__(self):
+        self._files = [open(self._get_data_path(name), 'ab', buffering=self._buffer_size)
+                       for name in self._NAMES]
+        self._compressor = None
+        if self._compression_level is not None:
+            self._compressor = ThreadPoolExecutor(self._compression_threads)
+            for f in self._files:
+                if f.tell() == 0:
+                    # a file without rows is a valid gzip file as well
+                    f.write(gzip.compress(b'', self._compression_level))
+        self._new_buffers()
+        self._error = None
+        if self._background:
+            # at most one chunk waits while another one is written
+            self._queue = queue.Queue(maxsize=1)
+            self._thread = threading.Thread(target=self._write_chunks, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        try:
+            self.flush()
+        finally:
+            if self._background:
+                self._queue.put(None)
+                self._thread.join()
+            if self._compressor is not None:
+                self._compressor.shutdown()
+            for f in self._files:
+                f.close()
+        if self._background and self._error is not None:
+            raise self._error
+
+    def _new_buffers(self):
+        self._buffers = [[] for _ in self._NAMES]
+        (self._blocks, self._transactions, self._outputs, self._addresses,
+         self._rel_block_tx, self._rel_block_block, self._rel_tx_output, self._rel_input,
+         self._rel_output_address) = self._buffers
+
+    def _compress(self, lines):
+        return gzip.compress(''.join(lines).encode(), self._compression_level)
+
+    def _write_chunk(self, buffers):
+        chunks = [(f, lines) for f, lines in zip(self._files, buffers) if lines]
+        if self._compressor is None:
+            for f, lines in chunks:
+                f.write(''.join(lines).encode())
+        else:
+            # zlib releases the GIL, so that files are compressed in parallel
+            for (f, _), data in zip(chunks, self._compressor.map(
+                    self._compress, [lines for _, lines in chunks])):
+                f.write(data)
+
+    def _write_chunks(self):
+        while True:
+            buffers = self._queue.get()
+            if buffers is None:
+                return
+            if self._error is None:
+                try:
+                    self._write_chunk(buffers)
+                except Exception as exc:
+                    self._error = exc
+
+    def flush(self):
+        """
+        Writes the collected lines.
+        """
+        buffers = self._buffers
+        self._new_buffers()
+        if self._background:
+            if self._error is not None:
+                raise self._error
+            self._queue.put(buffers)
+        else:
+            self._write_chunk(buffers)
+
+    def write(self, block):
+        block_hash = block.hash
+        self._blocks.append('%s,%s,%s,%s\r\n' % (block_hash, block.height, block.timestamp,
+                                                  block.difficulty))
+        if block.has_previous_block():
+            self._rel_block_block.append('%s,%s\r\n' % (block_hash, block.previous_block.hash))
+
+        transactions = self._transactions.append
+        outputs = self._outputs.append
+        addresses = self._addresses.append
+        rel_block_tx = self._rel_block_tx.append
+        rel_tx_output = self._rel_tx_output.append
+        rel_input = self._rel_input.append
+        rel_output_address = self._rel_output_address.append
+        type_fields = self._type_fields
+        seen_addresses = self._seen_addresses
+        seen_transactions = self._seen_transactions
+        block_prefix = block_hash + ','
+        for tx in block.transactions:
+            txid = tx.txid
+            coinbase = tx.is_coinbase()
+            new_tx = seen_transactions is None or seen_transactions.add(txid)
+            if new_tx:
+                transactions('%s,%s\r\n' % (txid, coinbase))
+            rel_block_tx(block_prefix + txid + '\r\n')
+            if not coinbase:
+                for input in tx.inputs:
+                    rel_input('%s,%s_%s\r\n' % (txid, input.txid, input.vout))
+            if not new_tx:
+                continue
+            for output in tx.outputs:
+                index = output.index
+                txid_n = '%s_%s' % (txid, index)
+                type_field = type_fields.get(output.type)
+                if type_field is None:
+                    type_field = type_fields[output.type] = _csv_field(output.type)
+                outputs('%s,%s,%s,%s\r\n' % (txid_n, index, output.value, type_field))
+                rel_tx_output('%s,%s\r\n' % (txid, txid_n))
+                for address in output.addresses:
+                    new_address = seen_addresses is None or seen_addresses.add(address)
+                    if not address.isalnum():
+                        # a single empty field is quoted as well
+                        field = _csv_field(address)
+                        if new_address:
+                            addresses((field or '""') + '\r\n')
+                        rel_output_address('%s,%s\r\n' % (txid_n, field))
+                        continue
+                    if new_address:
+                        addresses(address + '\r\n')
+                    rel_output_address('%s,%s\r\n' % (txid_n, address))
+        if len(self._outputs) + len(self._rel_input) >= self._buffer_rows:
+            self.flush()
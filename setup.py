@@ -71,6 +71,8 @@ setup(
     cmdclass={'test': PyTest},
     extras_require={
         'testing': ['pytest'],
+        'numpy': ['numpy'],
+        'orjson': ['orjson'],
     },
 
     # Legal info
@@ -0,0 +1,244 @@
+"""
+Local stand-in for the Bitcoin Core JSON-RPC and REST interfaces,
+serving blocks and transactions from a BitcoinProxyMock.
+
+Latency, a bandwidth cap, rejections of requests exceeding the work queue
+(as with Bitcoin Core's rpcworkqueue) and dropped connections can be
+injected to exercise the transport layer.
+
+"""
+import contextlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tests.block_builder import serialize_block
+
+
+class RPCError(Exception):
+
+    def __init__(self, code, message):
+        self.code = code
+        self.message = message
+
+
+class BitcoindRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, which would otherwise stall
+    # keep-alive connections until the delayed acknowledgement
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length).decode())
+        with self.server.track_request() as refusal:
+            if refusal is None:
+                if isinstance(request, list):
+                    response = [self._rpc_response(entry) for entry in request]
+                    status = 200
+                else:
+                    response = self._rpc_response(request)
+                    status = 200 if response['error'] is None else 500
+        if refusal is not None:
+            return self._refuse(refusal)
+        self._send(status, json.dumps(response).encode())
+
+    def do_GET(self):
+        with self.server.track_request() as refusal:
+            if refusal is not None:
+                return self._refuse(refusal)
+            match = re.fullmatch(r'/rest/block/(\w+)\.json', self.path)
+            if match and match.group(1) in self.server.backend.blocks:
+                body = self.server.verbose_block(match.group(1))
+                return self._send(200, json.dumps(body).encode())
+            match = re.fullmatch(r'/rest/block/(\w+)\.bin', self.path)
+            if match and match.group(1) in self.server.backend.blocks:
+                body = serialize_block(self.server.backend.blocks[match.group(1)],
+                                       self.server.backend.txs)
+                return self._send(200, body, 'application/octet-stream')
+            match = re.fullmatch(r'/rest/headers/(\d+)/(\w+)\.json', self.path)
+            if match and match.group(2) in self.server.backend.blocks:
+                body = self.server.headers(int(match.group(1)), match.group(2))
+                return self._send(200, json.dumps(body).encode())
+        self._send(404, b'Not found')
+
+    def _rpc_response(self, request):
+        response = {'result': None, 'error': None, 'id': request.get('id')}
+        try:
+            response['result'] = self.server.rpc(request['method'], request.get('params', []))
+        except RPCError as e:
+            response['error'] = {'code': e.code, 'message': e.message}
+        return response
+
+    def _refuse(self, refusal):
+        if refusal == 'drop':
+            # close the connection without a response
+            self.close_connection = True
+        else:
+            self._send(503, b'Work queue depth exceeded', 'text/plain')
+
+    def _send(self, status, body, content_type='application/json'):
+        self.server.throttle(len(body))
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class BitcoindServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, backend, latency=0.0, version=150000, bandwidth=None, work_queue=None,
+                 drop_rate=0.0, seed=0, chain='main'):
+        """
+        Creates a server bound to a free port on localhost.
+
+        :param BitcoinProxyMock backend: source of blocks and transactions
+        :param float latency: seconds each request is delayed
+        :param int version: client version reported by getnetworkinfo
+        :param int bandwidth: bytes per second sent in all responses together
+            (None = unlimited)
+        :param int work_queue: number of requests processed at the same
+            time, further requests are rejected with 503 (None = unlimited)
+        :param float drop_rate: probability that a connection is closed
+            instead of answering a request
+        :param int seed: seed of the random generator deciding drops
+        :param str chain: chain name reported by getblockchaininfo
+        """
+        super().__init__(('127.0.0.1', 0), BitcoindRequestHandler)
+        self.backend = backend
+        self.latency = latency
+        self.version = version
+        self.bandwidth = bandwidth
+        self.work_queue = work_queue
+        self.drop_rate = drop_rate
+        self.chain = chain
+        self.requests = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._sending_until = 0.0
+        self._block_heights = None
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, args=(0.05,),
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    @contextlib.contextmanager
+    def track_request(self):
+        """
+        Accounts for a request being processed.
+
+        Yields None if the request is to be answered, 'drop' if its
+        connection is to be closed and 'reject' if it exceeds the work
+        queue.
+        """
+        with self._lock:
+            self.requests += 1
+            if self.drop_rate and self._random.random() < self.drop_rate:
+                self.dropped += 1
+                refusal = 'drop'
+            elif self.work_queue is not None and self.in_flight >= self.work_queue:
+                self.rejected += 1
+                refusal = 'reject'
+            else:
+                refusal = None
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        if refusal is not None:
+            yield refusal
+            return
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            yield None
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def throttle(self, size):
+        """
+        Delays sending a response of the given size to keep all responses
+        within the bandwidth.
+        """
+        if not self.bandwidth:
+            return
+        with self._lock:
+            now = time.perf_counter()
+            self._sending_until = max(self._sending_until, now) + size / self.bandwidth
+            delay = self._sending_until - now
+        time.sleep(delay)
+
+    def rpc(self, method, params):
+        backend = self.backend
+        if method == 'getblock':
+            if params[0] not in backend.blocks:
+                raise RPCError(-5, 'Block not found')
+            if len(params) > 1 and params[1] >= 3:
+                block = self.verbose_block(params[0])
+                block['tx'] = [backend.with_prevouts(tx) for tx in block['tx']]
+                return block
+            if len(params) > 1 and params[1] >= 2:
+                return self.verbose_block(params[0])
+            return backend.blocks[params[0]]
+        elif method == 'getblockheader':
+            if params[0] not in backend.blocks:
+                raise RPCError(-5, 'Block not found')
+            return {key: value for key, value in backend.blocks[params[0]].items() if key != 'tx'}
+        elif method == 'getblockhash':
+            if params[0] not in backend.heights:
+                raise RPCError(-8, 'Block height out of range')
+            return backend.heights[params[0]]
+        elif method == 'getblockcount':
+            return max(backend.heights)
+        elif method == 'getblockchaininfo':
+            return {'chain': self.chain, 'blocks': max(backend.heights)}
+        elif method == 'getnetworkinfo':
+            return {'version': self.version}
+        elif method == 'getrawtransaction':
+            if params[0] not in backend.txs:
+                raise RPCError(-5, 'No such mempool or blockchain transaction')
+            return backend.txs[params[0]]
+        raise RPCError(-32601, 'Method not found')
+
+    def verbose_block(self, block_hash):
+        raw_block = dict(self.backend.blocks[block_hash])
+        raw_block['tx'] = [self.backend.txs.get(tx_id, tx_id) for tx_id in raw_block['tx']]
+        return raw_block
+
+    def headers(self, count, block_hash):
+        if self._block_heights is None:
+            self._block_heights = {h: height for height, h in self.backend.heights.items()}
+        height = self._block_heights[block_hash]
+        return [{key: value for key, value in self.backend.blocks[self.backend.heights[h]].items()
+                 if key != 'tx'}
+                for h in range(height, height + count) if h in self.backend.heights]
@@ -0,0 +1,55 @@
+"""
+Helpers to build consensus-serialized blocks from JSON test data.
+
+"""
+import struct
+
+from bitcoingraph.serialization import double_sha256
+
+
+def varint(n):
+    if n < 0xfd:
+        return bytes([n])
+    if n <= 0xffff:
+        return b'\xfd' + struct.pack('<H', n)
+    if n <= 0xffffffff:
+        return b'\xfe' + struct.pack('<I', n)
+    return b'\xff' + struct.pack('<Q', n)
+
+
+def merkle_root(txids):
+    hashes = [bytes.fromhex(txid)[::-1] for txid in txids]
+    while len(hashes) > 1:
+        if len(hashes) % 2:
+            hashes.append(hashes[-1])
+        hashes = [double_sha256(hashes[i] + hashes[i + 1]) for i in range(0, len(hashes), 2)]
+    return hashes[0][::-1].hex()
+
+
+def serialize_header(version, previous_hash, merkle_root, time, bits, nonce):
+    previous = bytes.fromhex(previous_hash)[::-1] if previous_hash else bytes(32)
+    return struct.pack('<i32s32sIII', version, previous, bytes.fromhex(merkle_root)[::-1],
+                       time, bits, nonce)
+
+
+def serialize_block(raw_block, raw_txs):
+    """
+    Serializes a block from its getblock JSON (verbosity 1) and the
+    getrawtransaction JSON of all its transactions.
+    """
+    header = serialize_header(raw_block['version'], raw_block.get('previousblockhash'),
+                              raw_block['merkleroot'], raw_block['time'],
+                              int(raw_block['bits'], 16), raw_block['nonce'])
+    body = b''.join(bytes.fromhex(raw_txs[txid]['hex']) for txid in raw_block['tx'])
+    return header + varint(len(raw_block['tx'])) + body
+
+
+def build_block(previous_hash, raw_txs, time, bits=0x1d00ffff, version=1, nonce=0):
+    """
+    Builds a serialized block on top of the given previous block hash from
+    a list of getrawtransaction JSON objects.
+    """
+    root = merkle_root([raw_tx['txid'] for raw_tx in raw_txs])
+    header = serialize_header(version, previous_hash, root, time, bits, nonce)
+    body = b''.join(bytes.fromhex(raw_tx['hex']) for raw_tx in raw_txs)
+    return header + varint(len(raw_txs)) + body
@@ -0,0 +1,186 @@
+"""
+Deterministic generator of synthetic block chains for tests and
+benchmarks.
+
+Transactions are built in consensus serialization and decoded with
+bitcoingraph.serialization, so that their JSON, the binary blocks and the
+block hashes are consistent with each other, as with a real node.
+
+"""
+import hashlib
+import random
+import struct
+
+from tests.block_builder import build_block, varint
+
+from bitcoingraph.serialization import (
+    BLOCK_HEADER_SIZE, OP_CHECKMULTISIG, OP_CHECKSIG, OP_DUP, OP_EQUALVERIFY, OP_HASH160,
+    hash160, parse_block_header, parse_transaction)
+
+
+# Block subsidy in satoshis
+SUBSIDY = 50 * 100000000
+
+# Relative frequency of output script types
+DEFAULT_SCRIPT_MIX = {'pubkeyhash': 0.8, 'pubkey': 0.1, 'multisig': 0.1}
+
+# Seconds between two generated blocks
+BLOCK_INTERVAL = 600
+
+_OP_1 = 0x51
+
+# placeholder signature pushed by every input script
+_SIGNATURE = bytes([71]) + bytes(71)
+
+
+class SyntheticChain:
+    """
+    Block chain generated from a seed, in the form served by
+    BitcoinProxyMock: getblock JSON (verbosity 1) by hash, block hashes by
+    height and getrawtransaction JSON by txid.
+
+    Every transaction but the coinbase spends randomly chosen unspent
+    outputs of earlier blocks and pays a small fee. Outputs pay to keys
+    that are new or, with the probability address_reuse, were used
+    before, with script types drawn from script_mix.
+    """
+
+    def __init__(self, blocks=1000, transactions_per_block=20, max_inputs=3, max_outputs=3,
+                 address_reuse=0.3, script_mix=None, seed=0, start_time=1231006505):
+        """
+        Generates a chain.
+
+        :param int blocks: number of blocks, starting with height 0
+        :param int transactions_per_block: average number of transactions
+            per block, including the coinbase
+        :param int max_inputs: maximum number of inputs of a transaction
+        :param int max_outputs: maximum number of outputs of a transaction
+        :param float address_reuse: probability that an output pays to a
+            key used before
+        :param dict script_mix: relative frequency by script type, out of
+            pubkeyhash, pubkey and multisig
+        :param int seed: seed of the random generator
+        :param int start_time: timestamp of the first block
+        """
+        self.heights = {}
+        self.blocks = {}
+        self.txs = {}
+        self._random = random.Random(seed)
+        self._seed = seed
+        self._keys = []
+        self._unspent = []
+        mix = script_mix or DEFAULT_SCRIPT_MIX
+        self._script_types = list(mix)
+        self._script_weights = [mix[script_type] for script_type in self._script_types]
+        self._address_reuse = address_reuse
+        self._max_inputs = max_inputs
+        self._max_outputs = max_outputs
+
+        previous_hash = None
+        for height in range(blocks):
+            count = self._random.randint(1, max(2 * transactions_per_block - 1, 1))
+            previous_hash = self._add_block(height, previous_hash, count,
+                                            start_time + height * BLOCK_INTERVAL)
+
+    def __len__(self):
+        return len(self.heights)
+
+    @property
+    def transaction_count(self):
+        return len(self.txs)
+
+    def _key(self):
+        if self._keys and self._random.random() < self._address_reuse:
+            return self._random.choice(self._keys)
+        index = len(self._keys)
+        key = bytes([2]) + hashlib.sha256(struct.pack('<qq', self._seed, index)).digest()
+        self._keys.append(key)
+        return key
+
+    def _script(self):
+        script_type = self._random.choices(self._script_types, self._script_weights)[0]
+        if script_type == 'pubkey':
+            return bytes([33]) + self._key() + bytes([OP_CHECKSIG])
+        if script_type == 'multisig':
+            total = self._random.randint(2, 3)
+            required = self._random.randint(1, total)
+            keys = b''.join(bytes([33]) + self._key() for _ in range(total))
+            return bytes([_OP_1 + required - 1]) + keys + \
+                bytes([_OP_1 + total - 1, OP_CHECKMULTISIG])
+        return bytes([OP_DUP, OP_HASH160, 20]) + hash160(self._key()) + \
+            bytes([OP_EQUALVERIFY, OP_CHECKSIG])
+
+    def _split(self, amount, count):
+        # random positive parts summing up to amount
+        cuts = sorted(self._random.sample(range(1, amount), count - 1)) if count > 1 else []
+        bounds = [0] + cuts + [amount]
+        return [bounds[i + 1] - bounds[i] for i in range(count)]
+
+    @staticmethod
+    def _serialize(inputs, outputs):
+        data = struct.pack('<i', 1) + varint(len(inputs))
+        for previous, index, script in inputs:
+            data += previous + struct.pack('<I', index) + varint(len(script)) + script + \
+                struct.pack('<I', 0xffffffff)
+        data += varint(len(outputs))
+        for value, script in outputs:
+            data += struct.pack('<Q', value) + varint(len(script)) + script
+        return data + struct.pack('<I', 0)
+
+    def _coinbase(self, height, fees):
+        script = bytes([4]) + struct.pack('<I', height)
+        outputs = [(value, self._script())
+                   for value in self._split(SUBSIDY + fees, self._random.randint(1, 2))]
+        return self._serialize([(bytes(32), 0xffffffff, script)], outputs)
+
+    def _transaction(self):
+        count = min(self._random.randint(1, self._max_inputs), len(self._unspent))
+        spent = []
+        for _ in range(count):
+            # swap-remove a random unspent output
+            position = self._random.randrange(len(self._unspent))
+            self._unspent[position], self._unspent[-1] = \
+                self._unspent[-1], self._unspent[position]
+            spent.append(self._unspent.pop())
+        total = sum(value for _, _, value in spent)
+        fee = min(total // 1000, 10000)
+        count = max(min(self._random.randint(1, self._max_outputs), total - fee), 1)
+        outputs = [(value, self._script()) for value in self._split(total - fee, count)]
+        inputs = [(bytes.fromhex(txid)[::-1], index, _SIGNATURE) for txid, index, _ in spent]
+        return self._serialize(inputs, outputs), fee
+
+    def _add_block(self, height, previous_hash, count, time):
+        transactions = []
+        fees = 0
+        for _ in range(count - 1):
+            if not self._unspent:
+                break
+            data, fee = self._transaction()
+            transactions.append(data)
+            fees += fee
+        transactions.insert(0, self._coinbase(height, fees))
+
+        raw_txs = []
+        for data in transactions:
+            raw_tx = parse_transaction(data)[0]
+            raw_tx['hex'] = data.hex()
+            raw_txs.append(raw_tx)
+        block_data = build_block(previous_hash, raw_txs, time, nonce=height)
+        raw_block = parse_block_header(block_data[:BLOCK_HEADER_SIZE])
+        block_hash = raw_block['hash']
+        raw_block['height'] = height
+        raw_block['size'] = len(block_data)
+        raw_block['tx'] = [raw_tx['txid'] for raw_tx in raw_txs]
+        if previous_hash is not None:
+            self.blocks[previous_hash]['nextblockhash'] = block_hash
+
+        for raw_tx in raw_txs:
+            raw_tx['blockhash'] = block_hash
+            raw_tx['time'] = raw_tx['blocktime'] = time
+            self.txs[raw_tx['txid']] = raw_tx
+            # outputs become spendable in the following blocks
+            self._unspent.extend((raw_tx['txid'], vout['n'], round(vout['value'] * 100000000))
+                                 for vout in raw_tx['vout'])
+        self.heights[height] = block_hash
+        self.blocks[block_hash] = raw_block
+        return block_hash
@@ -1,5 +1,6 @@
 from bitcoingraph.bitcoind import BitcoinProxy, BitcoindException
 
+from collections import Counter
 from pathlib import Path
 
 import json
@@ -10,12 +11,19 @@ TEST_DATA_PATH = "./data"
 
 class BitcoinProxyMock(BitcoinProxy):
 
-    def __init__(self, host=None, port=None):
-        super().__init__(host, port)
+    def __init__(self, host=None, port=None, verbosity=1, chain=None):
+        super().__init__(host, port, verbosity=verbosity)
         self.heights = {}
         self.blocks = {}
         self.txs = {}
-        self.load_testdata()
+        self.calls = Counter()
+        if chain is None:
+            self.load_testdata()
+        else:
+            # e.g. a tests.chain_generator.SyntheticChain
+            self.heights = chain.heights
+            self.blocks = chain.blocks
+            self.txs = chain.txs
 
     # Load test data into local dicts
     def load_testdata(self):
@@ -39,11 +47,35 @@ class BitcoinProxyMock(BitcoinProxy):
     # Override production proxy methods
 
     def getblock(self, block_hash):
+        self.calls['getblock'] += 1
         if block_hash not in self.blocks:
             raise BitcoindException("Unknown block", block_hash)
+        elif self.verbosity >= 2:
+            raw_block = dict(self.blocks[block_hash])
+            raw_block['tx'] = [self.txs.get(tx_id, tx_id) for tx_id in raw_block['tx']]
+            if self.verbosity >= 3:
+                raw_block['tx'] = [self.with_prevouts(tx) for tx in raw_block['tx']]
+            return raw_block
         else:
             return self.blocks[block_hash]
 
+    def with_prevouts(self, raw_tx):
+        # inputs as returned by getblock with verbosity 3 by Bitcoin Core 22+
+        if isinstance(raw_tx, str):
+            return raw_tx
+        raw_tx = dict(raw_tx)
+        raw_tx['vin'] = [dict(vin) for vin in raw_tx['vin']]
+        for vin in raw_tx['vin']:
+            if 'txid' in vin and vin['txid'] in self.txs:
+                output = self.txs[vin['txid']]['vout'][vin['vout']]
+                script_pub_key = {key: value for key, value in output['scriptPubKey'].items()
+                                  if key not in ('addresses', 'reqSigs')}
+                if len(output['scriptPubKey'].get('addresses', [])) == 1:
+                    script_pub_key['address'] = output['scriptPubKey']['addresses'][0]
+                vin['prevout'] = {'generated': False, 'height': 0,
+                                  'value': output['value'], 'scriptPubKey': script_pub_key}
+        return raw_tx
+
     def getblockcount(self):
         return max(self.heights.keys())
 
@@ -53,17 +85,38 @@ class BitcoinProxyMock(BitcoinProxy):
         else:
             return self.heights[block_height]
 
+    def getblockhashes(self, start_height, end_height):
+        return [self.getblockhash(height) for height in range(start_height, end_height + 1)]
+
+    def getblockheader(self, block_hash):
+        if block_hash not in self.blocks:
+            raise BitcoindException("Unknown block", block_hash)
+        return {key: value for key, value in self.blocks[block_hash].items() if key != 'tx'}
+
+    def getblockheaders(self, start_height, end_height):
+        self.calls['getblockheaders'] += 1
+        return [self.getblockheader(block_hash)
+                for block_hash in self.getblockhashes(start_height, end_height)]
+
     def getinfo(self):
         print("No info")
 
+    def getnetworkinfo(self):
+        return {'version': 150000}
+
     def getrawtransaction(self, tx_id, verbose=1):
+        self.calls['getrawtransaction'] += 1
         if tx_id not in self.txs:
             raise BitcoindException("Unknown transaction", tx_id)
         else:
             return self.txs[tx_id]
 
     def getrawtransactions(self, tx_ids, verbose=1):
-        results = []
+        self.calls['getrawtransactions'] += 1
+        results = {}
         for tx_id in tx_ids:
-            results.append(self.getrawtransaction(tx_id, verbose))
+            if tx_id in self.txs:
+                results[tx_id] = self.txs[tx_id]
+            else:
+                results[tx_id] = BitcoindException("Unknown transaction", tx_id)
         return results
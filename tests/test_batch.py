@@ -0,0 +1,66 @@
+import unittest
+
+from tests.rpc_mock import BitcoinProxyMock
+
+from bitcoingraph import batch
+from bitcoingraph.batch import BlockBatch
+from bitcoingraph.blockchain import Blockchain
+from bitcoingraph.model import Block
+
+BH2_HEIGHT = 100000
+TX2 = "fff2525b8931402dd09222c50775608f75787bd2b87e56995a7bdd30f79702c4"
+
+
+@unittest.skipIf(batch.np is None, 'numpy is not installed')
+class TestBlockBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.blockchain = Blockchain(BitcoinProxyMock(verbosity=2))
+        self.batch = self.blockchain.get_block_batch(BH2_HEIGHT, BH2_HEIGHT)
+        self.block = self.blockchain.get_block_by_height(BH2_HEIGHT)
+
+    def test_layout(self):
+        self.assertEqual(len(self.batch), 1)
+        self.assertEqual(self.batch.heights.tolist(), [BH2_HEIGHT])
+        self.assertEqual(self.batch.timestamps.tolist(), [self.block.timestamp])
+        self.assertEqual(self.batch.tx_offsets.tolist(), [0, 4])
+        self.assertEqual(self.batch.transaction_count, 4)
+        self.assertEqual(self.batch.txid(1), TX2)
+        self.assertEqual(self.batch.transaction_heights().tolist(), [BH2_HEIGHT] * 4)
+        self.assertEqual(self.batch.input_vouts.tolist()[0], -1)
+
+    def test_output_sums(self):
+        self.assertEqual(self.batch.output_sums().tolist(),
+                         [batch.to_satoshis(tx.output_sum()) for tx in self.block.transactions])
+
+    def test_input_sums(self):
+        expected = [0] + [batch.to_satoshis(tx.input_sum())
+                          for tx in self.block.transactions[1:]]
+        self.assertEqual(self.batch.input_sums().tolist(), expected)
+
+    def test_unresolved_inputs(self):
+        unresolved = self.blockchain.get_block_batch(BH2_HEIGHT, BH2_HEIGHT, resolve_inputs=False)
+        self.assertIsNone(unresolved.input_values)
+        with self.assertRaises(ValueError):
+            unresolved.input_sums()
+
+    def test_aggregated_outputs(self):
+        tx_rows, address_ids, values = self.batch.aggregated_outputs()
+        aggregated = {}
+        for tx_row, address_id, value in zip(tx_rows, address_ids, values):
+            aggregated.setdefault(int(tx_row), {})[self.batch.addresses[address_id]] = int(value)
+        for tx_row, tx in enumerate(self.block.transactions):
+            self.assertEqual(aggregated[tx_row],
+                             {address: batch.to_satoshis(value)
+                              for address, value in tx.aggregated_outputs().items()})
+
+    def test_in_batch_inputs(self):
+        parent = self.block.transactions[1]
+        child = {'txid': 'ab' * 32, 'vin': [{'txid': TX2, 'vout': 1}],
+                 'vout': [{'value': 44.43, 'scriptPubKey': {'type': 'nonstandard'}}]}
+        block = {'hash': '00' * 32, 'height': BH2_HEIGHT + 1, 'time': 0, 'difficulty': 1,
+                 'tx': [child]}
+        combined = BlockBatch.from_blocks([parent.block, Block(None, json_data=block)])
+        self.assertEqual(combined.input_values.tolist()[-1], 4444000000)
+        self.assertEqual(combined.input_sums()[-1] - combined.output_sums()[-1], 1000000)
+        self.assertEqual(combined.output_address_ids.tolist()[-1], -1)
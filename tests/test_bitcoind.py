@@ -0,0 +1,385 @@
+import asyncio
+import json
+import random
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from tests.bitcoind_server import BitcoindServer
+from tests.rpc_mock import BitcoinProxyMock
+
+from bitcoingraph import bitcoind
+from bitcoingraph.bitcoind import AsyncBitcoinProxy, BitcoinProxy, BitcoindException
+from bitcoingraph.blockchain import AsyncBlockchain, Blockchain, BlockchainException
+from bitcoingraph.serialization import REGTEST
+from bitcoingraph.stats import Stats
+
+
+CHAIN = ['{:064x}'.format(height) for height in range(5000)]
+
+
+class JSONRPCInterfaceStub:
+
+    def __init__(self):
+        self.batches = []
+
+    def call(self, rpcMethod, *params):
+        if rpcMethod == 'getblockhash':
+            return CHAIN[params[0]]
+        raise BitcoindException('Unsupported method ' + rpcMethod)
+
+    def batch(self, calls):
+        self.batches.append(calls)
+        responses = []
+        for call in calls:
+            height = call['params'][0]
+            if height < len(CHAIN):
+                responses.append({'result': CHAIN[height], 'error': None, 'id': call['id']})
+            else:
+                responses.append({'result': None, 'id': call['id'],
+                                  'error': {'code': -8, 'message': 'Block height out of range'}})
+        # bitcoind does not guarantee the order of batch responses
+        random.shuffle(responses)
+        return responses
+
+
+class TransactionRPCStub:
+
+    def __init__(self, tx_ids):
+        self.tx_ids = set(tx_ids)
+        self.batches = []
+
+    def batch(self, calls):
+        self.batches.append(calls)
+        responses = []
+        for call in calls:
+            tx_id = call['params'][0]
+            if tx_id in self.tx_ids:
+                responses.append({'result': {'txid': tx_id}, 'error': None, 'id': call['id']})
+            else:
+                responses.append({'result': None, 'id': call['id'], 'error': {
+                    'code': -5, 'message': 'No such mempool or blockchain transaction'}})
+        random.shuffle(responses)
+        return responses
+
+
+class RESTInterfaceStub:
+
+    def __init__(self):
+        self.requests = []
+
+    def get_headers(self, count, hash):
+        self.requests.append((count, hash))
+        height = CHAIN.index(hash)
+        return [{'hash': block_hash} for block_hash in CHAIN[height:height + count]]
+
+
+class TestBlockHashes(unittest.TestCase):
+
+    def setUp(self):
+        self.proxy = BitcoinProxy('localhost', 8332, verbosity=1)
+        self.proxy._jsonrpc_proxy = JSONRPCInterfaceStub()
+
+    def test_batch(self):
+        self.assertEqual(self.proxy.getblockhashes(10, 2509), CHAIN[10:2510])
+        self.assertEqual([len(calls) for calls in self.proxy._jsonrpc_proxy.batches],
+                         [bitcoind.BLOCK_HASH_BATCH_SIZE, bitcoind.BLOCK_HASH_BATCH_SIZE, 500])
+
+    def test_empty_range(self):
+        self.assertEqual(self.proxy.getblockhashes(10, 9), [])
+
+    def test_batch_error(self):
+        with self.assertRaises(BitcoindException):
+            self.proxy.getblockhashes(4990, 5010)
+
+    def test_rest(self):
+        self.proxy.method = 'REST'
+        self.proxy._rest_proxy = RESTInterfaceStub()
+        self.assertEqual(self.proxy.getblockhashes(7, 4206), CHAIN[7:4207])
+        self.assertEqual(len(self.proxy._rest_proxy.requests), 3)
+
+    def test_rest_tip(self):
+        self.proxy.method = 'REST'
+        self.proxy._rest_proxy = RESTInterfaceStub()
+        self.assertEqual(self.proxy.getblockhashes(4000, 6000), CHAIN[4000:])
+
+
+class TestRawTransactions(unittest.TestCase):
+
+    def setUp(self):
+        self.tx_ids = ['{:064x}'.format(n) for n in range(250)]
+        self.proxy = BitcoinProxy('localhost', 8332, verbosity=1)
+        self.proxy._jsonrpc_proxy = TransactionRPCStub(self.tx_ids[:-1])
+
+    def test_chunks(self):
+        results = self.proxy.getrawtransactions(self.tx_ids[:-1], chunk_size=100)
+        self.assertEqual(sorted(len(calls) for calls in self.proxy._jsonrpc_proxy.batches),
+                         [49, 100, 100])
+        self.assertEqual(list(results), self.tx_ids[:-1])
+        for tx_id, result in results.items():
+            self.assertEqual(result['txid'], tx_id)
+
+    def test_item_errors(self):
+        results = self.proxy.getrawtransactions(self.tx_ids, chunk_size=100)
+        self.assertIsInstance(results[self.tx_ids[-1]], BitcoindException)
+        self.assertEqual(results[self.tx_ids[0]]['txid'], self.tx_ids[0])
+
+    def test_duplicates(self):
+        results = self.proxy.getrawtransactions(self.tx_ids[:2] * 2)
+        self.assertEqual(list(results), self.tx_ids[:2])
+        self.assertEqual(len(self.proxy._jsonrpc_proxy.batches[0]), 2)
+
+
+BH1 = "000000000002d01c1fccc21636b607dfd930d31d01c3a62104612a1719011250"
+BH2 = "000000000003ba27aa200b1cecaad478d2b00432346c3f1f3986da1afd33e506"
+TX2 = "fff2525b8931402dd09222c50775608f75787bd2b87e56995a7bdd30f79702c4"
+
+
+class AsyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = BitcoindServer(BitcoinProxyMock()).start()
+        self.proxy = AsyncBitcoinProxy('127.0.0.1', self.server.port, max_in_flight=4)
+
+    def tearDown(self):
+        self.proxy.close()
+        self.server.stop()
+
+    def run_async(self, coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+
+class TestBinaryBlocks(unittest.TestCase):
+
+    def setUp(self):
+        self.server = BitcoindServer(BitcoinProxyMock()).start()
+        self.proxy = BitcoinProxy('127.0.0.1', self.server.port, method='REST', binary=True)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_getblock(self):
+        expected = self.server.verbose_block(BH2)
+        block = self.proxy.getblock(BH2)
+        for key in ['hash', 'height', 'time', 'difficulty', 'previousblockhash',
+                    'nextblockhash']:
+            self.assertEqual(block[key], expected[key])
+        self.assertEqual([tx['txid'] for tx in block['tx']],
+                         [tx['txid'] for tx in expected['tx']])
+
+    def test_blockchain(self):
+        block = Blockchain(self.proxy).get_block_by_hash(BH2)
+        self.assertEqual(block.height, 100000)
+        self.assertEqual(block.transactions[1].outputs[1].value, 44.44)
+        self.assertEqual(block.transactions[1].outputs[1].addresses,
+                         ['1EYTGtG4LnFfiMvjJdsU7GMGCQvsRSjYhx'])
+
+    def test_regtest_addresses(self):
+        with BitcoindServer(BitcoinProxyMock(), chain='regtest') as server:
+            proxy = BitcoinProxy('127.0.0.1', server.port, method='REST', binary=True)
+            self.assertEqual(proxy.address_format, REGTEST)
+            output = proxy.getblock(BH2)['tx'][1]['vout'][1]['scriptPubKey']
+            self.assertEqual(output['type'], 'pubkeyhash')
+            self.assertIn(output['addresses'][0][0], 'mn')
+
+
+class TestBlockHeaders(unittest.TestCase):
+
+    def test_rpc_and_rest(self):
+        with BitcoindServer(BitcoinProxyMock()) as server:
+            for method in ['RPC', 'REST']:
+                proxy = BitcoinProxy('127.0.0.1', server.port, method=method)
+                headers = proxy.getblockheaders(99999, 100001)
+                self.assertEqual([header['height'] for header in headers],
+                                 [99999, 100000, 100001])
+                self.assertEqual(headers[1]['hash'], BH2)
+                self.assertNotIn('tx', headers[1])
+                self.assertEqual(proxy.getblockheader(BH2)['height'], 100000)
+                with self.assertRaises(BitcoindException):
+                    proxy.getblockheader('00' * 32)
+
+
+class TestPrevoutVerbosity(unittest.TestCase):
+
+    def test_detection(self):
+        for version, verbosity in [(140000, 1), (150000, 2), (230000, 3)]:
+            with BitcoindServer(BitcoinProxyMock(), version=version) as server:
+                proxy = BitcoinProxy('127.0.0.1', server.port)
+                self.assertEqual(proxy.verbosity, verbosity)
+
+    def test_no_parent_requests(self):
+        with BitcoindServer(BitcoinProxyMock(), version=230000) as server:
+            block = Blockchain(BitcoinProxy('127.0.0.1', server.port)).get_block_by_hash(BH2)
+            requests = server.requests
+            self.assertEqual([tx.input_sum() for tx in block.transactions[1:3]], [0.04, 3.0])
+            self.assertEqual(server.requests, requests)
+
+
+class TestRawTransactionsServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = BitcoindServer(BitcoinProxyMock(), latency=0.1).start()
+        self.proxy = BitcoinProxy('127.0.0.1', self.server.port, verbosity=1)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_concurrent_chunks(self):
+        tx_ids = sorted(self.server.backend.txs) + ['aa']
+        start = time.time()
+        results = self.proxy.getrawtransactions(tx_ids, chunk_size=2, workers=4)
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(self.server.requests, (len(tx_ids) + 1) // 2)
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertLessEqual(self.server.max_in_flight, 4)
+        self.assertIsInstance(results.pop('aa'), BitcoindException)
+        self.assertEqual(results, self.server.backend.txs)
+
+
+class TestTransportFaults(unittest.TestCase):
+
+    def test_work_queue_rejections(self):
+        stats = Stats()
+        with BitcoindServer(BitcoinProxyMock(), latency=0.05, work_queue=1) as server:
+            proxy = BitcoinProxy('127.0.0.1', server.port, verbosity=1, stats=stats,
+                                 retries=100, retry_delay=0.01)
+            tx_ids = sorted(server.backend.txs)
+            results = proxy.getrawtransactions(tx_ids, chunk_size=2, workers=4)
+            self.assertEqual(results, server.backend.txs)
+            self.assertEqual(server.max_in_flight, 1)
+            self.assertGreater(server.rejected, 0)
+        self.assertEqual(stats.get('rpc', 'batch:getrawtransaction').retries, server.rejected)
+
+    def test_dropped_connections(self):
+        for method in ['RPC', 'REST']:
+            with BitcoindServer(BitcoinProxyMock(), drop_rate=0.3, seed=1) as server:
+                proxy = BitcoinProxy('127.0.0.1', server.port, method=method, verbosity=2,
+                                     retry_delay=0)
+                for _ in range(10):
+                    self.assertEqual(proxy.getblock(BH2)['hash'], BH2)
+                self.assertGreater(server.dropped, 0)
+
+    def test_retries_exhausted(self):
+        with BitcoindServer(BitcoinProxyMock(), drop_rate=1.0) as server:
+            proxy = BitcoinProxy('127.0.0.1', server.port, verbosity=1, retries=3,
+                                 retry_delay=0)
+            with self.assertRaisesRegex(BitcoindException, "after retries: Couldn't connect"):
+                proxy.getblockhash(99999)
+            self.assertEqual(server.dropped, 3)
+
+    def test_work_queue_retries_exhausted(self):
+        for method, message in [('RPC', 'RPC call failed after retries: RPC work queue'),
+                                ('REST', 'REST request failed after retries: REST work queue')]:
+            with BitcoindServer(BitcoinProxyMock(), latency=0.2, work_queue=1) as server:
+                proxy = BitcoinProxy('127.0.0.1', server.port, method=method, verbosity=2,
+                                     retries=2, retry_delay=0)
+                with ThreadPoolExecutor(2) as executor:
+                    futures = [executor.submit(proxy.getblock, BH2) for _ in range(2)]
+                with self.assertRaisesRegex(BitcoindException, message):
+                    for future in futures:
+                        future.result()
+
+    def test_bandwidth(self):
+        with BitcoindServer(BitcoinProxyMock(), bandwidth=100000) as server:
+            proxy = BitcoinProxy('127.0.0.1', server.port, method='REST')
+            start = time.time()
+            for _ in range(3):
+                proxy.getblock(BH2)
+            size = len(json.dumps(server.verbose_block(BH2)))
+            self.assertGreaterEqual(time.time() - start, 3 * size / 100000)
+
+
+class TestAsyncBitcoinProxy(AsyncTestCase):
+
+    def test_getblock(self):
+        block = self.run_async(self.proxy.getblock(BH2))
+        self.assertEqual(block['height'], 100000)
+        self.assertEqual(block['tx'][1]['txid'], TX2)
+
+    def test_getblockhash(self):
+        self.assertEqual(self.run_async(self.proxy.getblockhash(99999)), BH1)
+
+    def test_getrawtransaction(self):
+        tx = self.run_async(self.proxy.getrawtransaction(TX2))
+        self.assertEqual(tx['txid'], TX2)
+
+    def test_getblockheaders(self):
+        header = self.run_async(self.proxy.getblockheader(BH2))
+        self.assertEqual(header['height'], 100000)
+        headers = self.run_async(self.proxy.getblockheaders(99999, 100000))
+        self.assertEqual([header['hash'] for header in headers], [BH1, BH2])
+
+    def test_error(self):
+        with self.assertRaises(BitcoindException):
+            self.run_async(self.proxy.getblockhash(123))
+
+    def test_bounded_in_flight(self):
+        self.server.latency = 0.1
+
+        async def fetch_all():
+            return await asyncio.gather(*[self.proxy.getblockhash(99999) for _ in range(12)])
+
+        start = time.time()
+        self.assertEqual(self.run_async(fetch_all()), [BH1] * 12)
+        self.assertLess(time.time() - start, 1.0)
+        self.assertLessEqual(self.server.max_in_flight, 4)
+        self.assertGreater(self.server.max_in_flight, 1)
+
+    def test_several_event_loops(self):
+        self.server.latency = 0.01
+
+        async def fetch_all():
+            return await asyncio.gather(*[self.proxy.getblockhash(99999) for _ in range(8)])
+
+        for _ in range(3):
+            self.assertEqual(asyncio.run(fetch_all()), [BH1] * 8)
+        self.assertLessEqual(self.server.max_in_flight, 4)
+
+
+class TestAsyncBlockchain(AsyncTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.blockchain = AsyncBlockchain(self.proxy)
+
+    def test_get_block_by_height(self):
+        block = self.run_async(self.blockchain.get_block_by_height(100000))
+        self.assertEqual(block.hash, BH2)
+        self.assertEqual(len(block.transactions), 4)
+
+    def test_get_blocks_in_range(self):
+        async def heights():
+            return [block.height async for block in
+                    self.blockchain.get_blocks_in_range(99999, 100005, window_size=2)]
+
+        self.assertEqual(self.run_async(heights()), [99999, 100000, 100001])
+
+    def test_get_block_header(self):
+        for height_or_hash in [100000, BH2]:
+            block = self.run_async(self.blockchain.get_block_header(height_or_hash))
+            self.assertEqual((block.hash, block.height), (BH2, 100000))
+            self.assertEqual(block.previous_block.hash, BH1)
+        with self.assertRaises(BlockchainException):
+            self.run_async(self.blockchain.get_block_header('00' * 32))
+
+    def test_get_block_headers_in_range(self):
+        async def hashes():
+            return [block.hash async for block in
+                    self.blockchain.get_block_headers_in_range(99999, 100005, batch_size=2)]
+
+        block_hashes = self.run_async(hashes())
+        self.assertEqual(block_hashes[:2], [BH1, BH2])
+        self.assertEqual(len(block_hashes), 3)
+
+    def test_get_transaction(self):
+        tx = self.run_async(self.blockchain.get_transaction(TX2))
+        self.assertEqual(tx.outputs[1].value, 44.44)
+        self.assertEqual(tx.block.height, 100000)
+
+    def test_exceptions(self):
+        with self.assertRaises(BlockchainException):
+            self.run_async(self.blockchain.get_block_by_height(123))
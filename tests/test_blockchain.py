@@ -3,7 +3,7 @@ import unittest
 from tests.rpc_mock import BitcoinProxyMock
 
 from bitcoingraph.blockchain import Blockchain, BlockchainException
-from bitcoingraph.model import Input, Output
+from bitcoingraph.model import Input, Output, Transaction
 
 BH1 = "000000000002d01c1fccc21636b607dfd930d31d01c3a62104612a1719011250"
 BH1_HEIGHT = 99999
@@ -102,6 +102,84 @@ class TestBlock(TestBlockchainObject):
         self.assertEqual(block.previous_block.hash, "0000000000002103637910d267190996687fb095880d432c6531a527c8ec53d1")
 
 
+class TestVerboseBlock(TestBlockchainObject):
+
+    def setUp(self):
+        self.bitcoin_proxy = BitcoinProxyMock(verbosity=2)
+        self.blockchain = Blockchain(self.bitcoin_proxy)
+
+    def test_transactions_inline(self):
+        block = self.blockchain.get_block_by_hash(BH2)
+        # transactions must not be fetched individually
+        self.bitcoin_proxy.txs = {}
+        self.assertEqual(len(block.transactions), 4)
+        self.assertTrue(block.transactions[0].is_coinbase())
+        self.assertEqual(block.transactions[1].txid, TX2)
+        self.assertEqual(block.transactions[1].inputs[0].output_reference['txid'], TX3)
+        self.assertEqual(block.transactions[1].outputs[1].value, 44.44)
+
+    def test_transaction_block(self):
+        block = self.blockchain.get_block_by_hash(BH2)
+        self.assertIs(block.transactions[1].block, block)
+
+
+class TestBlockHeader(TestBlockchainObject):
+
+    def test_get_block_header(self):
+        for height_or_hash in [BH2_HEIGHT, BH2]:
+            block = self.blockchain.get_block_header(height_or_hash)
+            self.assertEqual((block.hash, block.height), (BH2, BH2_HEIGHT))
+            self.assertEqual(block.timestamp, 1293623863)
+            self.assertEqual(block.next_block.hash, BH3)
+            self.assertEqual(block.previous_block.hash, BH1)
+        self.assertEqual(self.bitcoin_proxy.calls['getblock'], 0)
+
+    def test_lazy_transactions(self):
+        block = self.blockchain.get_block_header(BH2)
+        self.assertEqual(block.transactions[1].txid, TX2)
+        self.assertEqual(self.bitcoin_proxy.calls['getblock'], 1)
+
+    def test_get_block_headers_in_range(self):
+        blocks = list(self.blockchain.get_block_headers_in_range(99999, 100005, batch_size=2))
+        self.assertEqual([block.hash for block in blocks], [BH1, BH2, BH3])
+        self.assertEqual(self.bitcoin_proxy.calls['getblockheaders'], 2)
+        self.assertFalse(blocks[-1].has_next_block())
+        self.assertEqual(self.bitcoin_proxy.calls['getblock'], 0)
+
+    def test_exceptions(self):
+        with self.assertRaises(BlockchainException):
+            self.blockchain.get_block_header(123)
+        with self.assertRaises(BlockchainException):
+            self.blockchain.get_block_header('aa')
+
+
+class TestPrevoutBlock(TestBlockchainObject):
+
+    def setUp(self):
+        self.bitcoin_proxy = BitcoinProxyMock(verbosity=3)
+        self.blockchain = Blockchain(self.bitcoin_proxy)
+
+    def test_inputs_resolved(self):
+        expected = Blockchain(BitcoinProxyMock()).get_block_by_hash(BH2)
+        block = self.blockchain.get_block_by_hash(BH2)
+        # parents must not be fetched
+        self.bitcoin_proxy.txs = {}
+        for tx, expected_tx in zip(block.transactions[1:], expected.transactions[1:]):
+            self.assertTrue(all(input.is_resolved() for input in tx.inputs))
+            self.assertEqual(tx.input_sum(), expected_tx.input_sum())
+            self.assertEqual(tx.aggregated_inputs(), expected_tx.aggregated_inputs())
+        self.assertEqual(self.bitcoin_proxy.calls['getrawtransaction'], 0)
+
+    def test_single_address(self):
+        tx = Transaction(self.blockchain, json_data={
+            'txid': TX2, 'blockhash': BH2, 'vin': [],
+            'vout': [{'value': 1.0, 'scriptPubKey': {
+                'type': 'witness_v0_keyhash',
+                'address': 'bc1qar0srrr7xfkvy5l643lydnw9re59gtzzwf5mdq'}}]})
+        self.assertEqual(tx.outputs[0].addresses,
+                         ['bc1qar0srrr7xfkvy5l643lydnw9re59gtzzwf5mdq'])
+
+
 class TestTxInput(TestBlockchainObject):
 
     def test_is_coinbase(self):
@@ -129,6 +207,13 @@ class TestTxInput(TestBlockchainObject):
         tx_input = tx.inputs[0]
         self.assertEqual(tx_input.output_reference['vout'], 0)
 
+    def test_compact_fields(self):
+        tx = self.blockchain.get_transaction(TX2)
+        tx_input = tx.inputs[0]
+        self.assertEqual((tx_input.txid, tx_input.vout), (TX3, 0))
+        for obj in [tx.block, tx, tx_input, tx.outputs[0]]:
+            self.assertFalse(hasattr(obj, '__dict__'))
+
     def test_prev_tx_output(self):
         tx = self.blockchain.get_transaction(TX2)
         tx_input = tx.inputs[0]
@@ -212,6 +297,95 @@ class TestTransaction(TestBlockchainObject):
             self.assertIsInstance(tx_output, Output)
 
 
+class TestInputPrefetch(TestBlockchainObject):
+
+    def setUp(self):
+        self.bitcoin_proxy = BitcoinProxyMock(verbosity=2)
+        self.blockchain = Blockchain(self.bitcoin_proxy)
+
+    def test_block(self):
+        block = self.blockchain.get_block_by_hash(BH2)
+        block.prefetch_inputs()
+        self.assertTrue(all(input.is_resolved()
+                            for tx in block.transactions for input in tx.inputs))
+        self.assertEqual(self.bitcoin_proxy.calls['getrawtransactions'], 1)
+        values = [tx.input_sum() for tx in block.transactions[1:]]
+        self.assertEqual(self.bitcoin_proxy.calls['getrawtransaction'], 0)
+        expected = Blockchain(BitcoinProxyMock()).get_block_by_hash(BH2)
+        self.assertEqual(values, [tx.input_sum() for tx in expected.transactions[1:]])
+
+    def test_in_block_parent(self):
+        block = self.blockchain.get_block_by_hash(BH2)
+        child = Transaction(self.blockchain, block, json_data={
+            'txid': 'ab' * 32, 'vin': [{'txid': TX2, 'vout': 1}], 'vout': []})
+        self.blockchain.prefetch_inputs([block.transactions[1], child])
+        self.assertIs(child.inputs[0].output, block.transactions[1].outputs[1])
+
+    def test_range(self):
+        blocks = list(self.blockchain.prefetch_blocks_in_range(
+            99999, 100000, window_size=2, workers=2, prefetch_inputs=True))
+        self.assertEqual(self.bitcoin_proxy.calls['getrawtransactions'], 1)
+        calls = self.bitcoin_proxy.calls['getrawtransaction']
+        for block in blocks:
+            for tx in block.transactions:
+                tx.reduced_inputs()
+        self.assertEqual(self.bitcoin_proxy.calls['getrawtransaction'], calls)
+
+
+class TestTransactionCache(TestBlockchainObject):
+
+    def setUp(self):
+        self.bitcoin_proxy = BitcoinProxyMock()
+        self.blockchain = Blockchain(self.bitcoin_proxy, cache_size=2)
+
+    def test_no_cache(self):
+        blockchain = Blockchain(self.bitcoin_proxy)
+        self.assertIsNone(blockchain.transaction_cache)
+        blockchain.get_transaction(TX1)
+        blockchain.get_transaction(TX1)
+        self.assertEqual(self.bitcoin_proxy.calls['getrawtransaction'], 2)
+
+    def test_hit(self):
+        tx = self.blockchain.get_transaction(TX1)
+        self.assertIs(self.blockchain.get_transaction(TX1), tx)
+        self.assertEqual(self.bitcoin_proxy.calls['getrawtransaction'], 1)
+        self.assertEqual(self.blockchain.transaction_cache.hits, 1)
+        self.assertEqual(self.blockchain.transaction_cache.misses, 1)
+
+    def test_input_resolution(self):
+        blockchain = Blockchain(self.bitcoin_proxy, cache_size=100)
+        tx = blockchain.get_transaction(TXM)
+        tx.input_sum()
+        parents = {input.output_reference['txid'] for input in tx.inputs}
+        self.assertEqual(self.bitcoin_proxy.calls['getrawtransaction'], 1 + len(parents))
+        # a new object for the same transaction resolves its inputs from the cache
+        tx = Transaction(blockchain, json_data=self.bitcoin_proxy.txs[TXM])
+        tx.reduced_inputs()
+        self.assertEqual(self.bitcoin_proxy.calls['getrawtransaction'], 1 + len(parents))
+
+    def test_get_transactions(self):
+        tx = self.blockchain.get_transaction(TX1)
+        txs = self.blockchain.get_transactions([TX1, TX2])
+        self.assertIs(txs[0], tx)
+        self.assertIn(TX2, self.blockchain.transaction_cache)
+
+    def test_eviction(self):
+        self.blockchain.get_transaction(TX1)
+        self.blockchain.get_transaction(TX2)
+        self.blockchain.get_transaction(TX3)
+        self.assertEqual(self.blockchain.transaction_cache.evictions, 1)
+        self.assertNotIn(TX1, self.blockchain.transaction_cache)
+        self.assertIn(TX3, self.blockchain.transaction_cache)
+
+    def test_byte_bound(self):
+        blockchain = Blockchain(self.bitcoin_proxy, cache_bytes=300)
+        blockchain.get_transaction(TX2)
+        self.assertEqual(blockchain.transaction_cache.bytes, 259)
+        blockchain.get_transaction(TX1)
+        self.assertEqual(len(blockchain.transaction_cache), 1)
+        self.assertLessEqual(blockchain.transaction_cache.bytes, 300)
+
+
 class TestBlockchain(TestBlockchainObject):
 
     def test_get_block_by_hash(self):
@@ -230,6 +404,25 @@ class TestBlockchain(TestBlockchainObject):
         self.assertEqual(blocks[1].height, 100000)
         self.assertEqual(blocks[2].height, 100001)
 
+    def test_get_block_hashes(self):
+        self.assertEqual(self.blockchain.get_block_hashes(99999, 100001), [BH1, BH2, BH3])
+        self.assertEqual(self.blockchain.get_block_hashes(100001, 100009), [BH3])
+
+    def test_prefetch_blocks_in_range(self):
+        blocks = [block for block in self.blockchain.prefetch_blocks_in_range(
+                  99999, 100001, window_size=2, workers=2)]
+        self.assertEqual([block.height for block in blocks], [99999, 100000, 100001])
+        self.assertEqual(blocks[1].hash, BH2)
+
+    def test_prefetch_blocks_beyond_max_height(self):
+        blocks = [block for block in self.blockchain.prefetch_blocks_in_range(
+                  100000, 100005)]
+        self.assertEqual([block.height for block in blocks], [100000, 100001])
+
+    def test_prefetch_exceptions(self):
+        with self.assertRaises(BlockchainException):
+            list(self.blockchain.prefetch_blocks_in_range(123, 125))
+
     def test_get_transaction(self):
         tx = self.blockchain.get_transaction(TX1)
         self.assertEqual(tx.txid, TX1)
@@ -238,6 +431,17 @@ class TestBlockchain(TestBlockchainObject):
         tx_ids = [TX1, TX2]
         txs = self.blockchain.get_transactions(tx_ids)
         self.assertEqual(2, len(txs))
+        self.assertEqual([tx.txid for tx in txs], tx_ids)
+        self.assertEqual(txs[1].outputs[1].value, 44.44)
+
+    def test_get_transactions_errors(self):
+        with self.assertRaises(BlockchainException):
+            self.blockchain.get_transactions([TX1, 'aa'])
+        errors = {}
+        txs = self.blockchain.get_transactions([TX1, 'aa', TX2], errors)
+        self.assertEqual([tx.txid for tx in txs], [TX1, TX2])
+        self.assertEqual(list(errors), ['aa'])
+        self.assertIsInstance(errors['aa'], BlockchainException)
 
     def test_get_max_blockheight(self):
         max_height = self.blockchain.get_max_block_height()
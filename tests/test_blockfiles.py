@@ -0,0 +1,206 @@
+import csv
+import json
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from tests.block_builder import build_block
+
+from bitcoingraph.bitcoingraph import BitcoinGraph
+from bitcoingraph.blockchain import Blockchain, BlockchainException
+from bitcoingraph.bitcoind import BitcoindException
+from bitcoingraph.blockfiles import MAINNET_MAGIC, REGTEST_MAGIC, BlockFileSource
+from bitcoingraph.model import Output
+from bitcoingraph.serialization import double_sha256
+
+TEST_DATA_PATH = Path(__file__).parent / 'data'
+
+COINBASE_TXS = ['110ed92f558a1e3a94976ddea5c32f030670b5c58c3cc4d857ac14d7a1547a90',
+                '8c14f0db3df150123e6f3dbbf30f8b955a8249b62ac1d1ff16284aefa3d06d87']
+TX2 = 'fff2525b8931402dd09222c50775608f75787bd2b87e56995a7bdd30f79702c4'
+TX3 = '6359f0868171b1d194cbee1af2f16ea598ae8fad666d9b012c8ed2b79a236ec4'
+
+
+def load_tx(tx_id):
+    with (TEST_DATA_PATH / 'tx_{}.json'.format(tx_id)).open() as f:
+        return json.load(f)
+
+
+def block_hash(block):
+    return double_sha256(block[:80])[::-1].hex()
+
+
+def frame(block, magic=MAINNET_MAGIC):
+    return magic + struct.pack('<I', len(block)) + block
+
+
+class BlockFileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.blocks_dir = tempfile.mkdtemp()
+        genesis = build_block(None, [load_tx(COINBASE_TXS[0])], 1231006505)
+        block1 = build_block(block_hash(genesis), [load_tx(COINBASE_TXS[1])], 1231006600)
+        stale1 = build_block(block_hash(genesis), [load_tx(TX3)], 1231006601)
+        block2 = build_block(block_hash(block1), [load_tx(TX2), load_tx(TX3)], 1231006700)
+        self.chain = [block_hash(block) for block in (genesis, block1, block2)]
+        self.stale = block_hash(stale1)
+        # blocks are not stored in height order
+        self.write_file('blk00000.dat', frame(genesis) + frame(block2) + bytes(64))
+        self.write_file('blk00001.dat', frame(stale1) + frame(block1))
+
+    def tearDown(self):
+        shutil.rmtree(self.blocks_dir)
+
+    def write_file(self, name, data):
+        with open(os.path.join(self.blocks_dir, name), 'wb') as f:
+            f.write(data)
+
+
+class TestBlockFileSource(BlockFileTestCase):
+
+    def test_best_chain(self):
+        source = BlockFileSource(self.blocks_dir)
+        self.assertEqual(source.getblockcount(), 2)
+        self.assertEqual(source.getblockhashes(0, 2), self.chain)
+        self.assertEqual(source.getblockhash(1), self.chain[1])
+
+    def test_getblock(self):
+        source = BlockFileSource(self.blocks_dir)
+        block = source.getblock(self.chain[1])
+        self.assertEqual(block['height'], 1)
+        self.assertEqual(block['previousblockhash'], self.chain[0])
+        self.assertEqual(block['nextblockhash'], self.chain[2])
+        self.assertEqual([tx['txid'] for tx in block['tx']], [COINBASE_TXS[1]])
+        self.assertNotIn('nextblockhash', source.getblock(self.chain[2]))
+
+    def test_getblockheaders(self):
+        source = BlockFileSource(self.blocks_dir)
+        headers = source.getblockheaders(0, 2)
+        self.assertEqual([header['hash'] for header in headers], self.chain)
+        self.assertEqual([header['height'] for header in headers], [0, 1, 2])
+        self.assertEqual(headers[1]['time'], 1231006600)
+        self.assertEqual(headers[1]['nextblockhash'], self.chain[2])
+        self.assertNotIn('previousblockhash', headers[0])
+        self.assertNotIn('nextblockhash', headers[2])
+
+    def test_stale_block(self):
+        source = BlockFileSource(self.blocks_dir)
+        block = source.getblock(self.stale)
+        self.assertEqual(block['height'], 1)
+        self.assertNotIn('nextblockhash', block)
+
+    def test_obfuscated(self):
+        key = bytes.fromhex('0123456789abcdef')
+        for name in ['blk00000.dat', 'blk00001.dat']:
+            path = os.path.join(self.blocks_dir, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            self.write_file(name, bytes(b ^ key[i % len(key)] for i, b in enumerate(data)))
+        self.write_file('xor.dat', key)
+        source = BlockFileSource(self.blocks_dir)
+        self.assertEqual(source.getblockhashes(0, 2), self.chain)
+        self.assertEqual(source.getblock(self.chain[2])['tx'][0]['txid'], TX2)
+
+    def test_base_height(self):
+        source = BlockFileSource(self.blocks_dir, base_height=100)
+        self.assertEqual(source.getblockcount(), 102)
+        self.assertEqual(source.getblockhash(101), self.chain[1])
+
+    def test_blockchain(self):
+        blockchain = Blockchain(BlockFileSource(self.blocks_dir))
+        blocks = list(blockchain.prefetch_blocks_in_range(0, 5))
+        self.assertEqual([block.hash for block in blocks], self.chain)
+        self.assertEqual(blocks[2].transactions[0].outputs[1].addresses,
+                         ['1EYTGtG4LnFfiMvjJdsU7GMGCQvsRSjYhx'])
+        with self.assertRaises(BlockchainException):
+            blockchain.get_transaction(TX2)
+
+    def test_truncated_frame(self):
+        block3 = build_block(self.chain[2], [load_tx(TX3)], 1231006800)
+        truncated = MAINNET_MAGIC + struct.pack('<I', 40) + block3[:40]
+        self.write_file('blk00002.dat', truncated + frame(block3))
+        source = BlockFileSource(self.blocks_dir)
+        self.assertEqual(len(source._index), 5)
+        self.assertEqual(source.getblockhashes(0, 3), self.chain + [block_hash(block3)])
+
+    def test_pickle(self):
+        source = BlockFileSource(self.blocks_dir)
+        block = source.getblock(self.chain[2])
+        with mock.patch.object(BlockFileSource, '_scan') as scan:
+            copy = pickle.loads(pickle.dumps(source))
+            self.assertEqual(copy.getblock(self.chain[2]), block)
+            self.assertEqual(copy.getblockcount(), 2)
+            scan.assert_not_called()
+
+
+class TestNetworks(unittest.TestCase):
+
+    # getblock JSON of a regtest node for outputs paying to the key hash
+    # 751e76e8199196d454941c45d1b3a323f1433bd6 (BIP 173 test vector)
+    REGTEST_VOUT = [
+        {'value': 25.0, 'n': 0,
+         'scriptPubKey': {'type': 'pubkeyhash', 'address': 'mrCDrCybB6J1vRfbwM5hemdJz73FwDBC8r'}},
+        {'value': 25.0, 'n': 1,
+         'scriptPubKey': {'type': 'witness_v0_keyhash',
+                          'address': 'bcrt1qw508d6qejxtdg4y5r3zarvary0c5xw7kygt080'}}]
+
+    def setUp(self):
+        self.blocks_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.blocks_dir)
+
+    def test_regtest(self):
+        key_hash = bytes.fromhex('751e76e8199196d454941c45d1b3a323f1433bd6')
+        scripts = [bytes.fromhex('76a914') + key_hash + bytes.fromhex('88ac'),
+                   bytes.fromhex('0014') + key_hash]
+        data = struct.pack('<i', 1) + b'\x01' + bytes(32) + b'\xff' * 4 + b'\x02\x01\x00' + \
+            b'\xff' * 4 + b'\x02'
+        for script in scripts:
+            data += struct.pack('<Q', 25 * 100000000) + bytes([len(script)]) + script
+        data += bytes(4)
+        raw_tx = {'txid': double_sha256(data)[::-1].hex(), 'hex': data.hex()}
+        block = build_block(None, [raw_tx], 1296688602)
+        with open(os.path.join(self.blocks_dir, 'blk00000.dat'), 'wb') as f:
+            f.write(frame(block, REGTEST_MAGIC))
+
+        source = BlockFileSource(self.blocks_dir, magic=REGTEST_MAGIC)
+        vout = source.getblock(block_hash(block))['tx'][0]['vout']
+        for parsed, expected in zip(vout, self.REGTEST_VOUT):
+            parsed_output = Output(None, parsed['n'], parsed)
+            expected_output = Output(None, expected['n'], expected)
+            self.assertEqual(parsed_output.type, expected_output.type)
+            self.assertEqual(parsed_output.addresses, expected_output.addresses)
+        with self.assertRaises(BitcoindException):
+            BlockFileSource(self.blocks_dir, magic=bytes(4))
+
+
+class TestExport(BlockFileTestCase):
+
+    def test_export(self):
+        output_path = os.path.join(self.blocks_dir, 'export')
+        bcgraph = BitcoinGraph(blockchain={'blocks_dir': self.blocks_dir})
+        bcgraph.export(0, 2, output_path)
+        with open(os.path.join(output_path, 'blocks.csv')) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual([row[0] for row in rows], self.chain)
+        self.assertEqual([row[1] for row in rows], ['0', '1', '2'])
+        with open(os.path.join(output_path, 'rel_input.csv')) as f:
+            self.assertEqual(len(list(csv.reader(f))), 2)
+
+    def test_parallel_export(self):
+        bcgraph = BitcoinGraph(blockchain={'blocks_dir': self.blocks_dir})
+        single_path = os.path.join(self.blocks_dir, 'single')
+        parallel_path = os.path.join(self.blocks_dir, 'parallel')
+        bcgraph.export(0, 2, single_path)
+        bcgraph.export(0, 2, parallel_path, workers=2)
+        self.assertEqual(sorted(os.listdir(single_path)), sorted(os.listdir(parallel_path)))
+        for filename in os.listdir(single_path):
+            with open(os.path.join(single_path, filename), 'rb') as f, \
+                    open(os.path.join(parallel_path, filename), 'rb') as parallel_f:
+                self.assertEqual(parallel_f.read(), f.read(), filename)
@@ -0,0 +1,84 @@
+import unittest
+
+from tests.block_builder import serialize_block
+from tests.chain_generator import SUBSIDY, SyntheticChain
+from tests.rpc_mock import BitcoinProxyMock
+
+from bitcoingraph.blockchain import Blockchain
+from bitcoingraph.serialization import parse_block
+
+
+class TestSyntheticChain(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.chain = SyntheticChain(blocks=60, transactions_per_block=8, seed=7)
+
+    def test_deterministic(self):
+        other = SyntheticChain(blocks=60, transactions_per_block=8, seed=7)
+        self.assertEqual(other.heights, self.chain.heights)
+        self.assertNotEqual(SyntheticChain(blocks=60, transactions_per_block=8, seed=8).heights,
+                            self.chain.heights)
+
+    def test_links(self):
+        for height in range(1, len(self.chain)):
+            block = self.chain.blocks[self.chain.heights[height]]
+            self.assertEqual(block['height'], height)
+            self.assertEqual(block['previousblockhash'], self.chain.heights[height - 1])
+            self.assertEqual(self.chain.blocks[block['previousblockhash']]['nextblockhash'],
+                             block['hash'])
+        self.assertNotIn('previousblockhash', self.chain.blocks[self.chain.heights[0]])
+
+    def test_serialization(self):
+        for block_hash in self.chain.heights.values():
+            raw_block = self.chain.blocks[block_hash]
+            block = parse_block(serialize_block(raw_block, self.chain.txs))
+            self.assertEqual(block['hash'], block_hash)
+            self.assertEqual([tx['txid'] for tx in block['tx']], raw_block['tx'])
+
+    def test_spends(self):
+        spent = set()
+        for height in range(len(self.chain)):
+            block = self.chain.blocks[self.chain.heights[height]]
+            fees = 0
+            for tx_id in block['tx'][1:]:
+                tx = self.chain.txs[tx_id]
+                input_sum = 0
+                for vin in tx['vin']:
+                    outpoint = (vin['txid'], vin['vout'])
+                    self.assertNotIn(outpoint, spent)
+                    spent.add(outpoint)
+                    source = self.chain.txs[vin['txid']]
+                    self.assertLess(self.chain.blocks[source['blockhash']]['height'], height)
+                    input_sum += round(source['vout'][vin['vout']]['value'] * 1e8)
+                output_sum = sum(round(vout['value'] * 1e8) for vout in tx['vout'])
+                self.assertGreaterEqual(input_sum, output_sum)
+                fees += input_sum - output_sum
+            coinbase = self.chain.txs[block['tx'][0]]
+            self.assertIn('coinbase', coinbase['vin'][0])
+            self.assertEqual(sum(round(vout['value'] * 1e8) for vout in coinbase['vout']),
+                             SUBSIDY + fees)
+
+    def test_shape(self):
+        types = set()
+        addresses = []
+        for tx in self.chain.txs.values():
+            for vout in tx['vout']:
+                types.add(vout['scriptPubKey']['type'])
+                addresses.extend(vout['scriptPubKey'].get('addresses', []))
+        self.assertEqual(types, {'pubkeyhash', 'pubkey', 'multisig'})
+        self.assertLess(len(set(addresses)), len(addresses))
+        self.assertGreater(max(len(tx['vin']) for tx in self.chain.txs.values()), 1)
+
+    def test_script_mix(self):
+        chain = SyntheticChain(blocks=10, script_mix={'pubkey': 1})
+        self.assertEqual({vout['scriptPubKey']['type'] for tx in chain.txs.values()
+                          for vout in tx['vout']}, {'pubkey'})
+
+    def test_blockchain(self):
+        blockchain = Blockchain(BitcoinProxyMock(chain=self.chain, verbosity=2))
+        blocks = list(blockchain.get_blocks_in_range(0, len(self.chain) - 1))
+        self.assertEqual(sum(len(block.transactions) for block in blocks),
+                         self.chain.transaction_count)
+        tx = blocks[-1].transactions[-1]
+        self.assertGreaterEqual(tx.input_sum(), tx.output_sum())
@@ -0,0 +1,42 @@
+import json
+import unittest
+from decimal import Decimal
+from pathlib import Path
+
+from bitcoingraph import codec
+
+TEST_DATA_PATH = Path(__file__).parent / 'data'
+
+
+class TestCodec(unittest.TestCase):
+
+    def test_fixtures(self):
+        for path in TEST_DATA_PATH.glob('*.json'):
+            data = path.read_bytes()
+            self.assertEqual(codec.loads(data), json.loads(data))
+
+    def test_satoshi_precision(self):
+        for path in TEST_DATA_PATH.glob('tx_*.json'):
+            data = path.read_bytes()
+            for output in codec.loads(data)['vout']:
+                satoshis = Decimal(str(output['value'])) * 100000000
+                self.assertEqual(round(output['value'] * 100000000), satoshis)
+        self.assertEqual(codec.loads(b'{"value": 20999999.97690000}')['value'] * 100000000,
+                         2099999997690000)
+
+    def test_str_input(self):
+        self.assertEqual(codec.loads('{"a": [1, 2.5, null]}'), {'a': [1, 2.5, None]})
+
+    def test_big_integers(self):
+        self.assertEqual(codec.loads(b'[18446744073709551616]'), [2 ** 64])
+        self.assertEqual(codec.loads(codec.dumps([2 ** 64])), [2 ** 64])
+
+    def test_dumps(self):
+        request = {'jsonrpc': '2.0', 'method': 'getblock', 'params': ['00ff', 2], 'id': 1}
+        data = codec.dumps(request)
+        self.assertIsInstance(data, bytes)
+        self.assertEqual(json.loads(data), request)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            codec.loads(b'{"a": ')
@@ -0,0 +1,114 @@
+import csv
+import os
+import tempfile
+import unittest
+
+from tests.bitcoind_server import BitcoindServer
+from tests.chain_generator import SyntheticChain
+from tests.rpc_mock import BitcoinProxyMock
+
+from bitcoingraph import columnar
+from bitcoingraph.batch import to_satoshis
+from bitcoingraph.bitcoingraph import BitcoinGraph
+from bitcoingraph.blockchain import Blockchain
+from bitcoingraph.columnar import ColumnarDumpWriter, ColumnarReader, to_hex
+from bitcoingraph.writer import CSVDumpWriter
+
+
+def output_reference(txid_n):
+    txid, n = txid_n.split('_')
+    return [txid, int(n)]
+
+
+# converts the fields of a CSV row to the values of a columnar row
+CSV_ROWS = {
+    'blocks': lambda row: [row[0], int(row[1]), int(row[2]), float(row[3])],
+    'transactions': lambda row: [row[0], row[1] == 'True'],
+    'outputs': lambda row: output_reference(row[0]) + [to_satoshis(float(row[2])), row[3]],
+    'addresses': lambda row: row,
+    'rel_block_tx': lambda row: row,
+    'rel_block_block': lambda row: row,
+    'rel_tx_output': lambda row: [row[0]] + output_reference(row[1])[1:],
+    'rel_input': lambda row: [row[0]] + output_reference(row[1]),
+    'rel_output_address': lambda row: output_reference(row[0]) + [row[1]],
+}
+
+
+@unittest.skipIf(columnar.np is None, 'numpy is not installed')
+class TestColumnar(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.chain = SyntheticChain(blocks=30, transactions_per_block=6, seed=11)
+        blockchain = Blockchain(BitcoinProxyMock(chain=cls.chain, verbosity=2))
+        cls.blocks = list(blockchain.get_blocks_in_range(0, len(cls.chain) - 1))
+
+    def write(self, writer):
+        with writer:
+            for block in self.blocks:
+                writer.write(block)
+
+    def read_rows(self, reader, table):
+        columns = []
+        for column, kind in columnar.SCHEMA[table]:
+            values = reader.column(table, column)
+            if kind == 'hash':
+                columns.append(to_hex(values))
+            elif kind == 'str':
+                columns.append([value.decode() for value in values.tolist()])
+            else:
+                columns.append(values.tolist())
+        return [list(row) for row in zip(*columns)]
+
+    def test_same_rows_as_csv(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, 'csv')
+            columnar_path = os.path.join(directory, 'columnar')
+            self.write(CSVDumpWriter(csv_path))
+            self.write(ColumnarDumpWriter(columnar_path, chunk_rows=50))
+            reader = ColumnarReader(columnar_path)
+            self.assertEqual(sorted(reader.tables), sorted(CSV_ROWS))
+            for table, convert in CSV_ROWS.items():
+                with open(os.path.join(csv_path, table + '.csv'), newline='') as f:
+                    expected = [convert(row) for row in csv.reader(f)]
+                self.assertEqual(self.read_rows(reader, table), expected, table)
+                self.assertEqual(reader.row_count(table), len(expected))
+
+    def test_chunks(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.write(ColumnarDumpWriter(directory, chunk_rows=50))
+            reader = ColumnarReader(directory)
+            chunks = list(reader.chunks('outputs', 'value'))
+            self.assertGreater(len(chunks), 1)
+            self.assertTrue(all(len(chunk) >= 50 for chunk in chunks[:-1]))
+            self.assertFalse(chunks[0].flags.writeable)
+            self.assertEqual(sum(int(chunk.sum()) for chunk in chunks),
+                             sum(to_satoshis(output.value) for block in self.blocks
+                                 for tx in block.transactions for output in tx.outputs))
+            self.assertEqual(reader.column('blocks', 'height').tolist(),
+                             list(range(len(self.chain))))
+            self.assertRaises(KeyError, lambda: list(reader.chunks('outputs', 'height')))
+
+    def test_append(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with ColumnarDumpWriter(directory) as writer:
+                for block in self.blocks[:10]:
+                    writer.write(block)
+            with ColumnarDumpWriter(directory) as writer:
+                for block in self.blocks[10:]:
+                    writer.write(block)
+            reader = ColumnarReader(directory)
+            self.assertEqual(reader.column('blocks', 'height').tolist(),
+                             list(range(len(self.chain))))
+            self.assertEqual(reader.row_count('rel_block_block'), len(self.chain) - 1)
+
+    def test_export(self):
+        with BitcoindServer(BitcoinProxyMock(chain=self.chain)) as server, \
+                tempfile.TemporaryDirectory() as directory:
+            bcgraph = BitcoinGraph(blockchain={'host': '127.0.0.1', 'port': server.port,
+                                               'method': 'REST'})
+            bcgraph.export_columnar(5, 20, directory)
+            reader = ColumnarReader(directory)
+            self.assertEqual(reader.column('blocks', 'height').tolist(), list(range(5, 21)))
+            self.assertEqual(to_hex(reader.column('blocks', 'hash')),
+                             [self.chain.heights[height] for height in range(5, 21)])
@@ -0,0 +1,49 @@
+import os
+import random
+import tempfile
+import unittest
+
+from bitcoingraph.dedup import BloomFilter, SeenSet, digest
+
+
+class TestSeenSet(unittest.TestCase):
+
+    def test_in_memory(self):
+        with SeenSet() as seen_set:
+            self.assertTrue(seen_set.add('a'))
+            self.assertTrue(seen_set.add('b'))
+            self.assertFalse(seen_set.add('a'))
+            self.assertIn('b', seen_set)
+            self.assertNotIn('c', seen_set)
+            self.assertEqual(len(seen_set), 2)
+            self.assertEqual(seen_set.spills, 0)
+
+    def test_spill(self):
+        rng = random.Random(1)
+        values = ['address{}'.format(rng.randrange(3000) if i % 2 else i) for i in range(5000)]
+        with tempfile.TemporaryDirectory() as directory:
+            seen_set = SeenSet(memory=4000, directory=directory)
+            expected = set()
+            for value in values:
+                self.assertEqual(seen_set.add(value), value not in expected, value)
+                expected.add(value)
+            self.assertGreater(seen_set.spills, 10)
+            self.assertEqual(len(seen_set), len(expected))
+            self.assertTrue(all(value in seen_set for value in expected))
+            self.assertNotIn('other', seen_set)
+            # runs of similar size are merged
+            self.assertLess(len(seen_set._runs), 10)
+            self.assertEqual(len(os.listdir(directory)), 1)
+            seen_set.close()
+            self.assertEqual(os.listdir(directory), [])
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_membership(self):
+        bloom = BloomFilter(1000)
+        digests = [digest(str(i)) for i in range(500)]
+        for value in digests[:250]:
+            bloom.add(value)
+        self.assertTrue(all(value in bloom for value in digests[:250]))
+        self.assertLess(sum(value in bloom for value in digests[250:]), 25)
@@ -0,0 +1,177 @@
+import gzip
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from tests.bitcoind_server import BitcoindServer
+from tests.chain_generator import SyntheticChain
+from tests.rpc_mock import BitcoinProxyMock
+
+from bitcoingraph import bitcoingraph, entities
+from bitcoingraph.bitcoingraph import BitcoinGraph, BitcoingraphException, compute_entities
+from bitcoingraph.stats import GLOBAL_STATS
+
+
+class ExportTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        chain = SyntheticChain(blocks=40, transactions_per_block=5, seed=3)
+        cls.server = BitcoindServer(BitcoinProxyMock(chain=chain)).start()
+        cls.bcgraph = BitcoinGraph(blockchain={'host': '127.0.0.1', 'port': cls.server.port,
+                                               'method': 'REST'})
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def assertSameFiles(self, path, other_path):
+        self.assertEqual(sorted(os.listdir(path)), sorted(os.listdir(other_path)))
+        for filename in os.listdir(path):
+            with open(os.path.join(path, filename), 'rb') as f, \
+                    open(os.path.join(other_path, filename), 'rb') as other_f:
+                self.assertEqual(f.read(), other_f.read(), filename)
+
+
+class TestParallelExport(ExportTestCase):
+
+    def test_same_as_single_process(self):
+        for options in [{}, {'separate_header': False, 'plain_header': True}]:
+            with tempfile.TemporaryDirectory() as directory:
+                single = os.path.join(directory, 'single')
+                parallel = os.path.join(directory, 'parallel')
+                self.bcgraph.export(1, 39, single, **options)
+                self.bcgraph.export(1, 39, parallel, workers=3, **options)
+                self.assertSameFiles(single, parallel)
+
+    def test_empty_range(self):
+        with tempfile.TemporaryDirectory() as directory:
+            single = os.path.join(directory, 'single')
+            parallel = os.path.join(directory, 'parallel')
+            self.bcgraph.export(5, 4, single)
+            self.bcgraph.export(5, 4, parallel, workers=2)
+            self.assertSameFiles(single, parallel)
+            with open(os.path.join(parallel, 'blocks.csv'), 'rb') as f:
+                self.assertEqual(f.read(), b'')
+
+    def test_blockchain_per_worker(self):
+        config = {'host': '127.0.0.1', 'port': self.server.port, 'method': 'REST'}
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(bitcoingraph, '_worker_blockchain'), \
+                mock.patch.object(bitcoingraph, 'BitcoinGraph', wraps=BitcoinGraph) as facade:
+            bitcoingraph._init_export_worker(config)
+            for start in [1, 11]:
+                bitcoingraph._export_shard(start, start + 9,
+                                           os.path.join(directory, str(start)),
+                                           ['addresses'], 4, 2, False)
+            self.assertEqual(facade.call_count, 1)
+            self.assertEqual(sorted(os.listdir(directory)), ['1', '11'])
+
+    def test_worker_stats(self):
+        GLOBAL_STATS.reset()
+        with tempfile.TemporaryDirectory() as directory:
+            self.bcgraph.export(1, 39, directory, workers=2)
+        self.assertGreaterEqual(GLOBAL_STATS.get('rest', 'block.json').calls, 39)
+        GLOBAL_STATS.reset()
+
+    def test_progress(self):
+        reports = []
+        with tempfile.TemporaryDirectory() as directory:
+            self.bcgraph.export(0, 9, directory, progress=reports.append, workers=2)
+            self.assertEqual(reports, sorted(reports))
+            self.assertEqual(reports[-1], 1)
+            self.assertNotIn('shard_0', os.listdir(directory))
+
+
+class TestCompressedExport(ExportTestCase):
+
+    def test_compressed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            plain = os.path.join(directory, 'plain')
+            self.bcgraph.export(1, 39, plain)
+            # entities are numbered by a counter shared by all computations
+            entities.Address.counter = 0
+            compute_entities(plain, sort_input=True)
+            for name, workers in [('single', 1), ('parallel', 3)]:
+                path = os.path.join(directory, name)
+                self.bcgraph.export(1, 39, path, workers=workers, compression_level=1)
+                self.assertIn('outputs.csv.gz', os.listdir(path))
+                self.assertIn('outputs_header.csv', os.listdir(path))
+                entities.Address.counter = 0
+                compute_entities(path, sort_input=True)
+                for filename in os.listdir(plain):
+                    with open(os.path.join(plain, filename), 'rb') as f:
+                        expected = f.read()
+                    if filename.endswith('_header.csv'):
+                        with open(os.path.join(path, filename), 'rb') as f:
+                            self.assertEqual(f.read(), expected, filename)
+                    else:
+                        with gzip.open(os.path.join(path, filename + '.gz'), 'rb') as f:
+                            self.assertEqual(f.read(), expected, filename)
+
+
+class TestSeenSetExport(ExportTestCase):
+
+    def test_seen_sets(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sorted_path = os.path.join(directory, 'sorted')
+            unsorted_path = os.path.join(directory, 'unsorted')
+            self.bcgraph.export(1, 39, sorted_path)
+            self.bcgraph.export(1, 39, unsorted_path, seen_set_memory=5000, sort_files=False)
+            for filename in os.listdir(sorted_path):
+                with open(os.path.join(sorted_path, filename), 'rb') as f, \
+                        open(os.path.join(unsorted_path, filename), 'rb') as unsorted_f:
+                    lines = unsorted_f.read().splitlines()
+                    self.assertEqual(len(lines), len(set(lines)), filename)
+                    self.assertEqual(sorted(lines), sorted(f.read().splitlines()), filename)
+            self.assertFalse([filename for filename in os.listdir(unsorted_path)
+                              if filename.startswith('.seen_')])
+            entities.Address.counter = 0
+            compute_entities(sorted_path)
+            entities.Address.counter = 0
+            compute_entities(unsorted_path, sort_input=True)
+            for filename in ['entities.csv', 'rel_address_entity.csv']:
+                with open(os.path.join(sorted_path, filename), 'rb') as f, \
+                        open(os.path.join(unsorted_path, filename), 'rb') as unsorted_f:
+                    self.assertEqual(unsorted_f.read(), f.read(), filename)
+
+    def test_unsorted_duplicates(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertRaises(BitcoingraphException, self.bcgraph.export, 1, 39, directory,
+                              sort_files=False)
+            sorted_path = os.path.join(directory, 'sorted')
+            duplicated_path = os.path.join(directory, 'duplicated')
+            self.bcgraph.export(1, 39, sorted_path)
+            self.bcgraph.export(1, 39, duplicated_path)
+            # addresses repeated as without deduplication
+            with open(os.path.join(duplicated_path, 'addresses.csv'), 'rb') as f:
+                addresses = f.read()
+            with open(os.path.join(duplicated_path, 'addresses.csv'), 'ab') as f:
+                f.write(addresses)
+            entities.Address.counter = 0
+            compute_entities(sorted_path)
+            entities.Address.counter = 0
+            compute_entities(duplicated_path, sort_input=True)
+            for filename in ['entities.csv', 'rel_address_entity.csv']:
+                with open(os.path.join(sorted_path, filename), 'rb') as f, \
+                        open(os.path.join(duplicated_path, filename), 'rb') as duplicated_f:
+                    self.assertEqual(duplicated_f.read(), f.read(), filename)
+
+
+class TestSortOptions(ExportTestCase):
+
+    def test_sort_options(self):
+        with tempfile.TemporaryDirectory() as directory:
+            default = os.path.join(directory, 'default')
+            small = os.path.join(directory, 'small')
+            temp_dir = os.path.join(directory, 'temp')
+            os.mkdir(temp_dir)
+            self.bcgraph.export(1, 39, default)
+            self.bcgraph.export(1, 39, small, workers=2, sort_memory=4000, sort_temp_dir=temp_dir)
+            for path, options in [(default, {}),
+                                  (small, {'sort_memory': 4000, 'sort_temp_dir': temp_dir})]:
+                entities.Address.counter = 0
+                compute_entities(path, sort_input=True, **options)
+            self.assertSameFiles(default, small)
+            self.assertEqual(os.listdir(temp_dir), [])
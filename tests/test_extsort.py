@@ -0,0 +1,128 @@
+import gzip
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from bitcoingraph import helper
+from bitcoingraph.extsort import merge_files, sort_file
+
+# GNU sort options of each case of sort_file
+OPTIONS = [({}, []),
+           ({'unique': True}, ['-u']),
+           ({'key': 2}, ['-k', '2', '-t', ',']),
+           ({'key': 2, 'unique': True}, ['-u', '-k', '2', '-t', ','])]
+
+
+def random_lines(seed, count):
+    rng = random.Random(seed)
+    # prefixes, separators, carriage returns, tabs and bytes beyond ASCII
+    alphabet = [b'a', b'b', b'A', b'0', b',', b'\r', b'\t', b' ', b'\xc3\xa4', b'\xff']
+    lines = [b''.join(rng.choice(alphabet) for _ in range(rng.randrange(6)))
+             for _ in range(count)]
+    return lines + lines[:count // 4]
+
+
+def write_lines(path, lines, newline_at_end=True):
+    data = b'\n'.join(lines) + (b'\n' if newline_at_end else b'')
+    with (gzip.open if path.endswith('.gz') else open)(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def read_file(path):
+    with (gzip.open if path.endswith('.gz') else open)(path, 'rb') as f:
+        return f.read()
+
+
+@unittest.skipIf(shutil.which('sort') is None, 'sort is not installed')
+class TestExternalSort(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, filename, lines, newline_at_end=True):
+        return write_lines(os.path.join(self.directory, filename), lines, newline_at_end)
+
+    def read(self, path):
+        return read_file(path)
+
+    def gnu_sort(self, arguments, paths):
+        return subprocess.run(['sort'] + arguments + paths, env=dict(os.environ, LC_ALL='C'),
+                              stdout=subprocess.PIPE, check=True).stdout
+
+    def test_in_memory(self):
+        path = self.write('lines', random_lines(1, 500), newline_at_end=False)
+        for options, arguments in OPTIONS:
+            output_path = os.path.join(self.directory, 'sorted')
+            sort_file(path, output_path, **options)
+            self.assertEqual(self.read(output_path), self.gnu_sort(arguments, [path]), arguments)
+
+    def test_runs(self):
+        # runs of about 100 bytes, merged in several passes
+        path = self.write('lines', random_lines(2, 3000))
+        for options, arguments in OPTIONS:
+            output_path = os.path.join(self.directory, 'sorted')
+            sort_file(path, output_path, memory=800, workers=2, temp_dir=self.directory,
+                      **options)
+            self.assertEqual(self.read(output_path), self.gnu_sort(arguments, [path]), arguments)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['lines', 'sorted'])
+
+    def test_compressed(self):
+        lines = random_lines(3, 300)
+        path = self.write('lines.gz', lines)
+        expected = self.gnu_sort(['-u'], [self.write('lines', lines)])
+        sort_file(path, unique=True)
+        self.assertEqual(self.read(path), expected)
+        path = self.write('large.gz', lines)
+        sort_file(path, unique=True, memory=2000, workers=2)
+        self.assertEqual(self.read(path), expected)
+        empty_path = self.write('empty.gz', [], newline_at_end=False)
+        sort_file(empty_path, unique=True)
+        self.assertEqual(self.read(empty_path), b'')
+
+    def test_merge(self):
+        paths = []
+        for index in range(3):
+            path = self.write('lines_{}'.format(index), random_lines(index, 200))
+            sort_file(path, key=2)
+            paths.append(path)
+        expected = self.gnu_sort(['-m', '-k', '2', '-t', ','], paths)
+        merge_files(paths, paths[0], key=2)
+        self.assertEqual(self.read(paths[0]), expected)
+
+
+@unittest.skipIf(helper.gnu_sort() is None, 'GNU sort is not installed')
+class TestHelperSort(unittest.TestCase):
+
+    def test_gnu_and_extsort(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for filename in ['lines', 'lines.gz']:
+                outputs = []
+                for gnu in [True, False]:
+                    path = os.path.join(directory, str(gnu))
+                    os.makedirs(path, exist_ok=True)
+                    shards = []
+                    for index in range(3):
+                        shard = os.path.join(path, '{}_{}'.format(index, filename))
+                        write_lines(shard, random_lines(index, 200))
+                        helper.sort(path, os.path.basename(shard), key=2, unique=True,
+                                    compresslevel=1, gnu=gnu)
+                        shards.append(shard)
+                    write_lines(os.path.join(path, filename), random_lines(5, 100))
+                    helper.sort(path, filename, key=2, unique=True, gnu=gnu)
+                    helper.merge(path, filename, shards, key=2, unique=True, gnu=gnu)
+                    outputs.append(read_file(os.path.join(path, filename)))
+                self.assertEqual(outputs[0], outputs[1], filename)
+                self.assertNotIn('lines.gz.tmp', os.listdir(path))
+
+    def test_failure(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for filename in ['missing', 'missing.gz']:
+                self.assertRaises(Exception, helper.sort, directory, filename)
+            self.assertEqual(os.listdir(directory), [])
@@ -0,0 +1,213 @@
+import hashlib
+import os
+import tempfile
+import unittest
+from collections import Counter
+
+from bitcoingraph.bitcoind import BitcoindException
+from bitcoingraph.blockchain import Blockchain
+from bitcoingraph.headers import RECORD_SIZE, HeaderStore, HeaderStoreException
+from bitcoingraph.model import Block
+
+GENESIS_TIME = 1231006505
+
+
+class HeaderChainStub:
+    """Node serving a chain of empty blocks with out-of-order timestamps."""
+
+    def __init__(self, count):
+        self.calls = Counter()
+        self.headers = []
+        self.extend(count)
+
+    def extend(self, count, branch=''):
+        for height in range(len(self.headers), len(self.headers) + count):
+            header = {'hash': hashlib.sha256('{}{}'.format(branch, height).encode()).hexdigest(),
+                      'height': height, 'difficulty': 1.0 + height,
+                      # every seventh block is older than its predecessor
+                      'time': GENESIS_TIME + 600 * height - (900 if height % 7 == 3 else 0)}
+            if height > 0:
+                header['previousblockhash'] = self.headers[-1]['hash']
+            self.headers.append(header)
+
+    def reorg(self, height, count):
+        del self.headers[height:]
+        self.extend(count, 'fork')
+
+    def getblockcount(self):
+        self.calls['getblockcount'] += 1
+        return len(self.headers) - 1
+
+    def getblockhash(self, height):
+        self.calls['getblockhash'] += 1
+        if not 0 <= height < len(self.headers):
+            raise BitcoindException('Block height out of range')
+        return self.headers[height]['hash']
+
+    def getblockhashes(self, start_height, end_height):
+        self.calls['getblockhashes'] += 1
+        return [header['hash'] for header in self.headers[start_height:end_height + 1]]
+
+    def getblockheaders(self, start_height, end_height):
+        self.calls['getblockheaders'] += 1
+        return [self.header(height) for height in range(start_height, end_height + 1)]
+
+    def header(self, height):
+        header = dict(self.headers[height])
+        if height + 1 < len(self.headers):
+            header['nextblockhash'] = self.headers[height + 1]['hash']
+        return header
+
+    def getblockheader(self, block_hash):
+        self.calls['getblockheader'] += 1
+        for height, header in enumerate(self.headers):
+            if header['hash'] == block_hash:
+                return self.header(height)
+        raise BitcoindException('Unknown block')
+
+    def getblock(self, block_hash):
+        self.calls['getblock'] += 1
+        for height, header in enumerate(self.headers):
+            if header['hash'] == block_hash:
+                return dict(self.header(height), tx=[])
+        raise BitcoindException('Unknown block')
+
+
+class HeaderStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'headers.dat')
+        self.proxy = HeaderChainStub(500)
+        self.store = HeaderStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+
+class TestHeaderStore(HeaderStoreTestCase):
+
+    def test_sync(self):
+        self.assertEqual(self.store.sync(self.proxy, batch_size=200), 500)
+        self.assertEqual(self.proxy.calls['getblockheaders'], 3)
+        self.assertEqual(len(self.store), 500)
+        self.assertEqual(os.path.getsize(self.path), 500 * RECORD_SIZE)
+        self.assertEqual(self.store.get(10), self.proxy.header(10))
+        self.assertNotIn('nextblockhash', self.store.get(499))
+        self.assertIsNone(self.store.get(500))
+
+    def test_incremental_sync(self):
+        self.store.sync(self.proxy)
+        self.proxy.extend(20)
+        self.assertEqual(self.store.sync(self.proxy), 20)
+        self.assertEqual(self.store.get_hash(519), self.proxy.headers[519]['hash'])
+        self.assertEqual(self.store.sync(self.proxy), 0)
+
+    def test_reorg(self):
+        self.store.sync(self.proxy)
+        self.proxy.reorg(495, 10)
+        self.assertEqual(self.store.sync(self.proxy), 10)
+        self.assertEqual(self.store.tip_height, 504)
+        self.assertEqual(self.store.get_hashes(490, 504),
+                         [header['hash'] for header in self.proxy.headers[490:505]])
+        self.assertIsNone(self.store.get_height(
+            hashlib.sha256('{}'.format(497).encode()).hexdigest()))
+        self.assertEqual(self.store.get_height(self.proxy.headers[497]['hash']), 497)
+
+    def test_append_checks_links(self):
+        with self.assertRaises(HeaderStoreException):
+            self.store.append(self.proxy.headers[1:3])
+        self.store.append(self.proxy.headers[:3])
+        with self.assertRaises(HeaderStoreException):
+            self.store.append(self.proxy.headers[4:5])
+
+    def test_get_height(self):
+        self.store.sync(self.proxy)
+        for height in [0, 1, 250, 499]:
+            self.assertEqual(self.store.get_height(self.proxy.headers[height]['hash']), height)
+        self.assertIsNone(self.store.get_height('00' * 32))
+
+    def test_height_at_time(self):
+        self.store.sync(self.proxy)
+        for timestamp in [0, GENESIS_TIME, GENESIS_TIME + 1, GENESIS_TIME + 600 * 10 - 899,
+                          GENESIS_TIME + 600 * 250, GENESIS_TIME + 600 * 1000]:
+            expected = next((height for height, header in enumerate(self.proxy.headers)
+                             if header['time'] >= timestamp), 500)
+            self.assertEqual(self.store.get_height_at_time(timestamp), expected)
+
+    def test_persistence(self):
+        self.store.sync(self.proxy)
+        self.store.close()
+        # an interrupted write leaves a partial record behind
+        with open(self.path, 'ab') as f:
+            f.write(b'\x00' * 10)
+        self.store = HeaderStore(self.path)
+        self.assertEqual(len(self.store), 500)
+        self.assertEqual(self.store.get(499), self.proxy.header(499))
+
+
+class TestBlockchainHeaders(HeaderStoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.blockchain = Blockchain(self.proxy, header_store=self.store)
+        self.blockchain.sync_headers()
+        self.proxy.calls.clear()
+
+    def test_block_stub(self):
+        block = Block(self.blockchain, self.proxy.headers[100]['hash'])
+        self.assertEqual(block.height, 100)
+        self.assertEqual(block.timestamp, self.proxy.headers[100]['time'])
+        self.assertEqual(block.previous_block.timestamp, self.proxy.headers[99]['time'])
+        self.assertEqual(block.next_block.next_block.height, 102)
+        self.assertEqual(sum(self.proxy.calls.values()), 0)
+
+    def test_walk(self):
+        block = Block(self.blockchain, height=0)
+        timestamps = [block.timestamp]
+        while block.has_next_block():
+            block = block.next_block
+            timestamps.append(block.timestamp)
+        self.assertEqual(timestamps, [header['time'] for header in self.proxy.headers])
+        # only the end of the stored chain is checked with the node
+        self.assertEqual(self.proxy.calls['getblockheader'], 1)
+        self.assertEqual(self.proxy.calls['getblock'], 0)
+
+    def test_next_block_of_stored_tip(self):
+        self.proxy.extend(1)
+        block = Block(self.blockchain, self.proxy.headers[499]['hash'])
+        self.assertTrue(block.has_next_block())
+        self.assertEqual(block.next_block.hash, self.proxy.headers[500]['hash'])
+        self.assertEqual(self.proxy.calls['getblockheader'], 1)
+        self.assertEqual(self.proxy.calls['getblock'], 0)
+
+    def test_get_block_by_height(self):
+        self.assertEqual(self.blockchain.get_block_by_height(42).hash,
+                         self.proxy.headers[42]['hash'])
+        self.assertEqual(self.proxy.calls['getblockhash'], 0)
+
+    def test_get_block_header(self):
+        self.assertEqual(self.blockchain.get_block_header(42).timestamp,
+                         self.proxy.headers[42]['time'])
+        self.assertEqual(sum(self.proxy.calls.values()), 0)
+        self.proxy.extend(1)
+        self.assertTrue(self.blockchain.get_block_header(499).has_next_block())
+        self.assertEqual(self.proxy.calls['getblockheader'], 1)
+
+    def test_get_block_headers_in_range(self):
+        self.proxy.extend(5)
+        blocks = list(self.blockchain.get_block_headers_in_range(0, 1000))
+        self.assertEqual([block.timestamp for block in blocks],
+                         [header['time'] for header in self.proxy.headers])
+        self.assertTrue(blocks[498].has_next_block())
+        self.assertTrue(blocks[499].has_next_block())
+        self.assertFalse(blocks[504].has_next_block())
+        self.assertEqual(self.proxy.calls['getblockheaders'], 1)
+        self.assertEqual(self.proxy.calls['getblock'], 0)
+
+    def test_get_block_hashes(self):
+        self.assertEqual(self.blockchain.get_block_hashes(10, 20),
+                         [header['hash'] for header in self.proxy.headers[10:21]])
+        self.assertEqual(sum(self.proxy.calls.values()), 0)
+        self.assertEqual(len(self.blockchain.get_block_hashes(490, 520)), 10)
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from tests.rpc_mock import BitcoinProxyMock
+
+from bitcoingraph.blockchain import Blockchain
+from bitcoingraph.model import Input, Transaction
+from bitcoingraph.outpoints import OutpointIndex
+
+BH2 = "000000000003ba27aa200b1cecaad478d2b00432346c3f1f3986da1afd33e506"
+BH3 = "00000000000080b66c911bd5ba14a74260057311eaeb1982802f7010f1a9f090"
+TX1 = "8c14f0db3df150123e6f3dbbf30f8b955a8249b62ac1d1ff16284aefa3d06d87"
+TX2 = "fff2525b8931402dd09222c50775608f75787bd2b87e56995a7bdd30f79702c4"
+
+
+class TestOutpointIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'outpoints.db')
+        self.index = OutpointIndex(self.path)
+        self.proxy = BitcoinProxyMock(verbosity=2)
+        self.blockchain = Blockchain(self.proxy, outpoint_index=self.index)
+        self.index.add_block(self.blockchain.get_block_by_hash(BH2))
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp_dir.cleanup()
+
+    def spending_block(self, *outpoints):
+        tx = Transaction(self.blockchain, json_data={
+            'txid': 'ab' * 32, 'blockhash': BH3,
+            'vin': [{'txid': txid, 'vout': n} for txid, n in outpoints],
+            'vout': [{'value': 1.0, 'scriptPubKey': {'type': 'nonstandard'}}]})
+        return SimpleNamespace(height=100001, transactions=[tx])
+
+    def test_add_block(self):
+        self.assertEqual(self.index.height, 100000)
+        self.assertEqual(len(self.index), 6)
+        self.assertEqual(self.index.get(TX2, 1),
+                         (44.44, 'pubkeyhash', ['1EYTGtG4LnFfiMvjJdsU7GMGCQvsRSjYhx']))
+        self.assertIsNone(self.index.get(TX2, 2))
+
+    def test_input_output(self):
+        output = Input(self.blockchain, {'txid': TX2, 'vout': 1}).output
+        self.assertEqual(output.value, 44.44)
+        self.assertEqual(output.addresses, ['1EYTGtG4LnFfiMvjJdsU7GMGCQvsRSjYhx'])
+        self.assertEqual(output.transaction.txid, TX2)
+        self.assertEqual(self.proxy.calls['getrawtransaction'], 0)
+
+    def test_fallback(self):
+        self.index.add_block(self.spending_block((TX2, 1)))
+        output = Input(self.blockchain, {'txid': TX2, 'vout': 1}).output
+        self.assertEqual(output.value, 44.44)
+        self.assertEqual(self.proxy.calls['getrawtransaction'], 1)
+
+    def test_prune(self):
+        self.index.add_block(self.spending_block((TX2, 0), (TX1, 0)))
+        self.assertIsNone(self.index.get(TX2, 0))
+        self.assertIsNone(self.index.get(TX1, 0))
+        self.assertIsNotNone(self.index.get(TX2, 1))
+        self.assertEqual(self.index.get('ab' * 32, 0), (1.0, 'nonstandard', []))
+
+    def test_no_prune(self):
+        index = OutpointIndex(os.path.join(self.tmp_dir.name, 'full.db'), prune=False)
+        index.add_block(self.blockchain.get_block_by_hash(BH2))
+        index.add_block(self.spending_block((TX2, 0)))
+        self.assertIsNotNone(index.get(TX2, 0))
+        index.close()
+
+    def test_persistence(self):
+        self.index.close()
+        self.index = OutpointIndex(self.path)
+        self.assertEqual(self.index.height, 100000)
+        self.assertEqual(self.index.get(TX2, 0)[0], 5.56)
@@ -0,0 +1,147 @@
+import json
+import unittest
+from pathlib import Path
+
+from tests.block_builder import build_block, serialize_block, varint
+
+from bitcoingraph.model import Output
+from bitcoingraph.serialization import (
+    DeserializationException, bits_to_difficulty, decode_script_pubkey, parse_block,
+    parse_block_header, parse_transaction, segwit_address)
+
+TEST_DATA_PATH = Path(__file__).parent / 'data'
+
+BH2 = "000000000003ba27aa200b1cecaad478d2b00432346c3f1f3986da1afd33e506"
+
+GENESIS_PUBKEY = ('04678afdb0fe5548271967f1a67130b7105cd6a828e03909a67962e0ea1f61deb649f6bc3f'
+                  '4cef38c4f35504e51ec112de5c384df7ba0b8d578a4c702b6bf11d5f')
+
+
+def load(name):
+    with (TEST_DATA_PATH / name).open() as f:
+        return json.load(f)
+
+
+def load_txs():
+    return {f.name[3:-5]: load(f.name) for f in TEST_DATA_PATH.glob('tx_*.json')}
+
+
+class TestTransaction(unittest.TestCase):
+
+    def setUp(self):
+        self.txs = load_txs()
+
+    def assertOutputsEqual(self, parsed_vout, json_vout):
+        self.assertEqual(len(parsed_vout), len(json_vout))
+        for parsed, expected in zip(parsed_vout, json_vout):
+            parsed_output = Output(None, parsed['n'], parsed)
+            expected_output = Output(None, expected['n'], expected)
+            self.assertEqual(parsed_output.value, expected_output.value)
+            self.assertEqual(parsed_output.type, expected_output.type)
+            self.assertEqual(parsed_output.addresses, expected_output.addresses)
+
+    def test_fixtures(self):
+        for raw_tx in self.txs.values():
+            data = bytes.fromhex(raw_tx['hex'])
+            tx, offset = parse_transaction(data)
+            self.assertEqual(offset, len(data))
+            self.assertEqual(tx['txid'], raw_tx['txid'])
+            self.assertEqual(tx['locktime'], raw_tx['locktime'])
+            for parsed, expected in zip(tx['vin'], raw_tx['vin']):
+                if 'coinbase' in expected:
+                    self.assertEqual(parsed['coinbase'], expected['coinbase'])
+                else:
+                    self.assertEqual(parsed['txid'], expected['txid'])
+                    self.assertEqual(parsed['vout'], expected['vout'])
+            self.assertOutputsEqual(tx['vout'], raw_tx['vout'])
+
+    def test_segwit(self):
+        raw_tx = self.txs['fff2525b8931402dd09222c50775608f75787bd2b87e56995a7bdd30f79702c4']
+        data = bytes.fromhex(raw_tx['hex'])
+        witness = varint(2) + varint(3) + b'abc' + varint(0)
+        segwit_data = data[:4] + b'\x00\x01' + data[4:-4] + witness + data[-4:]
+        tx, offset = parse_transaction(segwit_data)
+        self.assertEqual(offset, len(segwit_data))
+        self.assertEqual(tx['txid'], raw_tx['txid'])
+        self.assertNotEqual(tx['hash'], raw_tx['txid'])
+        self.assertOutputsEqual(tx['vout'], raw_tx['vout'])
+
+    def test_truncated(self):
+        raw_tx = self.txs['fff2525b8931402dd09222c50775608f75787bd2b87e56995a7bdd30f79702c4']
+        with self.assertRaises(DeserializationException):
+            parse_transaction(bytes.fromhex(raw_tx['hex'])[:-10])
+
+
+class TestScript(unittest.TestCase):
+
+    def test_p2wpkh(self):
+        script = bytes.fromhex('0014751e76e8199196d454941c45d1b3a323f1433bd6')
+        self.assertEqual(decode_script_pubkey(script),
+                         {'type': 'witness_v0_keyhash',
+                          'addresses': ['bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4']})
+
+    def test_p2tr(self):
+        program = bytes.fromhex('79be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798')
+        self.assertEqual(
+            segwit_address('bc', 1, program),
+            'bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqzk5jj0')
+        self.assertEqual(decode_script_pubkey(b'\x51\x20' + program)['type'],
+                         'witness_v1_taproot')
+
+    def test_p2sh(self):
+        script = bytes.fromhex('a914' + '00' * 20 + '87')
+        script_pubkey = decode_script_pubkey(script)
+        self.assertEqual(script_pubkey['type'], 'scripthash')
+        self.assertTrue(script_pubkey['addresses'][0].startswith('3'))
+
+    def test_pubkey(self):
+        script = bytes.fromhex('41' + GENESIS_PUBKEY + 'ac')
+        output = Output(None, 0, {'value': 50.0, 'scriptPubKey': decode_script_pubkey(script)})
+        self.assertEqual(output.type, 'pubkey')
+        self.assertEqual(output.addresses, ['pk_' + GENESIS_PUBKEY])
+
+    def test_multisig(self):
+        script = bytes.fromhex('51' + '41' + GENESIS_PUBKEY + '51ae')
+        self.assertEqual(decode_script_pubkey(script),
+                         {'type': 'multisig', 'addresses': ['1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa']})
+
+    def test_nulldata(self):
+        self.assertEqual(decode_script_pubkey(bytes.fromhex('6a0401020304')),
+                         {'type': 'nulldata'})
+
+    def test_nonstandard(self):
+        self.assertEqual(decode_script_pubkey(b''), {'type': 'nonstandard'})
+        self.assertEqual(decode_script_pubkey(bytes.fromhex('ac')), {'type': 'nonstandard'})
+
+
+class TestBlock(unittest.TestCase):
+
+    def setUp(self):
+        self.txs = load_txs()
+        self.raw_block = load('block_100000.json')
+
+    def test_block(self):
+        block = parse_block(serialize_block(self.raw_block, self.txs))
+        self.assertEqual(block['hash'], BH2)
+        self.assertEqual(block['previousblockhash'], self.raw_block['previousblockhash'])
+        self.assertEqual(block['merkleroot'], self.raw_block['merkleroot'])
+        self.assertEqual(block['time'], self.raw_block['time'])
+        self.assertEqual(block['bits'], self.raw_block['bits'])
+        self.assertAlmostEqual(block['difficulty'], self.raw_block['difficulty'])
+        self.assertEqual(block['size'], self.raw_block['size'])
+        self.assertEqual([tx['txid'] for tx in block['tx']], self.raw_block['tx'])
+
+    def test_genesis_header(self):
+        tx = self.txs['110ed92f558a1e3a94976ddea5c32f030670b5c58c3cc4d857ac14d7a1547a90']
+        header = parse_block_header(build_block(None, [tx], 1231006505))
+        self.assertNotIn('previousblockhash', header)
+
+    def test_difficulty(self):
+        self.assertAlmostEqual(bits_to_difficulty(0x1b04864c), 14484.1623612254)
+        self.assertEqual(bits_to_difficulty(0x1d00ffff), 1.0)
+
+    def test_truncated(self):
+        with self.assertRaises(DeserializationException):
+            parse_block(serialize_block(self.raw_block, self.txs)[:79])
+        with self.assertRaises(DeserializationException):
+            parse_block(serialize_block(self.raw_block, self.txs)[:-1])
@@ -0,0 +1,111 @@
+import json
+import os
+import tempfile
+import unittest
+
+from tests.bitcoind_server import BitcoindServer
+from tests.rpc_mock import BitcoinProxyMock
+
+from bitcoingraph.bitcoind import BitcoinProxy, BitcoindException
+from bitcoingraph.stats import LATENCY_BUCKETS, Stats, StatsWriter
+
+
+BH1 = "000000000002d01c1fccc21636b607dfd930d31d01c3a62104612a1719011250"
+
+
+class TestStats(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = Stats()
+        self.stats.record('rpc', 'getblock', 0.002, 100, 2000)
+        self.stats.record('rpc', 'getblock', 20.0, 100, 0, error=True)
+        self.stats.record_retry('rpc', 'getblock')
+
+    def test_record(self):
+        method_stats = self.stats.get('rpc', 'getblock')
+        self.assertEqual(method_stats.calls, 2)
+        self.assertEqual(method_stats.errors, 1)
+        self.assertEqual(method_stats.retries, 1)
+        self.assertEqual(method_stats.request_bytes, 200)
+        self.assertEqual(method_stats.response_bytes, 2000)
+        self.assertAlmostEqual(method_stats.latency_sum, 20.002)
+        self.assertEqual(method_stats.latency_counts[LATENCY_BUCKETS.index(0.0025)], 1)
+        self.assertEqual(method_stats.latency_counts[-1], 1)
+        self.assertEqual(self.stats.get('rest', 'block.json').calls, 0)
+
+    def test_reset(self):
+        self.stats.reset()
+        self.assertEqual(self.stats.snapshot(), {})
+
+    def test_drain_and_merge(self):
+        other = Stats()
+        other.record('rpc', 'getblock', 0.002, 10, 20)
+        other.record('rest', 'block.json', 0.5)
+        self.stats.merge(other.drain())
+        self.assertEqual(other.snapshot(), {})
+        method_stats = self.stats.get('rpc', 'getblock')
+        self.assertEqual(method_stats.calls, 3)
+        self.assertEqual(method_stats.retries, 1)
+        self.assertEqual(method_stats.request_bytes, 210)
+        self.assertEqual(method_stats.latency_counts[LATENCY_BUCKETS.index(0.0025)], 2)
+        self.assertEqual(self.stats.get('rest', 'block.json').calls, 1)
+
+    def test_json(self):
+        result = json.loads(self.stats.to_json())
+        self.assertEqual(result['rpc']['getblock']['calls'], 2)
+        self.assertEqual(result['rpc']['getblock']['latency_buckets']['+Inf'], 1)
+
+    def test_prometheus(self):
+        lines = self.stats.to_prometheus().splitlines()
+        labels = 'interface="rpc",method="getblock"'
+        self.assertIn('bitcoingraph_requests_total{' + labels + '} 2', lines)
+        self.assertIn('bitcoingraph_request_errors_total{' + labels + '} 1', lines)
+        self.assertIn('bitcoingraph_request_retries_total{' + labels + '} 1', lines)
+        self.assertIn('bitcoingraph_response_bytes_total{' + labels + '} 2000', lines)
+        self.assertIn('bitcoingraph_request_duration_seconds_bucket{' + labels +
+                      ',le="0.0025"} 1', lines)
+        self.assertIn('bitcoingraph_request_duration_seconds_bucket{' + labels +
+                      ',le="10.0"} 1', lines)
+        self.assertIn('bitcoingraph_request_duration_seconds_bucket{' + labels +
+                      ',le="+Inf"} 2', lines)
+        self.assertIn('bitcoingraph_request_duration_seconds_count{' + labels + '} 2', lines)
+
+    def test_writer(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'stats.json')
+            with StatsWriter(path, interval=60, format='json', stats=self.stats):
+                pass
+            with open(path) as f:
+                self.assertEqual(json.load(f)['rpc']['getblock']['errors'], 1)
+            self.assertEqual(os.listdir(directory), ['stats.json'])
+
+
+class TestRequestStats(unittest.TestCase):
+
+    def test_rpc(self):
+        stats = Stats()
+        with BitcoindServer(BitcoinProxyMock()) as server:
+            proxy = BitcoinProxy('127.0.0.1', server.port, stats=stats)
+            proxy.getblock(BH1)
+            proxy.getblockhashes(99999, 100001)
+            with self.assertRaises(BitcoindException):
+                proxy.getblock('00' * 32)
+        getblock = stats.get('rpc', 'getblock')
+        self.assertEqual(getblock.calls, 2)
+        self.assertEqual(getblock.errors, 1)
+        self.assertGreater(getblock.request_bytes, 0)
+        self.assertGreater(getblock.response_bytes, 0)
+        self.assertEqual(stats.get('rpc', 'batch:getblockhash').calls, 1)
+        self.assertEqual(stats.get('rpc', 'getnetworkinfo').calls, 1)
+
+    def test_rest(self):
+        stats = Stats()
+        with BitcoindServer(BitcoinProxyMock()) as server:
+            proxy = BitcoinProxy('127.0.0.1', server.port, method='REST', binary=True,
+                                 stats=stats)
+            proxy.getblock(BH1)
+        self.assertEqual(stats.get('rest', 'headers.json').calls, 1)
+        block = stats.get('rest', 'block.bin')
+        self.assertEqual(block.calls, 1)
+        self.assertEqual(block.errors, 0)
+        self.assertGreater(block.response_bytes, 80)
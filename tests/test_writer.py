@@ -0,0 +1,98 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from tests.chain_generator import SyntheticChain
+from tests.rpc_mock import BitcoinProxyMock
+
+from bitcoingraph.blockchain import Blockchain
+from bitcoingraph.dedup import SeenSet
+from bitcoingraph.writer import BufferedCSVDumpWriter, CSVDumpWriter
+
+
+class TestBufferedCSVDumpWriter(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        chain = SyntheticChain(blocks=30, transactions_per_block=6, seed=5)
+        # values csv.writer has to quote
+        script_pub_key = chain.txs[chain.blocks[chain.heights[3]]['tx'][0]]['vout'][0][
+            'scriptPubKey']
+        script_pub_key['type'] = 'odd, "type"'
+        script_pub_key['addresses'] = ['odd,address', 'line\nbreak', '']
+        blockchain = Blockchain(BitcoinProxyMock(chain=chain, verbosity=2))
+        cls.blocks = list(blockchain.get_blocks_in_range(0, len(chain) - 1))
+
+    def export(self, writer):
+        with writer:
+            for block in self.blocks:
+                writer.write(block)
+        return writer
+
+    def read_files(self, path):
+        files = {}
+        for filename in os.listdir(path):
+            if filename.endswith('.gz'):
+                with gzip.open(os.path.join(path, filename), 'rb') as f:
+                    files[filename[:-3]] = f.read()
+            else:
+                with open(os.path.join(path, filename), 'rb') as f:
+                    files[filename] = f.read()
+        return files
+
+    def test_same_output(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.export(CSVDumpWriter(os.path.join(directory, 'plain')))
+            expected = self.read_files(os.path.join(directory, 'plain'))
+            self.assertIn(b'\r\n', expected['outputs.csv'])
+            for name, options in [('chunked', {'buffer_rows': 10}),
+                                  ('background', {'buffer_rows': 10, 'background': True}),
+                                  ('single', {})]:
+                path = os.path.join(directory, name)
+                self.export(BufferedCSVDumpWriter(path, **options))
+                self.assertEqual(self.read_files(path), expected, name)
+
+    def test_compressed(self):
+        for separate_header in [True, False]:
+            with tempfile.TemporaryDirectory() as directory:
+                self.export(CSVDumpWriter(os.path.join(directory, 'plain'),
+                                          separate_header=separate_header))
+                expected = self.read_files(os.path.join(directory, 'plain'))
+                path = os.path.join(directory, 'compressed')
+                self.export(BufferedCSVDumpWriter(path, separate_header=separate_header,
+                                                  buffer_rows=10, compression_level=1))
+                self.assertEqual(self.read_files(path), expected)
+                for filename in os.listdir(path):
+                    self.assertEqual(filename.endswith('_header.csv'), separate_header and
+                                     not filename.endswith('.gz'), filename)
+
+    def test_seen_sets(self):
+        with tempfile.TemporaryDirectory() as directory:
+            plain = os.path.join(directory, 'plain')
+            # the blocks twice, so that every transaction is repeated
+            self.export(CSVDumpWriter(plain))
+            self.export(CSVDumpWriter(plain))
+            expected = self.read_files(plain)
+            path = os.path.join(directory, 'deduplicated')
+            with SeenSet(memory=3000, directory=directory) as seen_addresses, \
+                    SeenSet(memory=3000, directory=directory) as seen_transactions:
+                for _ in range(2):
+                    self.export(BufferedCSVDumpWriter(path, buffer_rows=10,
+                                                      seen_addresses=seen_addresses,
+                                                      seen_transactions=seen_transactions))
+                self.assertGreater(seen_addresses.spills, 0)
+            files = self.read_files(path)
+            for filename, data in expected.items():
+                lines = data.splitlines()
+                if filename in ['addresses.csv', 'transactions.csv', 'outputs.csv',
+                                'rel_tx_output.csv', 'rel_output_address.csv']:
+                    lines = list(dict.fromkeys(lines))
+                self.assertEqual(files[filename].splitlines(), lines, filename)
+
+    def test_files_closed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            writer = self.export(CSVDumpWriter(directory))
+            self.assertTrue(writer._rel_block_block_file.closed)
+            writer = self.export(BufferedCSVDumpWriter(directory, background=True))
+            self.assertTrue(all(f.closed for f in writer._files))